@@ -0,0 +1,166 @@
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit, urlencode
+import numpy as np
+import logic_core as logic
+from benchmark import generate_sheets, generate_students
+
+# =============================================================================
+# KIỂM TRA TẢI DỊCH VỤ HTTP (api_server.py)
+# =============================================================================
+#
+# Mỗi kết nối ảo giữ một kết nối keep-alive và gửi liên tục GET /v1/recommendations với bộ điểm
+# ngẫu nhiên trong `duration` giây; in số yêu cầu/giây, độ trễ p50/p90/p99 và số yêu cầu của từng kết nối.
+# Độ trễ chỉ tính các yêu cầu đã xong nên một kết nối bị bỏ đói chỉ góp một mẫu: kết nối nào hoàn thành
+# ít hơn STARVED_FRACTION lần trung vị số yêu cầu mỗi kết nối bị coi là bị bỏ đói và kiểm tra thất bại.
+# Không có --url thì tự sinh dữ liệu giả lập và chạy api_server.py ở tiến trình con.
+# Chạy: python api_loadtest.py [--url http://127.0.0.1:8080] [--concurrency 16] [--duration 10] [--revalidate]
+
+STARVED_FRACTION = 0.1
+
+def student_query(student):
+    params = {k: v for k, v in student.items() if v is not None}
+    if not params.get('mon_chuyen'):
+        params.pop('mon_chuyen', None)
+        params.pop('diem_mon_chuyen', None)
+    return '/v1/recommendations?' + urlencode(params)
+
+def run_client(host, port, paths, deadline, revalidate, latencies, statuses, seed):
+    """Một kết nối ảo: gửi yêu cầu liên tục đến `deadline`, ghi độ trễ (giây) và mã trả về."""
+    rng = np.random.default_rng(seed)
+    etags = {}
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    while time.perf_counter() < deadline:
+        path = paths[rng.integers(len(paths))]
+        headers = {'If-None-Match': etags[path]} if revalidate and path in etags else {}
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            statuses['error'] = statuses.get('error', 0) + 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - start)
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+        if response.getheader('ETag'):
+            etags[path] = response.getheader('ETag')
+    conn.close()
+
+def run_load_test(host, port, paths, concurrency=16, duration=10.0, revalidate=False):
+    per_client = [([], {}) for _ in range(concurrency)]
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=run_client, args=(host, port, paths, deadline, revalidate, lat, st, i))
+               for i, (lat, st) in enumerate(per_client)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([x for lat, _ in per_client for x in lat])
+    statuses = {}
+    for _, st in per_client:
+        for code, count in st.items():
+            statuses[str(code)] = statuses.get(str(code), 0) + count
+    per_connection = [len(lat) for lat, _ in per_client]
+    report = {'requests': int(len(latencies)), 'seconds': elapsed, 'concurrency': concurrency,
+              'requests_per_second': len(latencies) / elapsed, 'statuses': statuses,
+              'per_connection': per_connection,
+              'starved_connections': sum(n < STARVED_FRACTION * np.median(per_connection) for n in per_connection)}
+    if len(latencies):
+        for q in (50, 90, 99):
+            report[f'p{q}_ms'] = float(np.percentile(latencies, q) * 1000)
+        report['max_ms'] = float(latencies.max() * 1000)
+    return report
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def _wait_for_server(host, port, proc, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("api_server.py đã dừng khi khởi động.")
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("Hết thời gian chờ api_server.py khởi động.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kiểm tra tải dịch vụ HTTP tư vấn tuyển sinh.")
+    parser.add_argument('--url', help="Địa chỉ dịch vụ đang chạy; bỏ trống để tự chạy api_server.py với dữ liệu giả lập.")
+    parser.add_argument('--size', default='200x8x8', help="Kích thước dữ liệu giả lập (trường x năm x môn chuyên).")
+    parser.add_argument('--workers', type=int, default=8, help="Số worker của api_server.py tự chạy.")
+    parser.add_argument('--concurrency', type=int, default=16, help="Số kết nối keep-alive đồng thời.")
+    parser.add_argument('--duration', type=float, default=10.0, help="Thời gian chạy (giây).")
+    parser.add_argument('--students', type=int, default=2000, help="Số bộ điểm khác nhau được gửi.")
+    parser.add_argument('--revalidate', action='store_true',
+                        help="Gửi lại If-None-Match với ETag đã nhận (đo đường trả về 304).")
+    parser.add_argument('--json', dest='json_path', help="Ghi kết quả ra file JSON.")
+    args = parser.parse_args(argv)
+
+    subjects = logic.MON_CHUYEN_LIST
+    paths = [student_query(s) for s in generate_students(args.students, subjects)]
+
+    proc, work_dir = None, None
+    try:
+        if args.url:
+            url = urlsplit(args.url)
+            host, port = url.hostname, url.port or 80
+        else:
+            work_dir = tempfile.TemporaryDirectory()
+            n_schools, n_years, n_subjects = (int(p) for p in args.size.lower().split('x'))
+            data_file = os.path.join(work_dir.name, 'loadtest.tnds')
+            logic.process_data_from_sheets(generate_sheets(n_schools, n_years, n_subjects), data_file)
+            host, port = '127.0.0.1', _free_port()
+            proc = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api_server.py'),
+                                     '--data', data_file, '--host', host, '--port', str(port),
+                                     '--workers', str(args.workers), '--reload-interval', '0'])
+            _wait_for_server(host, port, proc)
+
+        report = run_load_test(host, port, paths, args.concurrency, args.duration, args.revalidate)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        if work_dir is not None:
+            work_dir.cleanup()
+
+    print(f"{report['requests']} yêu cầu trong {report['seconds']:.1f} giây, {report['concurrency']} kết nối")
+    print(f"Thông lượng: {report['requests_per_second']:,.0f} yêu cầu/giây")
+    if report['requests']:
+        print(f"Độ trễ: p50 {report['p50_ms']:.2f} ms, p90 {report['p90_ms']:.2f} ms, "
+              f"p99 {report['p99_ms']:.2f} ms, max {report['max_ms']:.2f} ms")
+    counts = report['per_connection']
+    print(f"Yêu cầu mỗi kết nối: ít nhất {min(counts)}, trung vị {np.median(counts):.0f}, nhiều nhất {max(counts)}")
+    if report['starved_connections']:
+        print(f"CẢNH BÁO: {report['starved_connections']}/{len(counts)} kết nối bị bỏ đói "
+              f"(ít hơn {STARVED_FRACTION:.0%} trung vị)")
+    print(f"Mã trả về: {report['statuses']}")
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    healthy = report['requests'] and not report['starved_connections'] and set(report['statuses']) <= {'200', '304'}
+    return 0 if healthy else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,629 @@
+import argparse
+import hashlib
+import json
+import os
+import selectors
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+import numpy as np
+import pandas as pd
+import logic_core as logic
+import logic_metrics
+from logic_metrics import span, get_logger
+from logic_refresh import validate_index
+from logic_roster import validate_roster_row, score_roster_chunk
+from logic_whatif import what_if_sweep
+from logic_probability import get_admission_probabilities
+
+logger = get_logger('api')
+
+# =============================================================================
+# DỊCH VỤ HTTP JSON (KHÔNG CẦN STREAMLIT)
+# =============================================================================
+#
+# Chạy: python api_server.py [--data admission_data_processed.tnds | --province tay_ninh] --port 8080 --workers 8
+#
+#   GET  /health                      trạng thái và phiên bản dữ liệu
+#   GET  /v1/metadata                 các năm học, số trường, các môn chuyên
+#   GET  /v1/recommendations?diem_van=8&diem_toan=7.5&diem_anh=9&diem_tb_4nam=8.2[&diem_uu_tien=0.5][&mon_chuyen=Toán&diem_mon_chuyen=9]
+#   POST /v1/recommendations          cùng tham số, gửi dạng JSON
+#   GET  /v1/recommendations/ranked   cùng tham số và offset, limit, group4=1: một trang của mỗi nhóm kèm tổng số
+#   POST /v1/recommendations/batch    {"students": [{...}, ...]} (các trường khác như "id" được trả lại nguyên vẹn)
+#   POST /v1/whatif                   cùng tham số và "deltas": {"diem_toan": [0.25, 0.5], ...}: độ an toàn trên cả lưới
+#                                     thay đổi điểm và mức thay đổi từng môn làm mỗi trường đổi độ an toàn
+#   GET  /v1/probabilities            cùng tham số và limit: xác suất đậu ước tính (mô phỏng điểm chuẩn năm tới),
+#                                     cao nhất trước
+#   GET  /v1/trends?entity=A&entity=B điểm chuẩn theo năm học của các 'Đối tượng'
+#   GET  /v1/provinces                các tỉnh có cấu hình, tỉnh nào đang nạp và thống kê bộ nhớ đệm chỉ mục
+#   GET  /metrics                     số liệu dạng Prometheus
+#
+# Mọi endpoint /v1 nhận thêm tham số province=<mã tỉnh> (query string hoặc JSON) để dùng bộ dữ liệu
+# của tỉnh đó (xem logic_core.ProvinceConfig); bỏ trống là file --data. Dữ liệu của mỗi tỉnh chỉ được
+# nạp khi có yêu cầu đầu tiên và có thể bị loại khỏi bộ nhớ khi vượt TN_INDEX_CACHE_MB.
+#
+# Lỗi trả về dạng {"error": thông báo}: 400 khi tham số sai (điểm không hợp lệ, JSON hỏng, offset/limit
+# ngoài khoảng), 422 khi tham số hợp lệ nhưng không có kết quả, 404/405 khi sai đường dẫn/phương thức.
+#
+# Mọi luồng xử lý (worker pool) dùng chung các chỉ mục dữ liệu trong bộ nhớ. Các câu trả lời GET
+# có ETag gồm phiên bản dữ liệu: gửi lại If-None-Match khi dữ liệu chưa đổi sẽ nhận 304 (không có nội dung).
+# Kết nối được giữ mở (HTTP/1.1 keep-alive) nhưng không giữ worker: kết nối rảnh nằm trong một vòng
+# chờ (selector) chung, mỗi khi có dữ liệu thì một worker xử lý đúng một yêu cầu rồi trả kết nối về vòng chờ.
+# Nhờ vậy số kết nối mở có thể lớn hơn số worker mà không kết nối nào phải chờ kết nối khác đóng.
+# Kết nối rảnh quá KEEPALIVE_TIMEOUT giây bị đóng.
+
+DEFAULT_WORKERS = 8
+KEEPALIVE_TIMEOUT = 5.0
+MAX_BODY_BYTES = 2 * 1024 * 1024
+MAX_BATCH_STUDENTS = 5000
+MAX_TREND_ENTITIES = 20
+MAX_PAGE_SIZE = 100
+
+class APIError(Exception):
+    """Lỗi trả về cho khách dưới dạng {"error": message} với mã HTTP status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Không chuyển được {type(value).__name__} sang JSON")
+
+def encode_json(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8')
+
+def frame_records(df):
+    """DataFrame -> danh sách dict kiểu Python, ô trống (NaN) thành null (nhanh hơn to_dict với bảng nhỏ)."""
+    columns = list(df.columns)
+    return [{c: None if isinstance(v, float) and v != v else v for c, v in zip(columns, row)}
+            for row in df.to_numpy(dtype=object).tolist()]
+
+def etag_matches(if_none_match, etag):
+    """
+    Giá trị If-None-Match (danh sách ETag cách nhau bởi dấu phẩy, hoặc '*') có khớp `etag` không.
+    So sánh yếu như RFC 9110: bỏ tiền tố 'W/' rồi so sánh nguyên cả thẻ.
+    """
+    for tag in (if_none_match or '').split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag and tag == etag:
+            return True
+    return False
+
+def _single_values(params):
+    """Tham số query string (mỗi khóa là một danh sách) -> mỗi khóa một giá trị đầu tiên; JSON giữ nguyên."""
+    return {k: v[0] if isinstance(v, list) and v else v for k, v in params.items()}
+
+# =============================================================================
+# CÁC ENDPOINT (nhận chỉ mục và tham số, trả về payload dạng dict)
+# =============================================================================
+
+def health(server, data_file, index, params):
+    return {'status': 'ok', 'dataset_version': index.version}
+
+def metadata(server, data_file, index, params):
+    subjects = sorted(index.subject_positions)
+    return {
+        'dataset_version': index.version,
+        'province': index.province.code,
+        'years': list(index.all_years),
+        'latest_year': index.all_years[-1],
+        'entities': int(len(index.entities)),
+        'regular_entities': int((~index.is_chuyen).sum()),
+        'subjects': subjects,
+        'data_modified_at': server.data_mtimes.get(os.path.abspath(data_file)),
+    }
+
+def recommendations(server, data_file, index, params):
+    scores, error_msg = validate_roster_row(_single_values(params), index.province.subject_map)
+    if scores is None:
+        raise APIError(400, error_msg)
+    diem_xet_thuong, diem_xet_chuyen = logic.calculate_admission_scores(**scores)
+    diem_xet_chuyen = diem_xet_chuyen.get(scores['mon_chuyen'])
+
+    # Kết quả chỉ phụ thuộc vào điểm xét (như RecommendationMemo): các bộ điểm khác nhau
+    # nhưng cùng điểm xét dùng chung bảng đã chuyển sang JSON
+    key = (index.version, 'groups', diem_xet_thuong, scores['mon_chuyen'], diem_xet_chuyen)
+    cached = server.responses.get(key)
+    if cached is None:
+        groups, message = logic.get_recommendations(data_file, **scores)
+        if not groups:
+            raise APIError(422, message)
+        cached = (message, {group: frame_records(df) for group, df in groups.items()})
+        server.responses.put(key, cached)
+    message, records = cached
+    return {
+        'dataset_version': index.version,
+        'scores': scores,
+        'diem_xet_thuong': diem_xet_thuong,
+        'diem_xet_chuyen': diem_xet_chuyen,
+        'message': message,
+        'groups': records,
+    }
+
+def _int_param(values, name, default, low, high):
+    try:
+        value = int(values.get(name, default))
+    except (TypeError, ValueError):
+        raise APIError(400, f"Tham số '{name}' phải là số nguyên.")
+    if not low <= value <= high:
+        raise APIError(400, f"Tham số '{name}' phải từ {low} đến {high}.")
+    return value
+
+def ranked_recommendations(server, data_file, index, params):
+    values = _single_values(params)
+    offset = _int_param(values, 'offset', 0, 0, 10**6)
+    limit = _int_param(values, 'limit', 20, 1, MAX_PAGE_SIZE)
+    include_group_4 = str(values.get('group4', '')).lower() in ('1', 'true', 'yes')
+    scores, error_msg = validate_roster_row(values, index.province.subject_map)
+    if scores is None:
+        raise APIError(400, error_msg)
+    groups, message = logic.get_ranked_recommendations(data_file, **scores, offset=offset, limit=limit,
+                                                       include_group_4=include_group_4)
+    if not groups:
+        raise APIError(422, message)
+    return {
+        'dataset_version': index.version,
+        'scores': scores,
+        'offset': offset,
+        'limit': limit,
+        'groups': {group: {'total': page['total'], 'results': frame_records(page['results'])}
+                   for group, page in groups.items()},
+    }
+
+def recommendations_batch(server, data_file, index, params):
+    students = params.get('students')
+    if not isinstance(students, list) or not all(isinstance(s, dict) for s in students):
+        raise APIError(400, "Cần trường 'students' là danh sách các đối tượng JSON.")
+    if len(students) > MAX_BATCH_STUDENTS:
+        raise APIError(413, f"Tối đa {MAX_BATCH_STUDENTS} học sinh mỗi yêu cầu.")
+    if not students:
+        return {'dataset_version': index.version, 'results': [], 'errors': []}
+
+    chunk = pd.DataFrame(students, dtype=object)
+    results, errors = score_roster_chunk(data_file, chunk)
+    return {
+        'dataset_version': index.version,
+        'results': frame_records(results.rename(columns={'Dòng': 'Học sinh'})),
+        'errors': frame_records(errors.rename(columns={'Dòng': 'Học sinh'})),
+    }
+
+def what_if(server, data_file, index, params):
+    scores, error_msg = validate_roster_row(params, index.province.subject_map)
+    if scores is None:
+        raise APIError(400, error_msg)
+    result, message = what_if_sweep(data_file, **scores, deltas=params.get('deltas'))
+    if not result:
+        raise APIError(422, message)
+    return {
+        'dataset_version': index.version,
+        'scores': scores,
+        'message': message,
+        'grid': frame_records(result['grid']),
+        'thresholds': frame_records(result['thresholds']),
+    }
+
+def probabilities(server, data_file, index, params):
+    values = _single_values(params)
+    limit = _int_param(values, 'limit', 20, 1, MAX_PAGE_SIZE)
+    scores, error_msg = validate_roster_row(values, index.province.subject_map)
+    if scores is None:
+        raise APIError(400, error_msg)
+    df, message = get_admission_probabilities(data_file, **scores)
+    if df.empty:
+        raise APIError(422, message)
+    return {
+        'dataset_version': index.version,
+        'scores': scores,
+        'message': message,
+        'total': int(len(df)),
+        'results': frame_records(df.head(limit)),
+    }
+
+def trends(server, data_file, index, params):
+    entities = params.get('entity', [])
+    if not entities:
+        raise APIError(400, "Cần ít nhất một tham số 'entity'.")
+    if len(entities) > MAX_TREND_ENTITIES:
+        raise APIError(400, f"Tối đa {MAX_TREND_ENTITIES} 'entity' mỗi yêu cầu.")
+    payload = logic.trend_series(index, entities) or {'years': list(index.all_years), 'series': {}}
+    return {
+        'dataset_version': index.version,
+        **payload,
+        'missing': [e for e in dict.fromkeys(entities) if e not in payload['series']],
+    }
+
+# (phương thức, đường dẫn) -> (hàm xử lý, có dùng ETag / lưu đệm câu trả lời hay không)
+ROUTES = {
+    ('GET', '/health'): (health, False),
+    ('GET', '/v1/metadata'): (metadata, True),
+    ('GET', '/v1/recommendations'): (recommendations, True),
+    ('POST', '/v1/recommendations'): (recommendations, False),
+    ('GET', '/v1/recommendations/ranked'): (ranked_recommendations, True),
+    ('POST', '/v1/recommendations/batch'): (recommendations_batch, False),
+    ('POST', '/v1/whatif'): (what_if, False),
+    ('GET', '/v1/probabilities'): (probabilities, True),
+    ('GET', '/v1/trends'): (trends, True),
+}
+
+# =============================================================================
+# MÁY CHỦ HTTP VỚI WORKER POOL
+# =============================================================================
+
+class APIRequestHandler(BaseHTTPRequestHandler):
+    """
+    Một kết nối của khách. Khác BaseHTTPRequestHandler, khởi tạo không xử lý yêu cầu nào: máy chủ gọi
+    serve_one() mỗi khi kết nối có dữ liệu và close() khi kết nối kết thúc.
+    """
+
+    protocol_version = 'HTTP/1.1'   # giữ kết nối mở giữa các yêu cầu
+    server_version = 'TNStdScoreAPI/1.0'
+    timeout = KEEPALIVE_TIMEOUT
+    disable_nagle_algorithm = True  # phần đầu và nội dung được gửi riêng: tránh chờ ACK trễ ~40 ms
+
+    def __init__(self, request, client_address, server):
+        self.request = request
+        self.client_address = client_address
+        self.server = server
+        self.last_active = time.monotonic()
+        self.setup()
+
+    def serve_one(self):
+        """Xử lý một yêu cầu; trả về True nếu kết nối còn dùng tiếp được (keep-alive)."""
+        self.close_connection = True
+        self.handle_one_request()
+        self.last_active = time.monotonic()
+        return not self.close_connection
+
+    def has_buffered_request(self):
+        """Khách đã gửi sẵn yêu cầu kế tiếp (dữ liệu đã có trong rfile thì selector sẽ không báo lại)."""
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def close(self):
+        try:
+            self.finish()
+        finally:
+            self.server.shutdown_request(self.request)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def log_message(self, format, *args):
+        logger.debug(format % args, extra={'client': self.client_address[0]})
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        if url.path == '/metrics':
+            body = logic_metrics.REGISTRY.to_prometheus().encode('utf-8')
+            return self._send(200, body, content_type='text/plain; version=0.0.4; charset=utf-8')
+        if url.path == '/v1/provinces' and method == 'GET':
+            return self._send(200, encode_json(self.server.provinces()))
+
+        route = ROUTES.get((method, url.path))
+        with span('api_request', endpoint=url.path if route else 'unknown', method=method) as s:
+            if route is None:
+                known_path = any(path == url.path for _, path in ROUTES)
+                status = 405 if known_path else 404
+                s.labels['status'] = status
+                return self._send(status, encode_json({'error': "Phương thức không được hỗ trợ." if known_path
+                                                       else "Không tìm thấy đường dẫn."}))
+            handler, cacheable = route
+            try:
+                status, body, etag = self._handle(method, url, handler, cacheable)
+            except APIError as e:
+                status, body, etag = e.status, encode_json({'error': e.message}), None
+            except Exception:
+                logger.exception("Lỗi khi xử lý yêu cầu", extra={'path': url.path})
+                status, body, etag = 500, encode_json({'error': "Lỗi máy chủ."}), None
+            s.labels['status'] = status
+            self._send(status, body, etag=etag)
+
+    def _handle(self, method, url, handler, cacheable):
+        if method == 'POST':
+            params = self._read_json()
+        else:
+            params = {}
+            for key, value in parse_qsl(url.query, keep_blank_values=True):
+                params.setdefault(key, []).append(value)
+
+        data_file = self.server.data_file_for(_single_values(params).get('province'))
+        try:
+            index = logic.get_admission_index(data_file)
+        except FileNotFoundError:
+            raise APIError(503, "Chưa có dữ liệu điểm chuẩn.")
+        self.server.note_loaded(data_file)
+        if not cacheable:
+            return 200, encode_json(handler(self.server, data_file, index, params)), None
+
+        # ETag = phiên bản dữ liệu + băm của truy vấn (đã sắp theo khóa): dữ liệu chưa đổi thì câu trả lời không đổi
+        canonical = url.path + '?' + '&'.join(f"{k}={v}" for k in sorted(params) for v in params[k])
+        etag = f'"{index.version}-{hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:16]}"'
+        if etag_matches(self.headers.get('If-None-Match'), etag):
+            return 304, b'', etag
+        key = (index.version, canonical)
+        body = self.server.responses.get(key)
+        logic_metrics.record_cache('api_response', body is not None)
+        if body is None:
+            body = encode_json(handler(self.server, data_file, index, params))
+            self.server.responses.put(key, body)
+        return 200, body, etag
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True  # không đọc phần nội dung còn lại trên kết nối này
+            raise APIError(413, "Nội dung yêu cầu quá lớn.")
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except (ValueError, UnicodeDecodeError):
+            raise APIError(400, "Nội dung yêu cầu không phải JSON hợp lệ.")
+        if not isinstance(payload, dict):
+            raise APIError(400, "Nội dung yêu cầu phải là một đối tượng JSON.")
+        return payload
+
+    def _send(self, status, body, content_type='application/json; charset=utf-8', etag=None):
+        self.send_response(status)
+        if etag is not None:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        if status != 304:
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+class APIServer(HTTPServer):
+    """
+    Máy chủ HTTP dùng một ThreadPoolExecutor cố định (`workers` luồng) thay vì mỗi kết nối một luồng.
+    Worker chỉ nhận từng yêu cầu của các kết nối đã có dữ liệu; kết nối rảnh chờ trong selector của
+    luồng 'api-keepalive'. Mọi worker dùng chung các chỉ mục dữ liệu của logic_core và bộ nhớ đệm câu trả lời đã mã hóa JSON.
+    `data_file` là bộ dữ liệu dùng khi yêu cầu không chỉ định tỉnh.
+    """
+
+    request_queue_size = 128
+    allow_reuse_address = True
+
+    def __init__(self, address, data_file, workers=DEFAULT_WORKERS, max_cached_responses=8192):
+        super().__init__(address, APIRequestHandler)
+        self.data_file = data_file
+        # Đường dẫn tuyệt đối của file dữ liệu -> thời điểm sửa đổi của bản đang phục vụ
+        self.data_mtimes = {}
+        self._mtimes_lock = threading.Lock()
+        self.note_loaded(data_file)
+        # Khóa (phiên bản dữ liệu, truy vấn) -> nội dung JSON đã mã hóa,
+        # hoặc (phiên bản dữ liệu, 'groups', điểm xét...) -> các nhóm đề xuất dạng dict
+        self.responses = logic.RecommendationMemo(max_entries=max_cached_responses)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-worker')
+        self._watcher = None
+        self._stop_watching = threading.Event()
+
+        # Các kết nối rảnh chờ yêu cầu kế tiếp. Chỉ luồng 'api-keepalive' đụng vào selector; các luồng khác
+        # đưa kết nối vào _parking rồi đánh thức nó qua cặp socket _wakeup
+        self._selector = selectors.DefaultSelector()
+        self._parking = []
+        self._parking_lock = threading.Lock()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self._selector.register(self._wakeup_recv, selectors.EVENT_READ)
+        self._closing = threading.Event()
+        self._keepalive = threading.Thread(target=self._watch_connections, name='api-keepalive', daemon=True)
+        self._keepalive.start()
+
+    def process_request(self, request, client_address):
+        # Kết nối mới chờ yêu cầu đầu tiên trong selector như mọi kết nối rảnh
+        try:
+            handler = self.RequestHandlerClass(request, client_address, self)
+        except Exception:
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+            return
+        self._park(handler)
+
+    def _park(self, handler):
+        with self._parking_lock:
+            self._parking.append(handler)
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wakeup_send.send(b'\0')
+        except OSError:
+            pass  # bộ đệm đầy: luồng chờ đã có tín hiệu chưa đọc
+
+    def _submit(self, handler):
+        try:
+            self.pool.submit(self._serve, handler)
+        except RuntimeError:  # máy chủ đang dừng
+            handler.close()
+
+    def _serve(self, handler):
+        """Chạy trên worker: xử lý một yêu cầu rồi trả kết nối về selector (hoặc đóng)."""
+        try:
+            keep_alive = handler.serve_one()
+        except Exception:
+            self.handle_error(handler.request, handler.client_address)
+            keep_alive = False
+        if not keep_alive or self._closing.is_set():
+            handler.close()
+        elif handler.has_buffered_request():
+            # Yêu cầu kế tiếp đã đến: xếp cuối hàng đợi thay vì xử lý liền, để kết nối khác không phải chờ
+            self._submit(handler)
+        else:
+            self._park(handler)
+
+    def _watch_connections(self):
+        """
+        Vòng chờ của các kết nối rảnh: kết nối có dữ liệu (hoặc bị khách đóng) được giao cho worker,
+        kết nối rảnh quá KEEPALIVE_TIMEOUT giây bị đóng.
+        """
+        while not self._closing.is_set():
+            idle = [key for key in self._selector.get_map().values() if key.data is not None]
+            timeout = None
+            if idle:
+                timeout = max(0.0, min(k.data.last_active for k in idle) + KEEPALIVE_TIMEOUT - time.monotonic())
+            for key, _ in self._selector.select(timeout):
+                if key.data is None:
+                    try:
+                        while self._wakeup_recv.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                self._selector.unregister(key.fileobj)
+                self._submit(key.data)
+
+            with self._parking_lock:
+                parked, self._parking = self._parking, []
+            for handler in parked:
+                try:
+                    self._selector.register(handler.connection, selectors.EVENT_READ, handler)
+                except (ValueError, OSError):  # kết nối đã đóng
+                    handler.close()
+
+            now = time.monotonic()
+            for key in list(self._selector.get_map().values()):
+                if key.data is not None and now - key.data.last_active > KEEPALIVE_TIMEOUT:
+                    self._selector.unregister(key.fileobj)
+                    key.data.close()
+
+        for key in list(self._selector.get_map().values()):
+            if key.data is not None:
+                key.data.close()
+        with self._parking_lock:
+            parked, self._parking = self._parking, []
+        for handler in parked:
+            handler.close()
+        self._selector.close()
+
+    def data_file_for(self, province):
+        """File dữ liệu của tỉnh `province` (bỏ trống = file mặc định của máy chủ)."""
+        if not province:
+            return self.data_file
+        try:
+            return logic.get_province(province).data_file
+        except ValueError as e:
+            raise APIError(404, str(e))
+
+    def note_loaded(self, data_file):
+        """Ghi lại thời điểm sửa đổi của file ở lần đầu phục vụ (để biết khi nào cần nạp lại)."""
+        key = os.path.abspath(data_file)
+        if key not in self.data_mtimes and os.path.exists(data_file):
+            with self._mtimes_lock:
+                self.data_mtimes.setdefault(key, os.path.getmtime(data_file))
+
+    def provinces(self):
+        resident = set(logic._INDEX_CACHE.keys())
+        return {
+            'default': logic.province_for_file(self.data_file).code,
+            'provinces': [{'code': p.code, 'name': p.name, 'subjects': p.subjects,
+                           'loaded': os.path.abspath(p.data_file) in resident}
+                          for p in logic.list_provinces()],
+            'index_cache': logic.index_cache_stats(),
+        }
+
+    def watch_data_file(self, interval=30.0):
+        """
+        Kiểm tra các file dữ liệu đang phục vụ mỗi `interval` giây (ví dụ sau khi app hoặc cron làm mới
+        dữ liệu); bộ dữ liệu mới chỉ được thay vào sau khi qua validate_index.
+        """
+        def run():
+            while not self._stop_watching.wait(interval):
+                try:
+                    self.reload_if_changed()
+                except Exception:
+                    logger.exception("Lỗi khi nạp lại dữ liệu", extra={'data_file': self.data_file})
+        self._watcher = threading.Thread(target=run, name='api-data-watcher', daemon=True)
+        self._watcher.start()
+
+    def reload_if_changed(self):
+        """
+        Nạp lại chỉ mục của các file dữ liệu đã đổi. Trả về True nếu đã thay ít nhất một chỉ mục.
+        File có chỉ mục đã bị loại khỏi bộ nhớ thì bỏ qua (lần dùng sau tự đọc bản mới).
+        """
+        resident = set(logic._INDEX_CACHE.keys())
+        with self._mtimes_lock:
+            for key in [k for k in self.data_mtimes if k not in resident]:
+                del self.data_mtimes[key]
+            watched = dict(self.data_mtimes)
+        return any([self._reload_file(path, mtime) for path, mtime in watched.items()])
+
+    def _reload_file(self, data_file, served_mtime):
+        if not os.path.exists(data_file):
+            return False
+        mtime = os.path.getmtime(data_file)
+        if mtime == served_mtime:
+            return False
+        index = logic.AdmissionIndex.from_file(data_file)
+        previous = logic._INDEX_CACHE.peek(data_file)
+        error = validate_index(index, previous)
+        with self._mtimes_lock:
+            self.data_mtimes[data_file] = mtime
+        if error is not None:
+            logger.warning("Bỏ qua dữ liệu mới không hợp lệ", extra={'data_file': data_file, 'error': error})
+            return False
+        logic.replace_admission_index(data_file, index)
+        if previous is not None and previous.version != index.version:
+            self.responses.discard_version(previous.version)
+        logger.info("Đã nạp lại dữ liệu", extra={'data_file': data_file, 'dataset_version': index.version})
+        return True
+
+    def server_close(self):
+        self._stop_watching.set()
+        self._closing.set()
+        self._wake()
+        super().server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self._keepalive.join()
+        self._wakeup_send.close()
+        self._wakeup_recv.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dịch vụ HTTP JSON tư vấn tuyển sinh.")
+    parser.add_argument('--data', help="File dữ liệu đã xử lý (.tnds hoặc .csv); mặc định là file của --province.")
+    parser.add_argument('--province', help="Mã tỉnh dùng khi yêu cầu không chỉ định tỉnh (mặc định TN_PROVINCE).")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Số luồng xử lý yêu cầu.")
+    parser.add_argument('--reload-interval', type=float, default=30.0,
+                        help="Số giây giữa hai lần kiểm tra file dữ liệu đã đổi (0 = không kiểm tra).")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    data_file = args.data or logic.get_province(args.province).data_file
+    index = logic.get_admission_index(data_file)  # nạp trước để yêu cầu đầu tiên không phải chờ
+    server = APIServer((args.host, args.port), data_file, workers=args.workers)
+    if args.reload_interval > 0:
+        server.watch_data_file(args.reload_interval)
+    logger.info("Dịch vụ API đã sẵn sàng", extra={
+        'address': f"http://{args.host}:{server.server_address[1]}", 'workers': args.workers,
+        'dataset_version': index.version, 'startup_seconds': round(time.perf_counter() - start, 3)})
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
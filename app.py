@@ -1,45 +1,43 @@
 import streamlit as st
 import logic_core as logic 
-import os
-import unicodedata 
-import re
-from streamlit_gsheets import GSheetsConnection 
-import gspread
-from google.oauth2.service_account import Credentials
-import pandas as pd
+from logic_conversation import ConversationEngine, recommendation_arguments
 import json
 import base64
+import io
+import pandas as pd
+from concurrent.futures import Future
+import os
+import time
+import logic_metrics
+from logic_metrics import span, timed
+from logic_refresh import DataRefresher
+from logic_probability import add_probabilities
 
-DATA_FILE = "admission_data_processed.csv"
-GSHEET_NAME = "std_score_TayNinh_highschools" 
+REFRESH_INTERVAL = 3600 # Làm mới dữ liệu nền mỗi 1 giờ
+METRICS_DIR = os.environ.get("TN_METRICS_DIR") # Thư mục ghi metrics.prom / metrics.json (bỏ trống = không ghi)
+HISTORY_WINDOW = 6 # Số tin nhắn gần nhất được hiển thị đầy đủ; tin cũ hơn được thu gọn
+# "data": gửi dữ liệu điểm chuẩn theo năm, trình duyệt tự vẽ (st.line_chart); "png": vẽ ảnh bằng matplotlib trên máy chủ
+CHART_MODE = os.environ.get("TN_CHART_MODE", "data")
 
-MON_CHUYEN_LIST = ["Ngữ Văn", "Toán", "Vật Lý", "Hóa học", "Sinh học", "Tiếng Anh", "Tin học", "Lịch sử"]
+logger = logic_metrics.get_logger('app')
 
 # ===================================================================
 # HÀM TIỆN ÍCH CHO CHATBOT (Định nghĩa tất cả ở đây)
 # ===================================================================
 
-def normalize_text(s):
-    """
-    Chuẩn hóa văn bản: bỏ dấu, bỏ khoảng trắng, chuyển sang chữ thường.
-    Ví dụ: "Ngữ Văn" -> "nguvan"
+@timed('run_data_processing')
+def run_data_processing(output_filename, province=None):
     """
-    s = str(s).lower().replace(" ", "")
-    s = ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
-    s = s.replace('đ', 'd')
-    return s
-
-# Tạo bản đồ chuẩn hóa cho môn chuyên (định nghĩa 1 lần)
-MON_CHUYEN_MAP = {normalize_text(m): m for m in MON_CHUYEN_LIST}
-NORMALIZED_MON_CHUYEN_LIST = MON_CHUYEN_MAP.keys()
-NORMALIZED_KHO_LIST = ["khong", "ko", "0"]
-
-@st.cache_data(ttl=3600) # Cache 1 giờ
-def run_data_processing():
-    """
-    Kết nối Google Sheets bằng cách nạp credentials trực tiếp từ secrets,
-    lấy tên sheet thật, đọc và xử lý.
+    Kết nối Google Sheets của tỉnh (ProvinceConfig) bằng cách nạp credentials trực tiếp từ secrets,
+    lấy tên sheet thật, đọc và xử lý (ghi ra output_filename).
+    Được DataRefresher gọi trong luồng nền, không chạy trong lượt tải trang.
     """
+    province = province or logic.get_province()
+    if not province.gsheet_url:
+        return False, f"Lỗi: Chưa cấu hình Google Sheet cho tỉnh {province.name}."
+    # gspread và phần nạp dữ liệu chỉ được import khi thật sự làm mới dữ liệu
+    import gspread
+    import logic_ingest
     try:
         # Lấy chuỗi base64 từ secrets
         b64_key = st.secrets["connections"]["gsheets"]["key_b64"]
@@ -47,75 +45,20 @@ def run_data_processing():
         # Giải mã và parse JSON
         key_json = json.loads(base64.b64decode(b64_key).decode("utf-8"))
     
-        # Tạo credentials
-        creds = Credentials.from_service_account_info(
-            key_json,
-            scopes=["https://www.googleapis.com/auth/spreadsheets"]
-        )
-    
-        # Kết nối Google Sheets
-        gc = gspread.authorize(creds)
-        print("Xác thực thành công.")
-        # --- KẾT THÚC XÁC THỰC GSPREAD ---
-
         # Mở spreadsheet bằng client đã xác thực
-        print(f"Đang mở Google Sheet: '{GSHEET_NAME}'")
-        spreadsheet = gc.open_by_url("https://docs.google.com/spreadsheets/d/12cEo7NO3mvH8zrhnharFGghiVgawNRNWrn1rxGCm2SE/edit?usp=sharing")
+        logger.info("Đang mở Google Sheet", extra={'sheet': province.gsheet_name, 'province': province.code})
+        spreadsheet = logic_ingest.open_spreadsheet(key_json, province.gsheet_url)
 
-        print(f"Đã mở Google Sheet: '{GSHEET_NAME}'")
+        logger.info("Đã mở Google Sheet", extra={'sheet': province.gsheet_name, 'province': province.code})
 
-        all_dfs = []
-        # Lấy danh sách worksheet object THẬT
-        worksheets = spreadsheet.worksheets()
-        sheet_names = [sheet.title for sheet in worksheets] # Lấy tên thật từ title
-        print(f"Đã tìm thấy các sheet (tên thật): {sheet_names}") 
-
-        # Lặp qua các worksheet object đã lấy được
-        for worksheet in worksheets:
-            sheet_name = worksheet.title # Lấy tên thật
-            
-            # Chỉ xử lý các sheet có tên năm học
-            year_match = re.search(r'(\d{4}-\d{4})', sheet_name)
-            if not year_match:
-                print(f"Bỏ qua sheet (không chứa năm học dạng YYYY-YYYY): {sheet_name}")
-                continue
-
-            print(f"Đang đọc sheet: {sheet_name}")
-
-            # Đọc dữ liệu trực tiếp từ worksheet object bằng gspread
-            all_data = worksheet.get_all_values()
-            
-            if len(all_data) <= 5:
-                print(f"Cảnh báo: Bỏ qua sheet {sheet_name} vì không đủ dữ liệu (<= 5 hàng)")
-                continue
-                
-            # Hàng thứ 6 (index 5) là header
-            header = all_data[5]
-            # Dữ liệu bắt đầu từ hàng thứ 7 (index 6)
-            data_rows = all_data[6:]
-            
-            # Tạo DataFrame
-            df = pd.DataFrame(data_rows, columns=header)
-            year = year_match.group(1)
-            df['Năm học'] = year
-            all_dfs.append(df)
-
-        if not all_dfs:
-                return False, "Không tìm thấy hoặc không đọc được sheet nào có tên chứa năm học hợp lệ (YYYY-YYYY) trong Google Sheet."
-        print(all_dfs)
-        # Gửi danh sách các DataFrame cho hàm xử lý của logic
-        success = logic.process_data_from_sheets(all_dfs, DATA_FILE)
-
-        if success:
-            return True, "Dữ liệu Google Sheet đã được xử lý và sẵn sàng tư vấn."
-        else:
-            return False, "Xử lý dữ liệu từ Google Sheet thất bại."
+        # Chỉ tải (một lệnh gọi gộp) và xử lý lại các sheet năm học mới hoặc đã thay đổi
+        return logic_ingest.refresh_from_spreadsheet(spreadsheet, output_filename)
             
     # Bắt các lỗi cụ thể hơn
     except json.JSONDecodeError:
         return False, "Lỗi: Dữ liệu 'service_account_info' trong secrets.toml không phải là một chuỗi JSON hợp lệ. Vui lòng copy và dán lại toàn bộ nội dung file key .json."
     except gspread.exceptions.SpreadsheetNotFound:
-         return False, f"Lỗi: Không tìm thấy Google Sheet có tên '{GSHEET_NAME}'. Vui lòng kiểm tra lại tên Sheet trong code và trên Google Drive."
+         return False, f"Lỗi: Không tìm thấy Google Sheet có tên '{province.gsheet_name}'. Vui lòng kiểm tra lại tên Sheet trong code và trên Google Drive."
     except gspread.exceptions.APIError as e:
          # Thường do API chưa bật hoặc quyền truy cập
          error_details = e.response.json()
@@ -134,129 +77,168 @@ def run_data_processing():
         # Lỗi này sẽ hiển thị nếu file secrets.toml sai cấu trúc JSON bên trong, key bị thiếu,...
         return False, f"Lỗi không xác định khi kết nối hoặc đọc Google Sheets: {e}. Vui lòng kiểm tra kỹ file '.streamlit/secrets.toml', cấu trúc JSON bên trong, và quyền chia sẻ Sheet cho email service account."
 
-
-def is_valid_score(score_str, min_val=0.0, max_val=10.0):
-    """Kiểm tra xem điểm nhập vào có hợp lệ không."""
-    try:
-        score = float(score_str)
-        if min_val <= score <= max_val: return True, score
-        else: return False, None
-    except ValueError:
-        return False, None
-
-def validate_minimum_score(score_str, subject_name):
+@st.cache_resource
+def get_data_refresher(province_code):
     """
-    Kiểm tra xem điểm môn có <= 1 không.
-    Trả về: (is_valid, score, error_message)
+    Một bộ làm mới dữ liệu nền cho mỗi tỉnh trong cả tiến trình: dữ liệu tốt gần nhất luôn được
+    phục vụ, bản mới chỉ được thay vào sau khi tải và kiểm tra xong.
     """
-    try:
-        score = float(score_str)
-        if score < 1:
-            return False, None, f"Rất tiếc, điểm môn {subject_name} < 1. Bạn không đủ điều kiện để tư vấn tuyển sinh"
-        return True, score, None
-    except ValueError:
-        return True, None, None
-
-def add_assistant_message(content):
+    province = logic.get_province(province_code)
+    return DataRefresher(province.data_file, lambda output_filename: run_data_processing(output_filename, province),
+                         interval=REFRESH_INTERVAL).start()
+
+def render_refresh_status(status):
+    """Hiển thị thời điểm, thời lượng và lỗi (nếu có) của lần làm mới dữ liệu gần nhất."""
+    if status['last_refresh'] is None:
+        st.caption("Đang tải dữ liệu mới từ Google Sheet ở chế độ nền...")
+        return
+    last = time.strftime('%H:%M %d/%m/%Y', time.localtime(status['last_refresh']))
+    st.caption(f"Làm mới dữ liệu lần cuối: {last} ({status['last_duration']:.1f} giây)")
+    if status['last_error']:
+        st.caption(f"⚠️ Lần làm mới gần nhất thất bại, đang dùng dữ liệu cũ: {status['last_error']}")
+
+def add_assistant_messages(outgoing):
     """
-    Thêm tin nhắn VĂN BẢN của bot vào lịch sử chat và hiển thị.
+    Thêm các tin nhắn của bot (từ ConversationEngine) vào lịch sử chat.
+    Kết quả được lưu kèm bản tóm tắt để hiển thị khi thu gọn.
     """
-    st.session_state.messages.append({"role": "assistant", "type": "text", "content": content})
-
-def get_next_question():
-    """Xác định câu hỏi tiếp theo dựa trên trạng thái."""
-    if "van" not in st.session_state.user_scores:
-        return "ask_van", "Chào bạn! Tôi là chatbot tư vấn tuyển sinh. Đầu tiên, điểm thi môn **Văn** dự kiến của bạn là bao nhiêu?"
-    if "toan" not in st.session_state.user_scores:
-        return "ask_toan", "Tuyệt! Điểm thi môn **Toán** dự kiến của bạn là bao nhiêu?"
-    if "anh" not in st.session_state.user_scores:
-        return "ask_anh", "Tiếp theo, điểm thi môn **Tiếng Anh** dự kiến của bạn là bao nhiêu?"
-    if "tb_4nam" not in st.session_state.user_scores:
-        return "ask_tb_4nam", "Gần xong rồi! **Điểm trung bình 4 năm THCS** của bạn là bao nhiêu?"
-    if "uu_tien" not in st.session_state.user_scores:
-        return "ask_uu_tien", "Bạn có **điểm cộng/ưu tiên** không? (Nếu không, nhập 0)"
-    if "mon_chuyen" not in st.session_state.user_scores:
-        return "ask_chuyen_subject", f"Cuối cùng, bạn có thi chuyên không? Nếu có, vui lòng gõ **tên môn chuyên** (Ví dụ: 'Toán', 'Ngữ Văn',...). Nếu không, gõ **'Không'**."
-    if st.session_state.user_scores.get("mon_chuyen") and "diem_mon_chuyen" not in st.session_state.user_scores:
-        mon = st.session_state.user_scores["mon_chuyen"]
-        return "ask_chuyen_score", f"OK. Điểm thi môn chuyên **{mon}** của bạn là bao nhiêu?"
-    return "calculate", "" 
+    for message in outgoing:
+        if message["type"] == "results":
+            message = {**message, "summary": summarize_results(message["content"])}
+        st.session_state.messages.append(message)
 
+@timed('run_calculation')
 def run_calculation(scores):
     """
     Gọi bộ não logic và trả về KẾT QUẢ và TIN NHẮN TÙY CHỈNH.
     """
-    recommendations, message = logic.get_recommendations(
-        data_file=DATA_FILE,
-        diem_van=scores.get('van', 0),
-        diem_toan=scores.get('toan', 0),
-        diem_anh=scores.get('anh', 0),
-        diem_tb_4nam=scores.get('tb_4nam', 0),
-        diem_uu_tien=scores.get('uu_tien', 0),
-        mon_chuyen=scores.get('mon_chuyen'),
-        diem_mon_chuyen=scores.get('diem_mon_chuyen', 0)
-    )
+    recommendations, message = logic.get_recommendations(PROVINCE.data_file, **recommendation_arguments(scores))
     
     if not recommendations:
         return None, message # Trả về None nếu thất bại
 
-    # Tạo 3 biểu đồ và lấy đường dẫn
-    plot_paths = {}
-    if not recommendations['an_toan_cao'].empty:
-        plot_paths['plot_1'] = logic.plot_admission_trends(DATA_FILE, recommendations['an_toan_cao']['Tên trường'].tolist(), "plot_1.png")
-    
-    if not recommendations['an_toan'].empty:
-        plot_paths['plot_2'] = logic.plot_admission_trends(DATA_FILE, recommendations['an_toan']['Tên trường'].tolist(), "plot_2.png")
+    # Cột 'Xác suất đậu' (mô phỏng điểm chuẩn năm tới) bên cạnh độ an toàn của từng trường
+    add_probabilities(PROVINCE.data_file, recommendations, **recommendation_arguments(scores))
+
+    # Chế độ "data": chỉ lấy dữ liệu điểm chuẩn theo năm (dict nhỏ), trình duyệt tự vẽ.
+    # Chế độ "png": bắt đầu vẽ 3 biểu đồ song song ở nền (Future -> PNG bytes); không chờ ở đây để bảng
+    # được hiển thị ngay, render_results điền ảnh vào khi vẽ xong
+    plots = {}
+    with span('trend_plots', mode=CHART_MODE) as s:
+        for plot_key, group_key in [('plot_1', 'an_toan_cao'), ('plot_2', 'an_toan'), ('plot_3', 'nguy_co_giam')]:
+            if not recommendations[group_key].empty:
+                entities = recommendations[group_key]['Tên trường'].tolist()
+                if CHART_MODE == "data":
+                    chart = logic.get_trend_series(PROVINCE.data_file, entities)
+                else:
+                    chart = logic.submit_trend_plot(PROVINCE.data_file, entities)
+                if chart is not None:
+                    plots[plot_key] = chart
+        s.rows = len(plots)
+
+    return {"recommendations": recommendations, "plots": plots}, message
 
-    if not recommendations['nguy_co_giam'].empty:
-        plot_paths['plot_3'] = logic.plot_admission_trends(DATA_FILE, recommendations['nguy_co_giam']['Tên trường'].tolist(), "plot_3.png")
+RESULT_GROUPS = [
+    ("Nhóm 1: 🎯 An Toàn Cao", 'an_toan_cao'),
+    ("Nhóm 2: 👍 An Toàn", 'an_toan'),
+    ("Nhóm 3: ⚠️ Nguy Cơ", 'nguy_co_giam'),
+]
 
-    return {"recommendations": recommendations, "plot_paths": plot_paths}, message
+def summarize_results(results):
+    """
+    Tóm tắt kết quả thành markdown (dựng một lần khi tạo kết quả), dùng để hiển thị
+    gọn khi kết quả không còn là kết quả mới nhất.
+    """
+    lines = []
+    for title, group_key in RESULT_GROUPS:
+        df = results["recommendations"][group_key]
+        names = ", ".join(df['Tên trường']) if not df.empty else "Không có trường nào"
+        lines.append(f"- **{title}**: {names}")
+    return "\n".join(lines)
+
+def message_markdown(message):
+    """Nội dung markdown của một tin nhắn khi được thu gọn."""
+    if message.get("type") == "results":
+        return message.get("summary") or summarize_results(message["content"])
+    return str(message["content"])
+
+def render_message(message, expanded=True):
+    """
+    Hiển thị một tin nhắn. Kết quả cũ (expanded=False) chỉ hiển thị bản tóm tắt đã dựng sẵn
+    trong một expander, không dựng lại bảng và biểu đồ.
+    """
+    with st.chat_message(message["role"]):
+        if message.get("type") != "results":
+            st.write(message["content"])
+        elif expanded:
+            render_results(message["content"])
+        else:
+            with st.expander("Kết quả tư vấn trước đó", expanded=False):
+                st.markdown(message_markdown(message))
+
+def archive_history():
+    """
+    Chuyển các tin nhắn nằm ngoài cửa sổ HISTORY_WINDOW sang khối lịch sử thu gọn.
+    Mỗi tin nhắn chỉ được chuyển (dựng markdown) một lần.
+    """
+    messages = st.session_state.messages
+    boundary = max(st.session_state.archived_count, len(messages) - HISTORY_WINDOW)
+    for message in messages[st.session_state.archived_count:boundary]:
+        speaker = "Bạn" if message["role"] == "user" else "Chatbot"
+        st.session_state.archived_markdown.append(f"**{speaker}:** {message_markdown(message)}")
+    st.session_state.archived_count = boundary
+
+RESULT_SECTIONS = [
+    ("Nhóm 1: 🎯 An Toàn Cao (Điểm cao hơn, xu hướng giảm)", 'an_toan_cao', 'plot_1'),
+    ("Nhóm 2: 👍 An Toàn (Điểm cao hơn, xu hướng tăng/ổn định)", 'an_toan', 'plot_2'),
+    ("Nhóm 3: ⚠️ Nguy Cơ (Điểm thấp hơn, nhưng xu hướng giảm)", 'nguy_co_giam', 'plot_3'),
+]
 
 def render_results(content):
     """
     Hàm này nhận một Đối tượng kết quả từ st.session_state.messages
     và hiển thị nó (bảng, biểu đồ, v.v.)
+    Cả 3 bảng được hiển thị trước; biểu đồ còn đang vẽ được điền vào chỗ giữ sẵn khi xong
+    (và được lưu lại dạng bytes cho các lượt hiển thị sau). Biểu đồ dạng dữ liệu (dict) được
+    vẽ bằng st.line_chart.
     """
     recommendations = content["recommendations"]
-    plot_paths = content["plot_paths"]
-    
-    df_ma_1 = recommendations['an_toan_cao']
-    df_ma_2 = recommendations['an_toan']
-    df_ma_3 = recommendations['nguy_co_giam']
-    
-    # --- Hiển thị Nhóm 1 ---
-    st.subheader("Nhóm 1: 🎯 An Toàn Cao (Điểm cao hơn, xu hướng giảm)")
-    if df_ma_1.empty: 
-        st.info("Không tìm thấy trường nào trong nhóm này.")
-    else:
-        df_ma_1 = df_ma_1.reset_index(drop=True); df_ma_1.index += 1
-        if 'Đối tượng' in df_ma_1.columns:
-            df_ma_1.rename(columns={'Đối tượng': 'Tên trường'}, inplace=True)
-        st.dataframe(df_ma_1)
-        if 'plot_1' in plot_paths: st.image(plot_paths['plot_1'], caption="Biểu đồ 5 trường Top đầu Nhóm 1")
-    
-    # --- Hiển thị Nhóm 2 ---
-    st.subheader("Nhóm 2: 👍 An Toàn (Điểm cao hơn, xu hướng tăng/ổn định)")
-    if df_ma_2.empty: 
-        st.info("Không tìm thấy trường nào trong nhóm này.")
-    else:
-        df_ma_2 = df_ma_2.reset_index(drop=True); df_ma_2.index += 1
-        if 'Đối tượng' in df_ma_2.columns:
-            df_ma_2.rename(columns={'Đối tượng': 'Tên trường'}, inplace=True)
-        st.dataframe(df_ma_2)
-        if 'plot_2' in plot_paths: st.image(plot_paths['plot_2'], caption="Biểu đồ 5 trường Top đầu Nhóm 2")
-
-    # --- Hiển thị Nhóm 3 ---
-    st.subheader("Nhóm 3: ⚠️ Nguy Cơ (Điểm thấp hơn, nhưng xu hướng giảm)")
-    if df_ma_3.empty: 
-        st.info("Không tìm thấy trường nào trong nhóm này.")
-    else:
-        df_ma_3 = df_ma_3.reset_index(drop=True); df_ma_3.index += 1
-        if 'Đối tượng' in df_ma_3.columns:
-            df_ma_3.rename(columns={'Đối tượng': 'Tên trường'}, inplace=True)
-        st.dataframe(df_ma_3)
-        if 'plot_3' in plot_paths: st.image(plot_paths['plot_3'], caption="Biểu đồ 5 trường Top đầu Nhóm 3")
+    plots = content["plots"]
+
+    placeholders = []
+    for number, (title, group_key, plot_key) in enumerate(RESULT_SECTIONS, start=1):
+        st.subheader(title)
+        df = recommendations[group_key]
+        if df.empty:
+            st.info("Không tìm thấy trường nào trong nhóm này.")
+            continue
+        df = df.reset_index(drop=True); df.index += 1
+        if 'Đối tượng' in df.columns:
+            df.rename(columns={'Đối tượng': 'Tên trường'}, inplace=True)
+        st.dataframe(df)
+        if plot_key in plots:
+            placeholders.append((st.empty(), plot_key, f"Biểu đồ 5 trường Top đầu Nhóm {number}"))
+
+    for placeholder, plot_key, caption in placeholders:
+        png = plots[plot_key]
+        if isinstance(png, dict):
+            # Dữ liệu biểu đồ: vẽ bằng biểu đồ gốc của Streamlit ở trình duyệt
+            with placeholder.container():
+                chart_df = pd.DataFrame(png["series"], index=pd.Index(png["years"], name="Năm học"))
+                st.line_chart(chart_df, x_label="Năm học", y_label="Điểm chuẩn")
+                st.caption(caption)
+            continue
+        if isinstance(png, Future):
+            with placeholder, st.spinner("Đang vẽ biểu đồ..."):
+                try:
+                    png = png.result()
+                except Exception as e:
+                    logger.warning("Không vẽ được biểu đồ", extra={'plot': plot_key, 'error': repr(e)})
+                    del plots[plot_key]
+                    placeholder.empty()
+                    continue
+            plots[plot_key] = png
+        placeholder.image(png, caption=caption)
 
 
 # ===================================================================
@@ -264,22 +246,53 @@ def render_results(content):
 # ===================================================================
 
 st.set_page_config(page_title="Chatbot Tư vấn Tuyển sinh", layout="wide")
-st.title("🤖 Chatbot Tư vấn Tuyển sinh cấp THPT tỉnh Tây Ninh")
+
+# Tỉnh của phiên: ?province=<mã tỉnh> trên URL, bỏ trống là tỉnh mặc định (TN_PROVINCE)
+try:
+    PROVINCE = logic.get_province(st.query_params.get("province"))
+except ValueError as e:
+    st.error(str(e))
+    st.stop()
+st.title(f"🤖 Chatbot Tư vấn Tuyển sinh cấp THPT tỉnh {PROVINCE.name}")
 
 if st.button("Xóa toàn bộ lịch sử trò chuyện"):
     st.session_state.messages = []      
     st.session_state.user_scores = {}   
     st.session_state.step = "start"    
+    st.session_state.archived_count = 0
+    st.session_state.archived_markdown = []
     st.rerun() 
 
 st.markdown("---")
 
-# 1. Chạy xử lý dữ liệu (từ Google Sheets)
-success, message = run_data_processing()
-if not success:
-    st.error(message) 
+# 1. Dữ liệu được làm mới ở luồng nền; chỉ lần chạy đầu tiên (chưa có file dữ liệu) mới phải chờ
+data_refresher = get_data_refresher(PROVINCE.code)
+if not data_refresher.wait_until_ready():
+    st.error(data_refresher.status()['last_error'] or "Lỗi: Chưa có dữ liệu điểm chuẩn.")
     st.stop()
 
+# Tư vấn hàng loạt: tải lên danh sách học sinh, tải về file đề xuất
+with st.sidebar:
+    render_refresh_status(data_refresher.status())
+    st.header("Tư vấn hàng loạt")
+    roster_file = st.file_uploader(
+        "Danh sách học sinh (.xlsx/.csv) với các cột: Văn, Toán, Anh, TB 4 năm, Ưu tiên, Môn chuyên, Điểm chuyên",
+        type=["xlsx", "csv"]
+    )
+    if roster_file is not None and st.button("Tính đề xuất cho danh sách"):
+        import logic_roster # openpyxl chỉ được nạp khi dùng tính năng này
+        progress_text = st.empty()
+        output = io.BytesIO()
+        roster_ok, roster_message = logic_roster.process_roster(
+            PROVINCE.data_file, roster_file, output, file_name=roster_file.name,
+            on_progress=lambda done, failed: progress_text.write(f"Đã xử lý {done} học sinh ({failed} dòng lỗi)...")
+        )
+        if roster_ok:
+            st.success(roster_message)
+            st.download_button("Tải file đề xuất", output.getvalue(), file_name="de_xuat_tuyen_sinh.xlsx")
+        else:
+            st.error(roster_message)
+
 # 2. Khởi tạo bộ nhớ (session_state)
 if "messages" not in st.session_state:
     st.session_state.messages = []
@@ -287,153 +300,68 @@ if "user_scores" not in st.session_state:
     st.session_state.user_scores = {}
 if "step" not in st.session_state:
     st.session_state.step = "start"
+if "archived_count" not in st.session_state:
+    st.session_state.archived_count = 0      # Số tin nhắn đầu đã được thu gọn
+    st.session_state.archived_markdown = []  # Markdown dựng sẵn của các tin nhắn đó
 
-# 3. Hiển thị lịch sử chat
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        if message.get("type") == "results":
-            render_results(message["content"])
-        else:
-            st.write(message["content"])
+def calculate_with_spinner(scores):
+    """Tính đề xuất (kèm biểu đồ) và hiện vòng chờ trong khi tính."""
+    with st.chat_message("assistant"):
+        with st.spinner("Đang phân tích 3 nhóm đề xuất..."):
+            return run_calculation(scores)
+
+ENGINE = ConversationEngine(calculate_with_spinner, PROVINCE.subject_map)
 
-# 4. Gửi câu hỏi đầu tiên
-# (Chỉ gửi nếu là lần đầu và chưa có tin nhắn nào)
-if st.session_state.step == "start" and not st.session_state.messages:
-    next_step, question = get_next_question()
-    st.session_state.step = next_step
-    add_assistant_message(question)
-    # Tải lại 1 lần để hiển thị tin nhắn đầu tiên
-    st.rerun()
-
-# 5. Xử lý input của người dùng
-if prompt := st.chat_input("Nhập điểm số hoặc câu trả lời..."):
+def handle_user_input(prompt):
+    """Chuyển câu trả lời của người dùng cho ConversationEngine và lưu lại trạng thái mới."""
     # Thêm tin nhắn của USER vào bộ nhớ VÀ hiển thị
     with st.chat_message("user"):
         st.write(prompt)
     st.session_state.messages.append({"role": "user", "type": "text", "content": prompt})
 
-    # Xử lý "Bắt đầu lại"
-    if prompt.lower() == "bắt đầu lại":
-        st.session_state.user_scores = {}
-        st.session_state.step = "start"
-        next_step, question = get_next_question()
-        st.session_state.step = next_step
-        add_assistant_message(question)
-        st.rerun() 
-
-    current_step = st.session_state.step
-    
-    # --- XỬ LÝ LUỒNG HỘI THOẠI ---
-    
-    # Bước 1-4: Hỏi điểm
-    if current_step in ["ask_van", "ask_toan", "ask_anh", "ask_tb_4nam"]:
-        # Kiểm tra điểm có hợp lệ không (0-10)
-        is_valid, score = is_valid_score(prompt)
-        if not is_valid:
-            add_assistant_message("Điểm không hợp lệ. Vui lòng nhập một số từ 0 đến 10.")
-        else:
-            # Kiểm tra điểm tối thiểu cho 3 môn chính
-            score_key = current_step[4:]
-            if score_key in ["van", "toan", "anh"]:
-                # Xác định tên môn để hiển thị
-                subject_display = {
-                    "van": "Văn",
-                    "toan": "Toán", 
-                    "anh": "Tiếng Anh"
-                }
-                
-                passes_min, validated_score, error_msg = validate_minimum_score(
-                    prompt, subject_display[score_key]
-                )
-                
-                if not passes_min:
-                    # Thêm thông báo lỗi vào lịch sử
-                    add_assistant_message(error_msg)
-                    add_assistant_message("Vui lòng bắt đầu lại từ đầu. Gõ 'Bắt đầu lại' để nhập điểm mới.")
-                    
-                    # Reset về trạng thái ban đầu
-                    st.session_state.user_scores = {}
-                    st.session_state.step = "start"
-                    st.rerun()
-                else:
-                    # Điểm hợp lệ, tiếp tục
-                    st.session_state.user_scores[score_key] = score
-                    next_step, question = get_next_question()
-                    st.session_state.step = next_step
-                    add_assistant_message(question)
-            else:
-                # Các môn khác (tb_4nam) không cần kiểm tra điểm tối thiểu
-                st.session_state.user_scores[score_key] = score
-                next_step, question = get_next_question()
-                st.session_state.step = next_step
-                add_assistant_message(question)
-    # Bước 5: Hỏi điểm ưu tiên
-    elif current_step == "ask_uu_tien":
-        is_valid, score = is_valid_score(prompt, 0.0, 5.0)
-        if is_valid:
-            st.session_state.user_scores['uu_tien'] = score
-            next_step, question = get_next_question()
-            st.session_state.step = next_step
-            add_assistant_message(question)
-        else:
-            add_assistant_message("Điểm không hợp lệ. Vui lòng nhập một số (nếu không có, nhập 0).")
-
-    # Bước 6: Hỏi môn chuyên
-    elif current_step == "ask_chuyen_subject":
-        mon_chuyen_normalized = normalize_text(prompt)
-        if mon_chuyen_normalized in NORMALIZED_KHO_LIST:
-            st.session_state.user_scores['mon_chuyen'] = None
-            st.session_state.user_scores['diem_mon_chuyen'] = 0.0
-            st.session_state.step = "calculate" 
-        elif mon_chuyen_normalized in MON_CHUYEN_MAP:
-            correct_mon_chuyen = MON_CHUYEN_MAP[mon_chuyen_normalized]
-            st.session_state.user_scores['mon_chuyen'] = correct_mon_chuyen
-            next_step, question = get_next_question()
-            st.session_state.step = next_step
-            add_assistant_message(question)
-        else:
-            add_assistant_message(f"Không nhận diện được môn chuyên. Vui lòng gõ lại tên môn hoặc gõ 'Không'.")
-
-    # Bước 7: Hỏi điểm chuyên
-    elif current_step == "ask_chuyen_score":
-        is_valid, score = is_valid_score(prompt)
-        if is_valid:
-            st.session_state.user_scores['diem_mon_chuyen'] = score
-            st.session_state.step = "calculate"
-        else:
-            add_assistant_message("Điểm không hợp lệ. Vui lòng nhập điểm môn chuyên (từ 0 đến 10).")
-
-    # --- XỬ LÝ TÍNH TOÁN ---
-    if st.session_state.step == "calculate":
-        with st.chat_message("assistant"):
-            with st.spinner("Đang phân tích 3 nhóm đề xuất..."):
-                results, message = run_calculation(st.session_state.user_scores)
-        
-        if results is None:
-            add_assistant_message(message)
-        else:
-            # Hiển thị tin nhắn tùy chỉnh của bạn TRƯỚC
-            add_assistant_message(message)
-            
-            # LƯU KẾT QUẢ (Bảng/Biểu đồ) vào bộ nhớ
-            st.session_state.messages.append({
-                "role": "assistant",
-                "type": "results", 
-                "content": results
-            })
-            
-            # Thêm tin nhắn kết thúc
-            add_assistant_message("Cuộc tư vấn đã kết thúc. Gõ 'Bắt đầu lại' để nhập điểm mới.")
-
-        # Reset bộ nhớ điểm
-        st.session_state.user_scores = {}
-        st.session_state.step = "start" 
-        
-    # Tải lại trang sau mỗi lần xử lý input
-
-    st.rerun()
-
-
-
-
+    state = {"step": st.session_state.step, "scores": st.session_state.user_scores}
+    new_state, outgoing, _ = ENGINE.handle(state, prompt)
+    st.session_state.step = new_state["step"]
+    st.session_state.user_scores = new_state["scores"]
+    add_assistant_messages(outgoing)
 
+@st.fragment
+def chat_area():
+    """
+    Khu vực chat: các tin nhắn gần đây và ô nhập. Mỗi lần nhập chỉ chạy lại fragment này,
+    phần lịch sử đã thu gọn bên ngoài không bị dựng lại.
+    """
+    messages = st.session_state.messages
+
+    # 4. Gửi câu hỏi đầu tiên
+    # (Chỉ gửi nếu là lần đầu và chưa có tin nhắn nào)
+    if st.session_state.step == "start" and not messages:
+        new_state, outgoing = ENGINE.start()
+        st.session_state.step = new_state["step"]
+        st.session_state.user_scores = new_state["scores"]
+        add_assistant_messages(outgoing)
+
+    # 3. Hiển thị các tin nhắn chưa thu gọn; chỉ kết quả mới nhất được hiển thị đầy đủ
+    latest_results = max((i for i, m in enumerate(messages) if m.get("type") == "results"), default=None)
+    with span('render_history') as render_span:
+        for i in range(st.session_state.archived_count, len(messages)):
+            render_message(messages[i], expanded=(i == latest_results))
+        render_span.rows = len(messages) - st.session_state.archived_count
+
+    # 5. Xử lý input của người dùng
+    if prompt := st.chat_input("Nhập điểm số hoặc câu trả lời..."):
+        handle_user_input(prompt)
+        # Tải lại: thường chỉ chạy lại fragment; khi có nhiều tin nhắn mới thì chạy lại cả trang
+        # một lần để chuyển bớt tin nhắn cũ vào phần lịch sử thu gọn.
+        if len(messages) - st.session_state.archived_count > 2 * HISTORY_WINDOW:
+            st.rerun()
+        st.rerun(scope="fragment")
+
+# Lịch sử cũ: một khối markdown dựng sẵn, thu gọn
+archive_history()
+if st.session_state.archived_markdown:
+    with st.expander(f"Lịch sử trò chuyện trước đó ({st.session_state.archived_count} tin nhắn)"):
+        st.markdown("\n\n".join(st.session_state.archived_markdown))
+
+chat_area()
+logic_metrics.export_periodically(METRICS_DIR)
@@ -0,0 +1,242 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import logic_core as logic
+
+# =============================================================================
+# BỘ ĐO HIỆU NĂNG (BENCHMARK) VỚI DỮ LIỆU TUYỂN SINH GIẢ LẬP
+# =============================================================================
+#
+# Sinh dữ liệu có cùng hình dạng với các sheet năm học thật (N trường x M năm x K môn chuyên,
+# gồm cả dòng môn chuyên để trống STT và dòng 'Lớp nguồn'), rồi đo các hàm chính ở nhiều
+# kích thước: thời gian (trung vị), thông lượng và bộ nhớ đỉnh (tracemalloc).
+# Chạy: python benchmark.py [--sizes 50x6x8 200x10x8] [--save baseline.json] [--compare baseline.json]
+
+CHUYEN_SUBJECTS = ['Ngữ Văn', 'Toán', 'Vật Lý', 'Hóa học', 'Sinh học', 'Tiếng Anh', 'Tin học', 'Lịch sử',
+                   'Địa lý', 'Tiếng Pháp', 'Tiếng Trung', 'Tiếng Nhật']
+SHEET_COLUMNS = ['STT', 'Tên trường', 'Điểm chuẩn', 'Chỉ tiêu', 'Ghi chú']
+
+# (số trường, số năm, số môn chuyên)
+DEFAULT_SIZES = [(50, 6, 8), (200, 8, 8), (1000, 10, 12)]
+
+def generate_sheets(n_schools, n_years, n_subjects=8, first_year=2015, seed=0):
+    """
+    Sinh danh sách DataFrame giống kết quả đọc sheet năm học (cột STT, Tên trường, Điểm chuẩn,
+    Chỉ tiêu, Ghi chú, Năm học; tất cả là chuỗi). Mỗi năm có vài trường vắng mặt, vài trường
+    kèm dòng 'Lớp nguồn' (STT trống) và một trường chuyên có n_subjects dòng môn chuyên (STT trống).
+    """
+    rng = np.random.default_rng(seed)
+    subjects = [CHUYEN_SUBJECTS[i % len(CHUYEN_SUBJECTS)] + ('' if i < len(CHUYEN_SUBJECTS) else f' {i}')
+                for i in range(n_subjects)]
+    base_school = rng.uniform(12, 24, n_schools)
+    base_subject = rng.uniform(25, 45, n_subjects)
+    all_dfs = []
+    for year_offset in range(n_years):
+        year = first_year + year_offset
+        rows, stt = [], 1
+        drift = rng.normal(0, 0.8, n_schools)
+        for i in range(n_schools):
+            if rng.random() < 0.05:
+                continue
+            rows.append([str(stt), f"THPT Trường {i}", f"{base_school[i] + drift[i]:.2f}", "400", ""])
+            stt += 1
+            if i % 7 == 0:
+                rows.append(["", "Lớp nguồn", f"{base_school[i] + 1:.2f}", "35", ""])
+        if n_subjects:
+            rows.append([str(stt), logic.get_province().chuyen_school, "", "", ""])
+            for j, subject in enumerate(subjects):
+                rows.append(["", subject, f"{base_subject[j] + rng.normal(0, 1):.2f}", "35", ""])
+        df = pd.DataFrame(rows, columns=SHEET_COLUMNS)
+        df['Năm học'] = f"{year}-{year + 1}"
+        all_dfs.append(df)
+    return all_dfs
+
+def generate_students(n, subjects=(), seed=0):
+    """Sinh n bộ điểm học sinh (dict tham số của get_recommendations), ~30% thi chuyên."""
+    rng = np.random.default_rng(seed)
+    scores = np.round(rng.uniform(3, 10, (n, 5)) * 4) / 4
+    students = []
+    for row in scores:
+        student = {'diem_van': row[0], 'diem_toan': row[1], 'diem_anh': row[2],
+                   'diem_tb_4nam': round(row[3], 1), 'diem_uu_tien': 0.0,
+                   'mon_chuyen': None, 'diem_mon_chuyen': 0.0}
+        if subjects and rng.random() < 0.3:
+            student['mon_chuyen'] = subjects[rng.integers(len(subjects))]
+            student['diem_mon_chuyen'] = row[4]
+        students.append(student)
+    return students
+
+def measure(func, repeat=3):
+    """
+    Chạy func `repeat` lần để đo thời gian, thêm một lần dưới tracemalloc để đo bộ nhớ
+    (tracemalloc làm chậm đáng kể nên không tính vào thời gian).
+    Trả về (giây trung vị, bộ nhớ đỉnh tính bằng byte).
+    """
+    samples = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return float(np.median(samples)), peak
+
+def run_case(n_schools, n_years, n_subjects, work_dir, n_students=1000, n_plots=5, repeat=3):
+    """Đo một kích thước dữ liệu. Trả về dict {tên phép đo: {seconds, throughput, unit, peak_mb}}."""
+    import logic_plot
+
+    all_dfs = generate_sheets(n_schools, n_years, n_subjects)
+    n_rows = sum(len(df) for df in all_dfs)
+    data_file = os.path.join(work_dir, f"bench_{n_schools}x{n_years}x{n_subjects}.tnds")
+    results = {}
+
+    def record(name, func, items, unit):
+        seconds, peak = measure(func, repeat)
+        results[name] = {'seconds': seconds, 'throughput': items / seconds if seconds else None,
+                         'unit': unit, 'peak_mb': peak / 2**20}
+
+    record('process_data_from_sheets', lambda: logic.process_data_from_sheets(all_dfs, data_file),
+           n_rows, 'dòng/giây')
+
+    def cold_index():
+        logic._INDEX_CACHE.clear()
+        logic.get_admission_index(data_file)
+    record('load_index', cold_index, 1, 'lần/giây')
+
+    index = logic.get_admission_index(data_file)
+    subjects = sorted(s for s in set(index.subject.tolist()) if s)
+    students = generate_students(n_students, subjects)
+
+    def score_all():
+        for s in students:
+            logic.calculate_admission_scores(s['diem_van'], s['diem_toan'], s['diem_anh'], s['diem_tb_4nam'],
+                                             s['diem_uu_tien'], s['mon_chuyen'], s['diem_mon_chuyen'])
+    record('calculate_admission_scores', score_all, n_students, 'học sinh/giây')
+
+    def recommend_all():
+        for s in students:
+            logic.get_recommendations(data_file, **s)
+    record('get_recommendations', recommend_all, n_students, 'học sinh/giây')
+
+    # Lưới "nếu... thì" khoảng 2.000 phương án (Toán, Văn, Anh, điểm chuyên) cho một học sinh thi chuyên
+    import logic_whatif
+    sweep_student = {**students[0], 'mon_chuyen': subjects[0] if subjects else None, 'diem_mon_chuyen': 8.0}
+    sweep_deltas = {'diem_toan': np.arange(-2, 2.01, 0.25), 'diem_van': np.arange(-1, 1.01, 0.25),
+                    'diem_anh': np.arange(-1, 1.01, 0.5)}
+    if subjects:
+        sweep_deltas['diem_mon_chuyen'] = np.arange(-1, 1.01, 0.5)
+    n_points = len(logic_whatif.sweep_grid(sweep_deltas)[1])
+    record('what_if_sweep', lambda: logic_whatif.what_if_sweep(data_file, **sweep_student, deltas=sweep_deltas),
+           n_points, 'phương án/giây')
+
+    # Xác suất đậu: dựng mẫu mô phỏng một lần cho phiên bản dữ liệu, sau đó mỗi học sinh chỉ còn phép so sánh
+    import logic_probability
+    record('build_forecast', lambda: logic_probability.CutoffForecast(index), len(index.entities), 'Đối tượng/giây')
+
+    def probability_all():
+        for s in students:
+            logic_probability.get_admission_probabilities(data_file, **s)
+    record('admission_probabilities', probability_all, n_students, 'học sinh/giây')
+
+    # Kiểm tra ngược độ an toàn trên mọi năm với 21 ngưỡng xu hướng (-0.5 đến 0.5)
+    import logic_backtest
+    thresholds = np.round(np.arange(-0.5, 0.51, 0.05), 2)
+    record('backtest', lambda: logic_backtest.run_backtest(data_file, slope_thresholds=thresholds),
+           len(thresholds), 'ngưỡng/giây')
+
+    plot_file = os.path.join(work_dir, 'bench_plot.png')
+    plot_sets = [list(index.entities[i::n_plots][:5]) for i in range(n_plots)]
+
+    def plot_all():
+        logic_plot._PLOT_CACHE.clear()  # đo thời gian vẽ thật, không tính ảnh đã lưu đệm
+        for entities in plot_sets:
+            logic_plot.plot_admission_trends(data_file, entities, plot_file)
+    record('plot_admission_trends', plot_all, n_plots, 'biểu đồ/giây')
+
+    # Chế độ chỉ trả dữ liệu (trình duyệt tự vẽ) cho cùng các bộ 'Đối tượng'
+    def series_all():
+        for entities in plot_sets:
+            logic.get_trend_series(data_file, entities)
+    record('get_trend_series', series_all, n_plots, 'biểu đồ/giây')
+
+    return {'rows': n_rows, 'entities': int(len(index.entities)), 'results': results}
+
+def run_benchmarks(sizes=DEFAULT_SIZES, n_students=1000, repeat=3):
+    report = {'python': sys.version.split()[0], 'pandas': pd.__version__, 'numpy': np.__version__, 'cases': {}}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for n_schools, n_years, n_subjects in sizes:
+            name = f"{n_schools}x{n_years}x{n_subjects}"
+            report['cases'][name] = run_case(n_schools, n_years, n_subjects, work_dir, n_students, repeat=repeat)
+    return report
+
+def compare_reports(current, baseline, tolerance=1.25):
+    """
+    So sánh với baseline: trả về danh sách phép đo chậm hơn baseline quá `tolerance` lần.
+    """
+    regressions = []
+    for case, data in current['cases'].items():
+        base_case = baseline.get('cases', {}).get(case)
+        if base_case is None:
+            continue
+        for name, result in data['results'].items():
+            base = base_case['results'].get(name)
+            if base and base['seconds'] and result['seconds'] > base['seconds'] * tolerance:
+                regressions.append(f"{case} {name}: {result['seconds'] * 1000:.1f} ms "
+                                   f"(baseline {base['seconds'] * 1000:.1f} ms, x{result['seconds'] / base['seconds']:.2f})")
+    return regressions
+
+def _parse_size(text):
+    parts = [int(p) for p in text.lower().split('x')]
+    if len(parts) == 2:
+        parts.append(8)
+    if len(parts) != 3:
+        raise argparse.ArgumentTypeError("Kích thước phải có dạng trường x năm [x môn chuyên], ví dụ 200x8x8.")
+    return tuple(parts)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo hiệu năng các hàm chính với dữ liệu giả lập.")
+    parser.add_argument('--sizes', nargs='+', type=_parse_size, default=DEFAULT_SIZES,
+                        help="Các kích thước dạng trường x năm x môn chuyên, ví dụ 50x6x8 200x10x8.")
+    parser.add_argument('--students', type=int, default=1000, help="Số học sinh cho mỗi phép đo đề xuất.")
+    parser.add_argument('--repeat', type=int, default=3, help="Số lần đo mỗi phép (lấy trung vị).")
+    parser.add_argument('--save', help="Ghi kết quả ra file JSON (dùng làm baseline).")
+    parser.add_argument('--compare', help="So sánh với file baseline JSON; chậm hơn quá ngưỡng thì thoát mã lỗi 1.")
+    parser.add_argument('--tolerance', type=float, default=1.25, help="Ngưỡng chậm hơn cho phép so với baseline.")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sizes, args.students, args.repeat)
+    for case, data in report['cases'].items():
+        print(f"\n== {case} ({data['rows']} dòng, {data['entities']} đối tượng) ==")
+        print(f"{'Phép đo':<28}{'Thời gian':>12}{'Thông lượng':>28}{'Bộ nhớ đỉnh':>14}")
+        for name, result in data['results'].items():
+            throughput = f"{result['throughput']:,.0f} {result['unit']}" if result['throughput'] else "-"
+            print(f"{name:<28}{result['seconds'] * 1000:>9.1f} ms{throughput:>28}{result['peak_mb']:>11.1f} MB")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare_reports(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nChậm hơn baseline:\n" + "\n".join(regressions))
+            return 1
+        print("\nKhông có phép đo nào chậm hơn baseline.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+import logic_core as logic
+import logic_store
+
+# =============================================================================
+# BỘ DỮ LIỆU TỔNG HỢP DÙNG CHUNG CHO CÁC BÀI KIỂM TRA
+# =============================================================================
+#
+# Bộ dữ liệu đã xử lý có năm thiếu, điểm trống, trường không còn ở năm gần nhất và các lớp chuyên.
+# `reference` và `scalar_levels` tính lại độ an toàn bằng vòng lặp từng 'Đối tượng' như
+# get_recommendations ban đầu: get_trend_slope trên lịch sử của từng đối tượng và get_safety_level.
+
+YEARS = [f"{y}-{y + 1}" for y in range(2019, 2025)]
+CHUYEN_SCHOOL = 'Trường chuyên Hoàng Lê Kha'
+CHUYEN_SUBJECTS = ['Toán', 'Ngữ Văn', 'Tiếng Anh', 'Tin học']
+
+def make_master_frame(n_schools=60, seed=7):
+    """DataFrame đã xử lý (cột 'Năm học', 'Trường Gốc', 'Đối tượng', 'Điểm chuẩn'), mỗi (Đối tượng, năm) một dòng."""
+    rng = np.random.default_rng(seed)
+    entities = [(f"THPT Trường {i}", f"THPT Trường {i}", rng.uniform(12, 24)) for i in range(n_schools)]
+    entities += [(f"{CHUYEN_SCHOOL} - {s}", CHUYEN_SCHOOL, rng.uniform(28, 40)) for s in CHUYEN_SUBJECTS]
+    rows = []
+    for name, root, level in entities:
+        slope = rng.uniform(-0.6, 0.6)
+        first = rng.integers(0, 3)            # Một số trường mới có dữ liệu từ năm sau
+        last = len(YEARS) - (rng.random() < 0.08)   # Một số trường không còn ở năm gần nhất
+        for k in range(first, last):
+            score = round(level + slope * k + rng.normal(0, 0.4), 2)
+            rows.append((k, YEARS[k], root, name, np.nan if rng.random() < 0.05 else score))
+    rows.sort(key=lambda r: r[0])
+    return pd.DataFrame([r[1:] for r in rows], columns=['Năm học', 'Trường Gốc', 'Đối tượng', 'Điểm chuẩn'])
+
+@pytest.fixture(scope='session')
+def master_frame():
+    return make_master_frame()
+
+@pytest.fixture(scope='session')
+def data_file(master_frame, tmp_path_factory):
+    """File .tnds của bộ dữ liệu tổng hợp (chỉ đọc, dùng chung cho mọi bài kiểm tra)."""
+    path = str(tmp_path_factory.mktemp('data') / 'admission.tnds')
+    logic_store.write_dataset(master_frame, path)
+    return path
+
+@pytest.fixture(scope='session')
+def reference(master_frame):
+    """{Đối tượng có mặt ở năm gần nhất: (điểm chuẩn năm gần nhất, độ dốc, môn chuyên hoặc None)}, theo thứ tự gốc."""
+    last_year = master_frame[master_frame['Năm học'] == YEARS[-1]].set_index('Đối tượng')['Điểm chuẩn']
+    result = {}
+    for entity in master_frame['Đối tượng'].unique():
+        if entity not in last_year:
+            continue
+        history = master_frame[master_frame['Đối tượng'] == entity].sort_values('Năm học')
+        subject = entity.split(' - ')[-1] if CHUYEN_SCHOOL in entity else None
+        result[entity] = (last_year[entity], logic.get_trend_slope(history), subject)
+    return result
+
+@pytest.fixture(scope='session')
+def scalar_levels(reference):
+    """
+    Hàm (diem_xet_thuong, diem_xet_chuyen) -> DataFrame độ an toàn của từng 'Đối tượng' được xét,
+    theo thứ tự gốc như vòng lặp ban đầu.
+    """
+    def levels(diem_xet_thuong, diem_xet_chuyen):
+        rows = []
+        for entity, (cutoff, slope, subject) in reference.items():
+            if subject is not None and subject not in diem_xet_chuyen:
+                continue
+            diem = diem_xet_thuong if subject is None else diem_xet_chuyen[subject]
+            rows.append((entity, cutoff, diem, logic.get_safety_level(diem, cutoff, slope)[0]))
+        return pd.DataFrame(rows, columns=['Tên trường', 'Điểm chuẩn năm ngoái', 'Điểm xét của bạn', 'Độ an toàn (Mã)'])
+    return levels
@@ -0,0 +1,164 @@
+import itertools
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+# =============================================================================
+# CLIENT GSPREAD GIẢ LẬP (CHẠY OFFLINE, DÙNG ĐỂ KIỂM THỬ PHẦN NẠP DỮ LIỆU)
+# =============================================================================
+#
+# Chỉ cài đặt những gì logic_ingest dùng: client.open_by_url / open, spreadsheet.worksheets(),
+# spreadsheet.values_batch_get(), spreadsheet.lastUpdateTime và worksheet.get_all_values().
+# Mỗi lệnh gọi "API" được đếm trong spreadsheet.calls. Có thể giả lập độ trễ mạng (latency)
+# và lỗi API (error_plan: danh sách mã lỗi lần lượt cho từng lệnh gọi, hoặc error_rate ngẫu nhiên).
+# Mỗi phần tử của error_plan là mã lỗi, None (lệnh gọi thành công) hoặc (mã lỗi, headers),
+# ví dụ (429, {'Retry-After': '2'}).
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def json(self):
+        return {'error': {'code': self.status_code, 'message': f"Lỗi giả lập {self.status_code}", 'status': 'UNAVAILABLE'}}
+
+class FakeAPIError(Exception):
+    """Giống gspread.exceptions.APIError: có .code và .response.status_code."""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"APIError {status_code}")
+        self.code = status_code
+        self.response = FakeResponse(status_code, headers)
+
+def sheet_values_from_frame(df, preamble_rows=5):
+    """
+    Tạo giá trị thô của một sheet năm học từ DataFrame: `preamble_rows` dòng tiêu đề
+    trang, sau đó là dòng header (hàng thứ 6) và các dòng dữ liệu, giống bố cục sheet thật.
+    """
+    width = len(df.columns)
+    preamble = [[''] * width for _ in range(preamble_rows)]
+    preamble[0][0] = 'ĐIỂM CHUẨN TUYỂN SINH LỚP 10'
+    rows = [['' if v is None else str(v) for v in row] for row in df.itertuples(index=False)]
+    return preamble + [list(df.columns)] + rows
+
+def _trim(values):
+    """Bỏ ô trống cuối dòng và dòng trống cuối bảng, như Sheets API trả về."""
+    rows = []
+    for row in values:
+        row = list(row)
+        while row and row[-1] == '':
+            row.pop()
+        rows.append(row)
+    while rows and not rows[-1]:
+        rows.pop()
+    return rows
+
+class FakeWorksheet:
+    _ids = itertools.count(1)
+
+    def __init__(self, spreadsheet, title, values):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = next(self._ids)
+        self.values = [list(row) for row in values]
+
+    @property
+    def row_count(self):
+        return len(self.values)
+
+    @property
+    def col_count(self):
+        return max((len(row) for row in self.values), default=0)
+
+    def get_all_values(self):
+        self.spreadsheet._call('get_all_values', self.title)
+        width = self.col_count
+        return [list(row) + [''] * (width - len(row)) for row in self.values]
+
+class FakeSpreadsheet:
+    def __init__(self, sheets=None, title='std_score_fake', track_modified_time=True,
+                 latency=0.0, error_plan=None, error_rate=0.0, error_status=429, seed=0):
+        self.title = title
+        self.track_modified_time = track_modified_time
+        self.latency = latency
+        self.error_plan = list(error_plan or [])
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.calls = Counter()
+        self.errors = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._worksheets = []
+        self._modified = 0
+        for sheet_title, values in (sheets or {}).items():
+            self.add_worksheet(sheet_title, values)
+
+    def _call(self, name, title=None):
+        with self._lock:
+            self.calls[name] += 1
+            status = self.error_plan.pop(0) if self.error_plan else None
+            status, headers = status if isinstance(status, tuple) else (status, None)
+            if status is None and self.error_rate and self._random.random() < self.error_rate:
+                status = self.error_status
+            if status is not None:
+                self.errors[status] += 1
+        # latency có thể là số giây cố định hoặc hàm (tên lệnh, tên sheet) -> số giây
+        delay = self.latency(name, title) if callable(self.latency) else self.latency
+        if delay:
+            time.sleep(delay)
+        if status is not None:
+            raise FakeAPIError(status, headers)
+
+    def _touch(self):
+        self._modified += 1
+
+    @property
+    def lastUpdateTime(self):
+        if not self.track_modified_time:
+            raise PermissionError("Thiếu quyền Drive để đọc thời điểm sửa đổi.")
+        return datetime.fromtimestamp(1_700_000_000 + self._modified, tz=timezone.utc).isoformat()
+
+    # --- Thao tác giả lập thay đổi dữ liệu ---
+    def add_worksheet(self, title, values):
+        self._worksheets.append(FakeWorksheet(self, title, values))
+        self._touch()
+
+    def set_values(self, title, values):
+        self.worksheet(title).values = [list(row) for row in values]
+        self._touch()
+
+    def del_worksheet(self, title):
+        self._worksheets = [ws for ws in self._worksheets if ws.title != title]
+        self._touch()
+
+    # --- API giống gspread ---
+    def worksheet(self, title):
+        for ws in self._worksheets:
+            if ws.title == title:
+                return ws
+        raise KeyError(title)
+
+    def worksheets(self):
+        self._call('worksheets')
+        return list(self._worksheets)
+
+    def values_batch_get(self, ranges, params=None):
+        titles = [re.sub(r"^'(.*)'(!.*)?$", r"\1", r).replace("''", "'") for r in ranges]
+        self._call('values_batch_get', ','.join(titles))
+        value_ranges = []
+        for range_name, title in zip(ranges, titles):
+            value_ranges.append({'range': range_name, 'values': _trim(self.worksheet(title).values)})
+        return {'spreadsheetId': self.title, 'valueRanges': value_ranges}
+
+class FakeClient:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_url(self, url):
+        return self.spreadsheet
+
+    def open(self, title):
+        return self.spreadsheet
@@ -0,0 +1,168 @@
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+import logic_core as logic
+from logic_metrics import timed
+
+# =============================================================================
+# KIỂM TRA NGƯỢC (BACKTEST) ĐỘ AN TOÀN TRÊN CÁC NĂM ĐÃ QUA
+# =============================================================================
+#
+# Với mỗi năm học Y (trừ năm đầu), dựng lại chỉ mục "tính đến năm liền trước" (chỉ dùng dữ liệu
+# các năm <= Y-1, như AdmissionIndex dựng vào lúc đó): các 'Đối tượng' có mặt ở năm Y-1, điểm chuẩn
+# năm Y-1 và độ dốc xu hướng tính trên các năm <= Y-1. Một lưới điểm xét giả định được xếp vào 4 nhóm
+# an toàn như get_safety_level rồi so với điểm chuẩn thực tế năm Y:
+#   - nhóm 1, 2 (điểm xét >= điểm chuẩn năm trước) dự đoán "đậu", đúng nếu điểm xét >= điểm chuẩn năm Y;
+#   - nhóm 3, 4 dự đoán "trượt", đúng nếu điểm xét < điểm chuẩn năm Y.
+# Xu hướng "giảm" chỉ nên làm thay đổi tỉ lệ đậu thực tế: nhóm 1 cao hơn nhóm 2, nhóm 3 cao hơn nhóm 4.
+#
+# Độ dốc "tính đến năm k" dùng đúng CompactDataset.trend_slopes (cùng thứ tự cộng) để trùng từng bit với
+# chỉ mục lúc đó: độ dốc nằm đúng ngưỡng (ví dụ lịch sử 2 năm chênh 0.1) phải được xếp cùng nhóm.
+# Với mỗi lượt (năm kiểm tra, Đối tượng) số điểm lưới "cao hơn" và "đậu" được đếm bằng np.searchsorted
+# trên lưới đã sắp, nên thử nhiều ngưỡng xu hướng cùng lúc chỉ còn vài phép cộng theo nhóm.
+
+DEFAULT_SLOPE_THRESHOLD = -0.1   # Ngưỡng "xu hướng giảm" của get_safety_level
+DEFAULT_SCORE_STEP = 0.25
+
+def as_of_slopes(dataset):
+    """
+    Độ dốc xu hướng của mọi 'Đối tượng' khi chỉ dùng dữ liệu các năm <= k, cho mọi k:
+    ma trận (Đối tượng x Năm học), cột k như CompactDataset.trend_slopes() của bộ dữ liệu cắt đến năm k.
+    """
+    slopes = [np.asarray(dataset.trend_slopes(through_year=k), dtype=float) for k in range(len(dataset.years))]
+    if not slopes:
+        return np.empty((len(dataset.entity_names), 0))
+    return np.column_stack(slopes)
+
+def backtest_cases(dataset):
+    """
+    Các lượt kiểm tra: mỗi (năm kiểm tra Y, 'Đối tượng' có mặt ở năm Y-1 và có điểm chuẩn năm Y) một dòng,
+    gồm điểm chuẩn năm Y-1, độ dốc tính đến năm Y-1 và điểm chuẩn thực tế năm Y.
+    """
+    slopes = as_of_slopes(dataset)
+    frames = []
+    for k in range(1, len(dataset.years)):
+        codes = np.flatnonzero(dataset.present_in_year(k - 1) & ~np.isnan(dataset.scores[:, k]))
+        frames.append(pd.DataFrame({
+            'Năm kiểm tra': dataset.years[k],
+            'Đối tượng': dataset.entity_names[codes],
+            'Điểm chuẩn năm trước': dataset.scores[codes, k - 1],
+            'Độ dốc': slopes[codes, k - 1],
+            'Điểm chuẩn thực tế': dataset.scores[codes, k],
+        }))
+    if not frames:
+        return pd.DataFrame(columns=['Năm kiểm tra', 'Đối tượng', 'Điểm chuẩn năm trước', 'Độ dốc',
+                                     'Điểm chuẩn thực tế'])
+    return pd.concat(frames, ignore_index=True)
+
+def default_score_grid(dataset, step=DEFAULT_SCORE_STEP):
+    """Lưới điểm xét giả định phủ toàn bộ khoảng điểm chuẩn đã có (thêm 1 điểm mỗi phía)."""
+    scores = dataset.scores[~np.isnan(dataset.scores)]
+    if not len(scores):
+        return np.empty(0)
+    low, high = np.floor(scores.min()) - 1, np.ceil(scores.max()) + 1
+    return np.round(np.arange(low, high + step / 2, step), 4)
+
+def _grid_counts(grid, last_cutoff, actual_cutoff):
+    """
+    Với mỗi lượt: số điểm lưới "cao hơn" (>= điểm chuẩn năm trước), số điểm lưới "cao hơn" mà đậu thực tế,
+    và số điểm lưới đậu thực tế (>= điểm chuẩn năm Y). Điểm chuẩn NaN không bao giờ được vượt qua.
+    """
+    def at_least(cutoff):
+        return len(grid) - np.searchsorted(grid, cutoff, side='left')
+
+    n_higher = at_least(last_cutoff)
+    n_admitted = at_least(actual_cutoff)
+    # Cao hơn và đậu <=> điểm xét >= cả hai điểm chuẩn (NaN được xếp sau mọi số nên cho 0)
+    n_higher_admitted = at_least(np.fmax(last_cutoff, actual_cutoff))
+    n_higher_admitted[np.isnan(last_cutoff)] = 0
+    return n_higher, n_higher_admitted, n_admitted
+
+@timed('backtest')
+def run_backtest(data_file, scores=None, slope_thresholds=None, step=DEFAULT_SCORE_STEP):
+    """
+    Kiểm tra ngược độ an toàn trên mọi năm học của `data_file` với lưới điểm xét `scores`
+    (mặc định: default_score_grid với bước `step`) và các ngưỡng xu hướng giảm `slope_thresholds` (mặc định [-0.1]).
+    Trả về ({'summary': ..., 'by_year': ...}, message) hoặc ({}, thông báo lỗi):
+      - summary: mỗi (ngưỡng, nhóm an toàn) một dòng: số lượt (điểm lưới x Đối tượng x năm),
+        tỉ lệ đậu thực tế và tỉ lệ dự đoán đúng;
+      - by_year: như summary nhưng tách theo năm kiểm tra.
+    """
+    try:
+        dataset = logic.get_admission_index(data_file).dataset
+    except FileNotFoundError:
+        return {}, f"Lỗi: Không tìm thấy file dữ liệu '{data_file}'."
+    if len(dataset.years) < 2:
+        return {}, "Cần dữ liệu ít nhất 2 năm học để kiểm tra ngược."
+
+    grid = default_score_grid(dataset, step) if scores is None else np.sort(np.asarray(scores, dtype=float).reshape(-1))
+    thresholds = np.asarray([DEFAULT_SLOPE_THRESHOLD] if slope_thresholds is None else slope_thresholds,
+                            dtype=float).reshape(-1)
+    if not len(grid) or not np.isfinite(grid).all():
+        return {}, "Lưới điểm xét phải gồm các số."
+    if not len(thresholds) or not np.isfinite(thresholds).all():
+        return {}, "Các ngưỡng xu hướng phải là số."
+
+    cases = backtest_cases(dataset)
+    n_higher, n_higher_admitted, n_admitted = _grid_counts(
+        grid, cases['Điểm chuẩn năm trước'].to_numpy(), cases['Điểm chuẩn thực tế'].to_numpy()
+    )
+    n_lower, n_lower_admitted = len(grid) - n_higher, n_admitted - n_higher_admitted
+
+    # Mọi ngưỡng cùng lúc: ma trận bool (ngưỡng x lượt) "xu hướng giảm"
+    is_down = cases['Độ dốc'].to_numpy()[None, :] < thresholds[:, None]
+    year_codes, year_labels = pd.factorize(cases['Năm kiểm tra'])
+    # Tổng theo (ngưỡng, năm kiểm tra) bằng một phép nhân ma trận với ma trận chỉ báo năm
+    year_onehot = np.eye(len(year_labels), dtype=np.int64)[year_codes]
+    rows = []
+    for code, higher, total, admitted in [(1, True, n_higher, n_higher_admitted), (2, True, n_higher, n_higher_admitted),
+                                          (3, False, n_lower, n_lower_admitted), (4, False, n_lower, n_lower_admitted)]:
+        member = is_down if code in (1, 3) else ~is_down
+        n_cases = (member * total) @ year_onehot
+        n_pass = (member * admitted) @ year_onehot
+        for t, threshold in enumerate(thresholds):
+            for y, year in enumerate(year_labels):
+                rows.append((threshold, year, code, n_cases[t, y], n_pass[t, y], higher))
+
+    by_year = pd.DataFrame(rows, columns=['Ngưỡng xu hướng', 'Năm kiểm tra', 'Độ an toàn (Mã)', 'Số lượt',
+                                          'Số lượt đậu', 'Dự đoán đậu'])
+    summary = by_year.groupby(['Ngưỡng xu hướng', 'Độ an toàn (Mã)'], sort=True, as_index=False)[
+        ['Số lượt', 'Số lượt đậu', 'Dự đoán đậu']].agg({'Số lượt': 'sum', 'Số lượt đậu': 'sum', 'Dự đoán đậu': 'first'})
+    result = {}
+    for name, df in (('summary', summary), ('by_year', by_year)):
+        df = df.copy()
+        df.insert(df.columns.get_loc('Độ an toàn (Mã)') + 1, 'Nhóm', df['Độ an toàn (Mã)'].map(logic.RANKED_GROUPS))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df['Tỉ lệ đậu thực tế'] = np.round(df['Số lượt đậu'] / df['Số lượt'], 4)
+            hits = np.where(df['Dự đoán đậu'], df['Số lượt đậu'], df['Số lượt'] - df['Số lượt đậu'])
+            df['Tỉ lệ dự đoán đúng'] = np.round(hits / df['Số lượt'], 4)
+        df[['Số lượt', 'Số lượt đậu']] = df[['Số lượt', 'Số lượt đậu']].astype(np.int64)
+        result[name] = df.drop(columns='Dự đoán đậu')
+
+    return result, (f"Đã kiểm tra {len(year_labels)} năm học, {len(cases)} lượt (Đối tượng x năm), "
+                    f"{len(grid)} mức điểm xét và {len(thresholds)} ngưỡng xu hướng.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kiểm tra ngược độ an toàn trên các năm học đã qua.")
+    parser.add_argument('data', nargs='?', default=None, help="File dữ liệu đã xử lý (mặc định: của tỉnh mặc định)")
+    parser.add_argument('--thresholds', type=float, nargs='+', default=None,
+                        help="Các ngưỡng độ dốc 'xu hướng giảm' cần so sánh (mặc định -0.1)")
+    parser.add_argument('--step', type=float, default=DEFAULT_SCORE_STEP, help="Bước của lưới điểm xét")
+    parser.add_argument('--by-year', action='store_true', help="In thêm kết quả theo từng năm kiểm tra")
+    args = parser.parse_args(argv)
+
+    data_file = args.data or logic.get_province().data_file
+    result, message = run_backtest(data_file, slope_thresholds=args.thresholds, step=args.step)
+    print(message)
+    if not result:
+        return 1
+    with pd.option_context('display.width', 200, 'display.max_rows', None):
+        print(result['summary'].to_string(index=False))
+        if args.by_year:
+            print(result['by_year'].to_string(index=False))
+    return 0
+
+if __name__ == '__main__':
+    # python logic_backtest.py admission_data_processed.tnds --thresholds -0.3 -0.2 -0.1 0
+    sys.exit(main())
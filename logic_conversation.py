@@ -0,0 +1,190 @@
+import logic_core as logic
+from logic_core import (
+    normalize_text, is_valid_score, validate_minimum_score,
+    MON_CHUYEN_MAP, NORMALIZED_KHO_LIST
+)
+
+# =============================================================================
+# LUỒNG HỘI THOẠI TƯ VẤN (MÁY TRẠNG THÁI, KHÔNG PHỤ THUỘC STREAMLIT)
+# =============================================================================
+#
+# Trạng thái là một dict {'step': ..., 'scores': {...}}. Mỗi câu trả lời của người dùng
+# được xử lý bằng engine.handle(state, user_input) -> (trạng thái mới, tin nhắn gửi đi, kết quả).
+# Tin nhắn gửi đi có cùng dạng với st.session_state.messages:
+#     {"role": "assistant", "type": "text" | "results", "content": ...}
+# Engine không giữ trạng thái riêng nên dùng được cho Streamlit, CLI, HTTP hay kiểm thử tải.
+
+STEP_START = "start"
+STEP_CALCULATE = "calculate"
+SCORE_STEPS = ["ask_van", "ask_toan", "ask_anh", "ask_tb_4nam"]
+SUBJECT_DISPLAY = {"van": "Văn", "toan": "Toán", "anh": "Tiếng Anh"}
+RESTART_COMMAND = "bắt đầu lại"
+
+END_MESSAGE = "Cuộc tư vấn đã kết thúc. Gõ 'Bắt đầu lại' để nhập điểm mới."
+RESTART_HINT = "Vui lòng bắt đầu lại từ đầu. Gõ 'Bắt đầu lại' để nhập điểm mới."
+
+def new_state():
+    return {"step": STEP_START, "scores": {}}
+
+def text_message(content):
+    return {"role": "assistant", "type": "text", "content": content}
+
+def get_next_question(scores):
+    """Xác định câu hỏi tiếp theo dựa trên các điểm đã có. Trả về (bước, câu hỏi)."""
+    if "van" not in scores:
+        return "ask_van", "Chào bạn! Tôi là chatbot tư vấn tuyển sinh. Đầu tiên, điểm thi môn **Văn** dự kiến của bạn là bao nhiêu?"
+    if "toan" not in scores:
+        return "ask_toan", "Tuyệt! Điểm thi môn **Toán** dự kiến của bạn là bao nhiêu?"
+    if "anh" not in scores:
+        return "ask_anh", "Tiếp theo, điểm thi môn **Tiếng Anh** dự kiến của bạn là bao nhiêu?"
+    if "tb_4nam" not in scores:
+        return "ask_tb_4nam", "Gần xong rồi! **Điểm trung bình 4 năm THCS** của bạn là bao nhiêu?"
+    if "uu_tien" not in scores:
+        return "ask_uu_tien", "Bạn có **điểm cộng/ưu tiên** không? (Nếu không, nhập 0)"
+    if "mon_chuyen" not in scores:
+        return "ask_chuyen_subject", f"Cuối cùng, bạn có thi chuyên không? Nếu có, vui lòng gõ **tên môn chuyên** (Ví dụ: 'Toán', 'Ngữ Văn',...). Nếu không, gõ **'Không'**."
+    if scores.get("mon_chuyen") and "diem_mon_chuyen" not in scores:
+        mon = scores["mon_chuyen"]
+        return "ask_chuyen_score", f"OK. Điểm thi môn chuyên **{mon}** của bạn là bao nhiêu?"
+    return STEP_CALCULATE, ""
+
+def recommendation_arguments(scores):
+    """Đổi điểm đã thu thập sang tham số của logic_core.get_recommendations."""
+    return dict(
+        diem_van=scores.get('van', 0),
+        diem_toan=scores.get('toan', 0),
+        diem_anh=scores.get('anh', 0),
+        diem_tb_4nam=scores.get('tb_4nam', 0),
+        diem_uu_tien=scores.get('uu_tien', 0),
+        mon_chuyen=scores.get('mon_chuyen'),
+        diem_mon_chuyen=scores.get('diem_mon_chuyen', 0)
+    )
+
+def recommendation_calculator(data_file):
+    """
+    Hàm calculate chỉ tính đề xuất (không vẽ biểu đồ), dùng cho CLI, HTTP hoặc kiểm thử tải.
+    """
+    def calculate(scores):
+        recommendations, message = logic.get_recommendations(data_file, **recommendation_arguments(scores))
+        if not recommendations:
+            return None, message
+        return {"recommendations": recommendations, "plots": {}}, message
+    return calculate
+
+class ConversationEngine:
+    """
+    Máy trạng thái của cuộc tư vấn.
+    calculate(scores) -> (results, message) được gọi khi đã đủ điểm; results là None nếu thất bại
+    (ví dụ run_calculation của app, hoặc hàm chỉ gọi logic_core.get_recommendations).
+    subject_map: các môn chuyên được nhận (ProvinceConfig.subject_map của tỉnh), mặc định của Tây Ninh.
+    """
+
+    def __init__(self, calculate, subject_map=MON_CHUYEN_MAP):
+        self.calculate = calculate
+        self.subject_map = subject_map
+
+    def start(self):
+        """Bắt đầu (lại) cuộc tư vấn: trả về (trạng thái mới, [câu hỏi đầu tiên])."""
+        scores = {}
+        step, question = get_next_question(scores)
+        return {"step": step, "scores": scores}, [text_message(question)]
+
+    def handle(self, state, user_input):
+        """
+        Xử lý một câu trả lời. Không sửa `state` đầu vào.
+        Trả về (trạng thái mới, danh sách tin nhắn gửi đi, kết quả hoặc None).
+        """
+        step = state.get("step", STEP_START)
+        scores = dict(state.get("scores", {}))
+        prompt = str(user_input)
+
+        if prompt.lower() == RESTART_COMMAND:
+            new, messages = self.start()
+            return new, messages, None
+
+        messages = []
+
+        def ask_next():
+            next_step, question = get_next_question(scores)
+            messages.append(text_message(question))
+            return next_step
+
+        # Bước 1-4: Hỏi điểm
+        if step in SCORE_STEPS:
+            is_valid, score = is_valid_score(prompt)
+            score_key = step[4:]
+            if not is_valid:
+                messages.append(text_message("Điểm không hợp lệ. Vui lòng nhập một số từ 0 đến 10."))
+            elif score_key in SUBJECT_DISPLAY:
+                # Kiểm tra điểm tối thiểu cho 3 môn chính
+                passes_min, _, error_msg = validate_minimum_score(prompt, SUBJECT_DISPLAY[score_key])
+                if not passes_min:
+                    messages += [text_message(error_msg), text_message(RESTART_HINT)]
+                    return new_state(), messages, None
+                scores[score_key] = score
+                step = ask_next()
+            else:
+                # TB 4 năm không cần kiểm tra điểm tối thiểu
+                scores[score_key] = score
+                step = ask_next()
+
+        # Bước 5: Hỏi điểm ưu tiên
+        elif step == "ask_uu_tien":
+            is_valid, score = is_valid_score(prompt, 0.0, 5.0)
+            if is_valid:
+                scores['uu_tien'] = score
+                step = ask_next()
+            else:
+                messages.append(text_message("Điểm không hợp lệ. Vui lòng nhập một số (nếu không có, nhập 0)."))
+
+        # Bước 6: Hỏi môn chuyên
+        elif step == "ask_chuyen_subject":
+            mon_chuyen_normalized = normalize_text(prompt)
+            if mon_chuyen_normalized in NORMALIZED_KHO_LIST:
+                scores['mon_chuyen'] = None
+                scores['diem_mon_chuyen'] = 0.0
+                step = STEP_CALCULATE
+            elif mon_chuyen_normalized in self.subject_map:
+                scores['mon_chuyen'] = self.subject_map[mon_chuyen_normalized]
+                step = ask_next()
+            else:
+                messages.append(text_message("Không nhận diện được môn chuyên. Vui lòng gõ lại tên môn hoặc gõ 'Không'."))
+
+        # Bước 7: Hỏi điểm chuyên
+        elif step == "ask_chuyen_score":
+            is_valid, score = is_valid_score(prompt)
+            if is_valid:
+                scores['diem_mon_chuyen'] = score
+                step = STEP_CALCULATE
+            else:
+                messages.append(text_message("Điểm không hợp lệ. Vui lòng nhập điểm môn chuyên (từ 0 đến 10)."))
+
+        if step != STEP_CALCULATE:
+            return {"step": step, "scores": scores}, messages, None
+
+        # Đủ điểm: tính đề xuất, rồi đặt lại trạng thái cho lần tư vấn sau
+        results, message = self.calculate(scores)
+        messages.append(text_message(message))
+        if results is not None:
+            messages.append({"role": "assistant", "type": "results", "content": results})
+            messages.append(text_message(END_MESSAGE))
+        return new_state(), messages, results
+
+if __name__ == '__main__':
+    # Chạy cuộc tư vấn trên dòng lệnh: python logic_conversation.py [file dữ liệu, mặc định của tỉnh mặc định]
+    import sys
+    data_file = sys.argv[1] if len(sys.argv) > 1 else logic.get_province().data_file
+    engine = ConversationEngine(recommendation_calculator(data_file), logic.province_for_file(data_file).subject_map)
+    state, outgoing = engine.start()
+    while True:
+        for message in outgoing:
+            if message["type"] == "results":
+                for group, df in message["content"]["recommendations"].items():
+                    print(f"\n[{group}]\n{df.to_string(index=False) if not df.empty else '(trống)'}")
+            else:
+                print(f"Bot: {message['content']}")
+        try:
+            user_input = input("Bạn: ")
+        except EOFError:
+            break
+        state, outgoing, _ = engine.handle(state, user_input)
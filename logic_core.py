@@ -1,333 +1,1040 @@
-import pandas as pd
-import glob
-import re
-import os
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-from scipy.stats import linregress
-import numpy as np
-import openpyxl
-import base64
-# =============================================================================
-# BƯỚC 1: HÀM TẢI VÀ XỬ LÝ DỮ LIỆU
-# =============================================================================
-
-def process_data_from_sheets(all_dfs, output_filename="admission_data_processed.csv"):
-    """
-    Nhận một DANH SÁCH các DataFrame (đã được đọc từ Google Sheets),
-    gộp chúng lại và xử lý.
-    """
-    if not all_dfs:
-        print("Không có dữ liệu nào được truyền để xử lý.")
-        return False
-    master_df = pd.concat(all_dfs, ignore_index=True)
-
-    # --- SỬA LỖI QUAN TRỌNG: CHUYỂN ĐỔI CHUỖI RỖNG THÀNH NaN ---
-    # Chuyển đổi tất cả các giá trị là chuỗi rỗng '' trong cột STT thành NaN
-    # (hoặc pd.NA) để logic isna() hoạt động chính xác.
-    master_df['STT'] = master_df['STT'].replace(r'^\s*$', np.nan, regex=True)
-    # --- KẾT THÚC SỬA LỖI ---
-
-    # 1. Tạo cột 'Trường Gốc'
-    master_df['Trường Gốc'] = master_df['Tên trường'].where(master_df['STT'].notna())
-    master_df['Trường Gốc'] = master_df['Trường Gốc'].ffill()
-    
-    # 2. LỌC BỎ "LỚP NGUỒN" NGAY BÂY GIỜ (VÌ LỚP NGUỒN ĐÃ KHÔNG CÒN MỞ)
-    #    Sử dụng cột 'Tên trường' GỐC (nơi 'Lớp nguồn' tồn tại)
-    is_lop_nguon = master_df['Tên trường'] == 'Lớp nguồn'
-    master_df = master_df[~is_lop_nguon].copy()
-
-    # 3. Tạo cột 'Đối tượng' mới
-    is_chuyen_subject = master_df['STT'].isna()
-    
-    # Mặc định 'Đối tượng' là 'Tên trường' (ví dụ: "THPT Tây Ninh")
-    master_df['Đối tượng'] = master_df['Tên trường'] 
-    
-    # Ghi đè 'Đối tượng' cho các môn chuyên (ví dụ: "Trường chuyên Hoàng Lê Kha - Ngữ Văn")
-    master_df.loc[is_chuyen_subject, 'Đối tượng'] = master_df['Trường Gốc'] + ' - ' + master_df['Tên trường']
-    
-    # 4. Chuyển đổi 'Điểm chuẩn' sang dạng số
-    #    Thêm thay thế '' thành NaN cho cột Điểm chuẩn để đề phòng
-    master_df['Điểm chuẩn'] = master_df['Điểm chuẩn'].replace(r'^\s*$', np.nan, regex=True)
-    master_df['Điểm chuẩn'] = pd.to_numeric(master_df['Điểm chuẩn'], errors='coerce')
-    
-    # 5. Xóa các hàng không có điểm (ví dụ: hàng tiêu đề "Trường chuyên Hoàng Lê Kha")
-    master_df.dropna(subset=['Điểm chuẩn'], inplace=True)
-    
-    # 6. Chọn các cột cuối cùng (sử dụng 'Đối tượng', bỏ 'Tên trường' gốc)
-    final_cols = ['Năm học', 'Trường Gốc', 'Đối tượng', 'Điểm chuẩn', 'Chỉ tiêu', 'Ghi chú']
-    existing_cols = [col for col in final_cols if col in master_df.columns]
-    master_df = master_df[existing_cols]
-
-    # Lưu file đã xử lý (dùng làm cache)
-    master_df.to_csv(output_filename, index=False)
-    print(f"Dữ liệu Google Sheet đã được xử lý và lưu vào file '{output_filename}'")
-    
-    return True
-
-# =============================================================================
-# BƯỚC 2: HÀM VẼ BIỂU ĐỒ (Yêu cầu 2)
-# =============================================================================
-
-def plot_admission_trends(data_file, entities, filename='trend_plot.png'):
-    """
-    Vẽ biểu đồ đường cho các 'Tên trường' (entities) được chỉ định từ file dữ liệu.
-    """
-    try:
-        data = pd.read_csv(data_file)
-    except FileNotFoundError:
-        return f"Lỗi: Không tìm thấy file dữ liệu {data_file}"
-    all_years = sorted(data['Năm học'].unique())    
-    plt.figure(figsize=(12, 7))
-    filtered_data = data[data['Đối tượng'].isin(entities)]
-    
-    if filtered_data.empty:
-        plt.close()
-        return f"Không tìm thấy dữ liệu cho các Tên trường: {entities}"
-
-    filtered_data = filtered_data.sort_values('Năm học')
-    
-    for entity_name in entities:
-        entity_data = filtered_data[filtered_data['Đối tượng'] == entity_name]
-        if not entity_data.empty:
-            entity_data_indexed = entity_data.set_index('Năm học')
-            entity_scores = entity_data_indexed['Điểm chuẩn'].reindex(all_years)
-            plt.plot(all_years, entity_scores, marker='o', label=entity_name)
-
-    plt.xlabel('Năm học', fontsize=12)
-    plt.ylabel('Điểm chuẩn', fontsize=12)
-    plt.title('Xu hướng điểm chuẩn tuyển sinh qua các năm', fontsize=14, fontweight='bold')
-    plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left', title='Tên trường')
-    plt.grid(True, linestyle='--', alpha=0.6)
-    plt.xticks(rotation=45)
-    ax = plt.gca()
-    ax.yaxis.set_major_formatter(ticker.FormatStrFormatter('%.2f'))
-    plt.tight_layout(rect=[0, 0, 0.75, 1]) 
-    
-    plt.savefig(filename)
-    plt.close()
-    
-    return os.path.abspath(filename)
-
-# =============================================================================
-# BƯỚC 3, 4, 5: HÀM LOGIC CỐT LÕI (TÍNH ĐIỂM, XU HƯỚNG, ĐỀ XUẤT)
-# =============================================================================
-
-def calculate_admission_scores(diem_van, diem_toan, diem_anh, diem_tb_4nam, diem_uu_tien, mon_chuyen=None, diem_mon_chuyen=None):
-    """
-    Tính điểm xét tuyển cho cả hệ thường và hệ chuyên.
-    """
-    try:
-        diem_thi_3mon = float(diem_van) + float(diem_toan) + float(diem_anh)
-        diem_tb = float(diem_tb_4nam); uu_tien = float(diem_uu_tien)
-        diem_xet_thuong = round((diem_thi_3mon * 0.7) + (diem_tb * 0.3) + uu_tien, 2)
-    except ValueError: 
-        diem_xet_thuong = 0.0
-        
-    diem_xet_chuyen = {}
-    if mon_chuyen and diem_mon_chuyen is not None:
-        try:
-            diem_chuyen_val = float(diem_mon_chuyen)
-            diem_xet_chuyen[mon_chuyen] = round(diem_thi_3mon + (diem_chuyen_val * 2), 2)
-        except ValueError: 
-            pass # Bỏ qua nếu điểm môn chuyên không hợp lệ
-            
-    return diem_xet_thuong, diem_xet_chuyen
-
-def get_trend_slope(school_history):
-    """
-    Tính toán độ dốc (slope) của xu hướng điểm chuẩn dùng thuật toán hồi quy tuyến tính tích hợp sẵn.
-    """
-    if len(school_history) < 2: return 0
-    x = np.arange(len(school_history)); y = school_history['Điểm chuẩn'].values
-    if np.isnan(y).any(): return 0
-    try: 
-        return linregress(x, y).slope
-    except ValueError: 
-        return 0
-
-def get_safety_level(diem_xet, diem_chuan_last_year, slope):
-    """
-    Quay lại 4 vùng gốc
-    """
-    is_higher = diem_xet >= diem_chuan_last_year
-    is_trending_down = slope < -0.1 
-
-    if is_higher and is_trending_down:
-        return (1, "An toàn cao (Điểm xét cao hơn, xu hướng giảm)")
-    elif is_higher and not is_trending_down:
-        return (2, "An toàn (Điểm xét cao hơn, xu hướng tăng/ổn định)")
-    elif not is_higher and is_trending_down:
-        return (3, "Nguy cơ (Điểm xét thấp hơn, nhưng xu hướng giảm)")
-    else: # not is_higher and not is_trending_down
-        return (4, "Nguy cơ cao (Điểm xét thấp hơn, xu hướng tăng/ổn định)")
-
-def get_recommendations(data_file, diem_van, diem_toan, diem_anh, diem_tb_4nam, diem_uu_tien, mon_chuyen=None, diem_mon_chuyen=None):
-    """
-    Trả về 3 nhóm, mỗi nhóm 5 trường
-    """
-    try:
-        master_data = pd.read_csv(data_file)
-    except FileNotFoundError:
-        return {}, f"Lỗi: Không tìm thấy file dữ liệu '{data_file}'."
-        
-    diem_xet_thuong, diem_xet_chuyen = calculate_admission_scores(
-        diem_van, diem_toan, diem_anh, diem_tb_4nam, diem_uu_tien, mon_chuyen, diem_mon_chuyen
-    )
-    
-    master_data_sorted = master_data.sort_values('Năm học')
-    all_years = master_data_sorted['Năm học'].unique()
-    
-    latest_year = all_years[-1]
-    last_year_data = master_data[master_data['Năm học'] == latest_year].set_index('Đối tượng')['Điểm chuẩn']
-    
-    second_last_year_data = pd.Series(dtype=float) 
-    if len(all_years) > 1:
-        second_latest_year = all_years[-2]
-        second_last_year_data = master_data[master_data['Năm học'] == second_latest_year].set_index('Đối tượng')['Điểm chuẩn']
-
-    all_entities = master_data['Đối tượng'].unique()
-    results = []
-    
-    for entity in all_entities:
-        school_history = master_data[master_data['Đối tượng'] == entity].sort_values('Năm học')
-        
-        if entity not in last_year_data: continue 
-            
-        diem_chuan_last = last_year_data[entity]
-        
-        slope = get_trend_slope(school_history)
-        slope_str = 'Giảm' if slope < -0.1 else ('Tăng' if slope > 0.1 else 'Ổn định')
-
-        diem_chuan_second_last = second_last_year_data.get(entity)
-        
-        year_on_year_str = "" 
-        if diem_chuan_second_last is not None:
-            year_on_year_change = round(diem_chuan_last - diem_chuan_second_last, 2)
-            year_on_year_str = f" ({year_on_year_change:+.2f})"
-        else:
-            year_on_year_str = " (Mới)"
-            
-        xu_huong_final = f"{slope_str}{year_on_year_str}"
-            
-        is_chuyen = 'Trường chuyên Hoàng Lê Kha' in entity
-        diem_xet = 0
-        
-        if is_chuyen:
-            subject = entity.split(' - ')[-1]
-            if subject in diem_xet_chuyen:
-                diem_xet = diem_xet_chuyen[subject]
-            else: 
-                continue
-        else:
-            diem_xet = diem_xet_thuong
-            
-        safety_code, safety_desc = get_safety_level(diem_xet, diem_chuan_last, slope)
-        
-        chenh_lech = round(diem_xet - diem_chuan_last, 2)
-        chenh_lech_str = f"+{chenh_lech}" if chenh_lech >= 0 else f"{chenh_lech}"
-
-        results.append({
-            'Đối tượng': entity, 
-            'Điểm chuẩn năm ngoái': diem_chuan_last,
-            'Điểm xét của bạn': diem_xet,
-            'Chênh lệch': chenh_lech_str,
-            'Xu hướng điểm': xu_huong_final, 
-            'Độ an toàn (Mã)': safety_code, 
-            'Đánh giá': safety_desc
-        })
-        
-    if not results:
-        if mon_chuyen: return {}, f"Không có trường nào phù hợp với môn chuyên '{mon_chuyen}'."
-        return {}, "Không thể tính toán đề xuất."
-        
-    df_results = pd.DataFrame(results)
-    
-    # Tách thành 3 nhóm (bỏ qua Mã 4)
-    df_ma_1 = df_results[df_results['Độ an toàn (Mã)'] == 1]
-    df_ma_2 = df_results[df_results['Độ an toàn (Mã)'] == 2]
-    df_ma_3 = df_results[df_results['Độ an toàn (Mã)'] == 3]
-    
-    # --- THAY ĐỔI LOGIC CHÍNH THEO YÊU CẦU ---
-    # Sắp xếp mỗi nhóm và lấy Top 5 
-    df_ma_1 = df_ma_1.sort_values(by='Điểm chuẩn năm ngoái', ascending=False).head(5)
-    df_ma_2 = df_ma_2.sort_values(by='Điểm chuẩn năm ngoái', ascending=False).head(5)
-    df_ma_3 = df_ma_3.sort_values(by='Điểm chuẩn năm ngoái', ascending=False).head(5)
-    # --- KẾT THÚC THAY ĐỔI ---
-    for df in [df_ma_1, df_ma_2, df_ma_3]:
-        if 'Đối tượng' in df.columns:
-            df.rename(columns={'Đối tượng': 'Tên trường'}, inplace=True)
-    
-    recommendations = {
-        'an_toan_cao': df_ma_1,
-        'an_toan': df_ma_2,
-        'nguy_co_giam': df_ma_3
-    }
-    
-    return recommendations, """Cảm ơn bạn đã cung cấp thông tin. Dưới đây là đề xuất các trường phù hợp với mức điểm bạn có theo từng độ an toàn.
-    Lưu ý:
-    1.Nếu không có trường nào trong một mức độ an toàn, mục đó sẽ không được hiển thị.
-    2.Đề xuất dựa trên dữ liệu lịch sử và điểm xét của bạn, không đảm bảo trúng tuyển.
-    3.Bạn nên xem xét các mức độ an toàn khác nhau và xu hướng tăng giảm các trường cũng như độ lệch điểm chuẩn so với năm trước.
-    4.Nếu môn chuyên bạn chọn là lịch sử, hãy tham khảo nhiều nguồn khác vì môn chuyên này mới mở lớp gần đây nên dữ liệu hiện tại không đủ để đưa ra đề xuất chính xác.
-    5.Thông tin về xu hướng điểm sẽ được trình bày dưới dạng (<Xu hướng tổng quát từ 2020 tới nay> + <mức thay đổi điểm chuẩn so với năm trước>). Điều này nghĩa là xu hướng tổng quát có thể là tăng nhưng so với năm trước đó điểm đã có sự sụt giảm."""
-
-# =============================================================================
-# BƯỚC 6: HÀM TỔNG HỢP CHẠY CHATBOT (Yêu cầu 6)
-# =============================================================================
-
-def main_chatbot_function(diem_van, diem_toan, diem_anh, diem_tb_4nam, diem_uu_tien, mon_chuyen=None, diem_mon_chuyen=None):
-    """
-    Tổng hợp, mô phỏng luồng chạy của chatbot.
-    """
-    DATA_FILE = "admission_data_processed.csv"
-    
-    print(f"--- Bắt đầu tư vấn cho học sinh ---")
-    print(f"Điểm đầu vào: Văn={diem_van}, Toán={diem_toan}, Anh={diem_anh}, TB 4 năm={diem_tb_4nam}, Ưu tiên={diem_uu_tien}, Chuyên={mon_chuyen}")
-    
-    # 1. Lấy Top 5 đề xuất
-    top_5_schools, message = get_recommendations(
-        data_file=DATA_FILE,
-        diem_van=diem_van, diem_toan=diem_toan, diem_anh=diem_anh,
-        diem_tb_4nam=diem_tb_4nam, diem_uu_tien=diem_uu_tien,
-        mon_chuyen=mon_chuyen, diem_mon_chuyen=diem_mon_chuyen
-    )
-    
-    if top_5_schools.empty:
-        print(message)
-        return
-        
-    print("\n--- TOP 5 TRƯỜNG ĐỀ XUẤT ---")
-    print(message)
-    # in ra dạng bảng cho dễ đọc
-    print(top_5_schools.to_markdown(index=False)) 
-    
-    # 2. Lấy 5 tên trường từ kết quả
-    entities_to_plot = top_5_schools['Đối tượng'].tolist()
-    
-    # 3. Vẽ biểu đồ cho 5 trường này
-    print(f"\nĐang tạo biểu đồ cho 5 trường: {entities_to_plot}...")
-    plot_filename = "recommendation_plot.png"
-    plot_path = plot_admission_trends(
-        data_file=DATA_FILE,
-        entities=entities_to_plot,
-        filename=plot_filename
-    )
-    
-    print(f"--- HOÀN THÀNH ---")
-    print(f"Đã trả về Top 5 trường (ảnh trên) và biểu đồ đã được lưu tại: {plot_path}")
-
-if "__main__" == __name__:
-    # Ví dụ chạy thử
-    main_chatbot_function(
-        diem_van=8.0,
-        diem_toan=7.5,
-        diem_anh=8.5,
-        diem_tb_4nam=8.0,
-        diem_uu_tien=0.5,
-        mon_chuyen="Toán",
-        diem_mon_chuyen=9.0
-    )
-
-
-
+import pandas as pd
+import os
+import numpy as np
+import json
+import hashlib
+import mmap
+import sys
+import importlib
+import unicodedata
+import threading
+from collections import OrderedDict
+import logic_store
+from logic_metrics import span, timed, record_cache, increment
+
+# Lõi nhẹ: chỉ tính điểm và đề xuất. Phần vẽ biểu đồ (matplotlib) nằm ở logic_plot,
+# phần nạp dữ liệu Google Sheets nằm ở logic_ingest; cả hai chỉ được import khi cần.
+_LAZY_ATTRS = {
+    'plot_admission_trends': 'logic_plot',
+    'get_trend_plot': 'logic_plot',
+    'submit_trend_plot': 'logic_plot',
+    'PlotCache': 'logic_plot',
+    'process_data_from_sheets': 'logic_ingest',
+}
+
+def __getattr__(name):
+    """Giữ tương thích logic_core.plot_admission_trends, ... nhưng chỉ nạp module nặng khi dùng."""
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module 'logic_core' has no attribute '{name}'")
+    return getattr(importlib.import_module(module_name), name)
+
+# =============================================================================
+# CHỈ MỤC DỮ LIỆU TRONG BỘ NHỚ (NẠP MỘT LẦN)
+# =============================================================================
+
+class CompactDataset:
+    """
+    Dữ liệu đã xử lý ở dạng gọn: 'Đối tượng', 'Trường Gốc' và môn chuyên là mã số nguyên
+    kèm bảng tra tên, 'Năm học' là số thứ tự (0 = năm nhỏ nhất) kèm nhãn, và điểm chuẩn là
+    ma trận float dày (Đối tượng x Năm học). Lọc và căn theo năm trở thành phép lấy chỉ số nguyên.
+    Mã -1 nghĩa là trống; mã 'Đối tượng' theo thứ tự xuất hiện đầu tiên trong dữ liệu.
+    `chuyen_school`: tên trường chuyên của tỉnh (xem ProvinceConfig), dùng để nhận ra các lớp chuyên.
+    """
+
+    def __init__(self, entity, root, year, scores, chuyen_school):
+        # entity, root, year: (mã cho từng dòng, bảng tên); scores: điểm chuẩn từng dòng
+        self.chuyen_school = chuyen_school
+        self.row_entity = np.asarray(entity[0], dtype=np.int32)
+        self.row_root = np.asarray(root[0], dtype=np.int32)
+        self.row_score = np.asarray(scores, dtype=np.float64)
+        self.entity_names = np.array(entity[1], dtype=object)
+        self.root_names = list(root[1])
+        self.entity_code = {name: i for i, name in enumerate(self.entity_names)}
+
+        # Nhãn năm học sắp tăng dần, mã năm của từng dòng là vị trí trong danh sách này
+        # (file .tnds đã ghi sẵn mã theo thứ tự này: dùng thẳng mảng đọc được, không sao chép)
+        order = sorted(range(len(year[1])), key=lambda i: year[1][i])
+        self.years = [year[1][i] for i in order]
+        if order == list(range(len(order))):
+            self.row_year = np.asarray(year[0], dtype=np.int32)
+        else:
+            remap = np.empty(len(order) + 1, dtype=np.int32)
+            remap[order] = np.arange(len(order))
+            remap[-1] = -1
+            self.row_year = remap[np.asarray(year[0], dtype=np.int64)]
+        self.year_starts = year_ordinal(self.years) if self.years else np.empty(0)
+
+        # Ma trận điểm: ô (e, y) giữ điểm không trống cuối cùng của dòng (e, y) như groupby().last()
+        n_entities, n_years = len(self.entity_names), len(self.years)
+        self.scores = np.full((n_entities, n_years), np.nan)
+        rows = np.flatnonzero((self.row_entity >= 0) & (self.row_year >= 0) & ~np.isnan(self.row_score))[::-1]
+        cells, last = np.unique(self.row_entity[rows].astype(np.int64) * n_years + self.row_year[rows], return_index=True)
+        self.scores.flat[cells] = self.row_score[rows[last]]
+
+        # Môn chuyên của từng 'Đối tượng' (-1: hệ thường), xác định một lần từ tên
+        subjects = [e.split(' - ')[-1] if chuyen_school in e else None for e in self.entity_names]
+        self.subject_names = sorted({s for s in subjects if s is not None})
+        subject_code = {s: i for i, s in enumerate(self.subject_names)}
+        self.entity_subject = np.array([subject_code.get(s, -1) for s in subjects], dtype=np.int32)
+
+    @property
+    def n_rows(self):
+        return len(self.row_entity)
+
+    @classmethod
+    def from_frame(cls, master_data, chuyen_school):
+        """Mã hóa DataFrame đã xử lý (cột 'Năm học', 'Trường Gốc', 'Đối tượng', 'Điểm chuẩn')."""
+        def coded(name, **kwargs):
+            if name not in master_data.columns:
+                return np.full(len(master_data), -1, dtype=np.int32), []
+            codes, uniques = pd.factorize(master_data[name].astype(object), **kwargs)
+            return codes, list(uniques)
+
+        return cls(coded('Đối tượng'), coded('Trường Gốc'), coded('Năm học'),
+                   pd.to_numeric(master_data['Điểm chuẩn'], errors='coerce').to_numpy(dtype=float), chuyen_school)
+
+    @classmethod
+    def from_store(cls, path, chuyen_school):
+        """Đọc thẳng mã số từ file .tnds, không dựng chuỗi cho từng dòng."""
+        columns = logic_store.read_coded_columns(path)
+        n_rows = len(columns['Điểm chuẩn'])
+        empty = (np.full(n_rows, -1, dtype=np.int32), [])
+        return cls(columns['Đối tượng'], columns.get('Trường Gốc', empty), columns['Năm học'], columns['Điểm chuẩn'],
+                   chuyen_school)
+
+    @classmethod
+    def from_file(cls, data_file, chuyen_school):
+        """Đọc .tnds (định dạng chuẩn) hoặc .csv."""
+        if logic_store.is_store_path(data_file):
+            return cls.from_store(data_file, chuyen_school)
+        return cls.from_frame(pd.read_csv(data_file), chuyen_school)
+
+    def content_version(self):
+        """Băm nội dung (bảng tên, mã từng dòng, điểm) và tên trường chuyên làm phiên bản dữ liệu."""
+        digest = hashlib.sha1(json.dumps(
+            [list(map(str, self.entity_names)), list(map(str, self.root_names)), list(map(str, self.years)),
+             self.chuyen_school],
+            ensure_ascii=False).encode('utf-8'))
+        for values in (self.row_entity, self.row_root, self.row_year, self.row_score):
+            digest.update(np.ascontiguousarray(values))
+        return digest.hexdigest()[:16]
+
+    def present_in_year(self, year_code):
+        """Mảng bool theo mã 'Đối tượng': có dòng dữ liệu ở năm `year_code` (kể cả điểm trống)."""
+        present = np.zeros(len(self.entity_names), dtype=bool)
+        rows = self.row_year == year_code
+        present[self.row_entity[rows & (self.row_entity >= 0)]] = True
+        return present
+
+    def trend_slopes(self, through_year=None):
+        """
+        Độ dốc xu hướng của mọi 'Đối tượng' (theo mã) trên trục năm học thực (năm bị thiếu vẫn giữ
+        đúng khoảng cách, điểm NaN bị bỏ qua), như get_trend_slope trên lịch sử của từng đối tượng.
+        Tổng theo nhóm dùng groupby của pandas trên mã số, cùng thứ tự cộng cho mọi lần tính.
+        `through_year`: chỉ dùng các năm có mã <= through_year (như bộ dữ liệu cắt đến năm đó).
+        """
+        x = self.year_starts[self.row_year] if len(self.years) else np.empty(0)
+        y = self.row_score
+        valid = (self.row_entity >= 0) & (self.row_year >= 0) & ~np.isnan(x) & ~np.isnan(y)
+        if through_year is not None:
+            valid &= self.row_year <= through_year
+        x, y = x[valid] - (x[valid].min() if valid.any() else 0.0), y[valid]
+        sums = pd.DataFrame({
+            'e': self.row_entity[valid], 'n': np.ones(len(x)), 'x': x, 'y': y, 'xx': x * x, 'xy': x * y,
+        }).groupby('e', sort=False).sum().reindex(range(len(self.entity_names)), fill_value=0.0)
+        return _least_squares_slope(sums['n'], sums['x'], sums['y'], sums['xx'], sums['xy'])
+
+def _is_mapped(array):
+    """Mảng (hoặc view của mảng) ánh xạ từ file (np.memmap)."""
+    while isinstance(array, np.ndarray):
+        array = array.base
+    return isinstance(array, mmap.mmap)
+
+class AdmissionIndex:
+    """
+    Chỉ mục điểm chuẩn được dựng một lần từ dữ liệu đã xử lý (CompactDataset hoặc DataFrame)
+    của một tỉnh (`province`, mặc định là tỉnh mặc định).
+    Lưu sẵn cho mỗi 'Đối tượng' có mặt ở năm gần nhất: điểm chuẩn năm gần nhất,
+    năm liền trước, độ dốc xu hướng, nhãn xu hướng và môn chuyên (nếu có),
+    để mỗi lần đề xuất chỉ còn vài phép toán trên mảng.
+    """
+
+    def __init__(self, dataset, province=None):
+        self.province = province or get_province()
+        if isinstance(dataset, pd.DataFrame):
+            dataset = CompactDataset.from_frame(dataset.reset_index(drop=True), self.province.chuyen_school)
+        self.dataset = dataset
+        # Phiên bản dữ liệu = băm nội dung, dùng làm khóa cho các bộ nhớ đệm
+        self.version = dataset.content_version()
+        self.all_years = dataset.years
+
+        # Các 'Đối tượng' có mặt ở năm gần nhất, theo thứ tự xuất hiện (= thứ tự mã)
+        n_years = len(self.all_years)
+        codes = np.flatnonzero(dataset.present_in_year(n_years - 1)) if n_years else np.empty(0, dtype=np.int64)
+        self.codes = codes
+        self.entities = dataset.entity_names[codes]
+        self.last_cutoff = dataset.scores[codes, -1] if n_years else np.empty(0)
+        self.second_cutoff = dataset.scores[codes, -2] if n_years > 1 else np.full(len(codes), np.nan)
+        self.slope = dataset.trend_slopes()[codes]
+
+        slope_str = np.where(self.slope < -0.1, 'Giảm', np.where(self.slope > 0.1, 'Tăng', 'Ổn định'))
+        yoy = np.round(self.last_cutoff - self.second_cutoff, 2)
+        self.trend = np.array([
+            f"{s} (Mới)" if np.isnan(c) else f"{s} ({c:+.2f})"
+            for s, c in zip(slope_str, yoy)
+        ], dtype=object)
+
+        self.subject_code = dataset.entity_subject[codes]
+        self.is_chuyen = self.subject_code >= 0
+        subject_names = np.array(dataset.subject_names + [None], dtype=object)
+        self.subject = subject_names[self.subject_code]   # mã -1 -> None (phần tử cuối)
+
+        # Thứ tự 'Đối tượng' theo điểm chuẩn năm gần nhất giảm dần (bằng nhau thì giữ thứ tự gốc)
+        self.rank_order = np.argsort(-self.last_cutoff, kind='stable')
+        # Hạng của từng 'Đối tượng' theo thứ tự trên (hạng nhỏ hơn đứng trước)
+        self.rank = np.empty(len(codes), dtype=np.int64)
+        self.rank[self.rank_order] = np.arange(len(codes))
+
+        # Phân vùng theo (môn chuyên hoặc None cho hệ thường, xu hướng giảm hay không),
+        # mỗi vùng sắp theo điểm chuẩn năm gần nhất để tra nhóm an toàn bằng tìm kiếm nhị phân
+        is_down = self.slope < -0.1
+        present_subjects = sorted(set(self.subject_code[self.is_chuyen].tolist()))
+        self.partitions = {}
+        for code in [-1] + present_subjects:
+            members = self.subject_code == code
+            subject = None if code < 0 else dataset.subject_names[code]
+            for down in (True, False):
+                self.partitions[(subject, down)] = CutoffPartition(np.flatnonzero(members & (is_down == down)), self.last_cutoff, self.rank)
+        # Vị trí của 'Đối tượng' trong danh sách các đối tượng được xét (dùng làm index kết quả)
+        self.regular_before = np.cumsum(~self.is_chuyen) - (~self.is_chuyen)
+        self.subject_positions = {
+            dataset.subject_names[code]: np.flatnonzero(self.subject_code == code)
+            for code in present_subjects
+        }
+        self.nbytes = self._estimate_nbytes()
+
+    def _estimate_nbytes(self):
+        """
+        Dung lượng ước tính (byte): các mảng của chỉ mục và bộ dữ liệu gọn cùng bảng tên 'Đối tượng'.
+        Mảng ánh xạ từ file .tnds (memmap, dùng chung page cache) không tính vào bộ nhớ của tiến trình.
+        """
+        def size(value):
+            if isinstance(value, np.ndarray):
+                return 0 if _is_mapped(value) else value.nbytes
+            if isinstance(value, CutoffPartition):
+                return value.positions.nbytes + value.neg_cutoff.nbytes + value.ranks.nbytes
+            if isinstance(value, dict):
+                return sys.getsizeof(value) + sum(size(v) for v in value.values())
+            return 0
+        names = sum(sys.getsizeof(e) for e in self.dataset.entity_names)
+        return names + sum(size(v) for v in list(vars(self).values()) + list(vars(self.dataset).values()))
+
+    def entity_scores(self, entities):
+        """
+        (các 'Đối tượng' có dữ liệu theo thứ tự của `entities`, bỏ trùng; ma trận điểm tương ứng theo năm học).
+        """
+        known = [e for e in dict.fromkeys(entities) if e in self.dataset.entity_code]
+        return known, self.dataset.scores[[self.dataset.entity_code[e] for e in known]]
+
+    @classmethod
+    def from_csv(cls, data_file, province=None):
+        province = province or province_for_file(data_file)
+        return cls(CompactDataset.from_frame(pd.read_csv(data_file), province.chuyen_school), province)
+
+    @classmethod
+    def from_file(cls, data_file, province=None):
+        """
+        Dựng chỉ mục từ file .tnds (định dạng chuẩn) hoặc .csv. Cấu hình tỉnh mặc định là tỉnh
+        có file dữ liệu này (xem province_for_file); truyền `province` khi đọc bản tạm (staging).
+        """
+        province = province or province_for_file(data_file)
+        return cls(CompactDataset.from_file(data_file, province.chuyen_school), province)
+
+class CutoffPartition:
+    """
+    Các 'Đối tượng' của một phân vùng, sắp theo điểm chuẩn năm gần nhất giảm dần
+    (bằng nhau thì giữ thứ tự gốc, điểm chuẩn thiếu xếp cuối). Với một điểm xét, các đối tượng
+    có điểm chuẩn cao hơn là một đoạn đầu, các đối tượng "đậu" là đoạn tiếp theo.
+    """
+
+    __slots__ = ('positions', 'neg_cutoff', 'n_valid', 'ranks')
+
+    def __init__(self, positions, cutoffs, rank):
+        has_cutoff = ~np.isnan(cutoffs[positions])
+        ordered = positions[has_cutoff][np.argsort(-cutoffs[positions[has_cutoff]], kind='stable')]
+        self.positions = np.concatenate([ordered, positions[~has_cutoff]])
+        self.neg_cutoff = -cutoffs[ordered]   # tăng dần, dùng cho np.searchsorted
+        self.n_valid = len(ordered)
+        self.ranks = rank[self.positions]     # cũng tăng dần (cùng thứ tự với AdmissionIndex.rank)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _split(self, diem_xet):
+        # Số đối tượng có điểm chuẩn > diem_xet (tức -điểm chuẩn < -diem_xet)
+        return int(np.searchsorted(self.neg_cutoff, -diem_xet, side='left'))
+
+    def passing(self, diem_xet, limit):
+        """Tối đa `limit` đối tượng có điểm chuẩn <= diem_xet, điểm chuẩn cao nhất trước."""
+        start = self._split(diem_xet)
+        return self.positions[start:min(start + limit, self.n_valid)]
+
+    def segments(self, diem_xet, passing):
+        """
+        Các đoạn (vị trí, hạng) của nhóm đậu (passing=True) hoặc trượt, mỗi đoạn đã sắp theo hạng.
+        Là các lát cắt của mảng đã sắp sẵn nên không sao chép, không sắp xếp lại.
+        """
+        split = self._split(diem_xet)
+        if passing:
+            bounds = [(split, self.n_valid)]
+        else:
+            bounds = [(0, split), (self.n_valid, len(self.positions))]
+        return [(self.positions[a:b], self.ranks[a:b]) for a, b in bounds]
+
+    def failing(self, diem_xet, limit):
+        """Tối đa `limit` đối tượng có điểm chuẩn > diem_xet (hoặc thiếu điểm chuẩn), cao nhất trước."""
+        head = self.positions[:min(self._split(diem_xet), limit)]
+        if len(head) < limit:
+            head = np.concatenate([head, self.positions[self.n_valid:self.n_valid + limit - len(head)]])
+        return head
+
+class IndexCache:
+    """
+    Các chỉ mục đang nằm trong bộ nhớ, khóa theo đường dẫn tuyệt đối của file dữ liệu (mỗi tỉnh một file).
+    Giới hạn theo tổng dung lượng ước tính (AdmissionIndex.nbytes): khi vượt `max_bytes`, chỉ mục
+    ít dùng nhất bị loại và sẽ được nạp lại từ file ở lần dùng sau. Chỉ mục vừa thêm luôn được giữ.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Lấy chỉ mục và đánh dấu vừa dùng (có đếm trúng/trượt)."""
+        with self._lock:
+            index = self._items.get(key)
+            if index is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return index
+
+    def peek(self, key):
+        """Lấy chỉ mục mà không đổi thứ tự LRU và không đếm."""
+        with self._lock:
+            return self._items.get(key)
+
+    def put(self, key, index):
+        """Thêm (hoặc thay) chỉ mục; trả về danh sách khóa bị loại để giữ trong giới hạn."""
+        evicted = []
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old.nbytes
+            self._items[key] = index
+            self.total_bytes += index.nbytes
+            while self.total_bytes > self.max_bytes and len(self._items) > 1:
+                old_key, old = self._items.popitem(last=False)
+                self.total_bytes -= old.nbytes
+                self.evictions += 1
+                evicted.append(old_key)
+        for old_key in evicted:
+            increment('index_evictions')
+        return evicted
+
+    def pop(self, key, default=None):
+        with self._lock:
+            index = self._items.pop(key, None)
+            if index is None:
+                return default
+            self.total_bytes -= index.nbytes
+            return index
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.total_bytes = 0
+
+    def keys(self):
+        with self._lock:
+            return list(self._items)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._items), 'bytes': self.total_bytes, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+            }
+
+# Giới hạn bộ nhớ cho các chỉ mục đang nạp (MB), để một tiến trình phục vụ được nhiều tỉnh
+INDEX_CACHE_MB = float(os.environ.get('TN_INDEX_CACHE_MB', '256'))
+_INDEX_CACHE = IndexCache(max_bytes=int(INDEX_CACHE_MB * 1024 * 1024))
+
+def get_admission_index(data_file):
+    """
+    Trả về chỉ mục của file dữ liệu; file chỉ được đọc ở lần dùng đầu tiên
+    (hoặc lần dùng đầu tiên sau khi chỉ mục bị loại khỏi bộ nhớ đệm).
+    Ném FileNotFoundError nếu file không tồn tại.
+    """
+    key = os.path.abspath(data_file)
+    index = _INDEX_CACHE.get(key)
+    record_cache('admission_index', index is not None)
+    if index is None:
+        province = province_for_file(data_file)
+        with span('load_dataset', province=province.code) as s:
+            dataset = CompactDataset.from_file(data_file, province.chuyen_school)
+            s.rows = dataset.n_rows
+        with span('build_index') as s:
+            index = AdmissionIndex(dataset, province)
+            s.rows = len(index.entities)
+        _INDEX_CACHE.put(key, index)
+    return index
+
+def index_cache_stats():
+    """Số chỉ mục đang nạp, dung lượng ước tính, số lần trúng/trượt và số lần bị loại."""
+    return _INDEX_CACHE.stats()
+
+def set_admission_index(data_file, master_data):
+    """
+    Dựng lại chỉ mục cho file dữ liệu vừa được ghi (không cần đọc lại file).
+    """
+    with span('build_index') as s:
+        index = AdmissionIndex(master_data, province_for_file(data_file))
+        s.rows = len(index.entities)
+    replace_admission_index(data_file, index)
+    return index
+
+def replace_admission_index(data_file, index):
+    """
+    Thay chỉ mục đang phục vụ bằng chỉ mục đã dựng sẵn (một phép gán, các lượt
+    đề xuất đang chạy vẫn dùng trọn vẹn chỉ mục cũ). Trả về chỉ mục cũ (hoặc None).
+    """
+    key = os.path.abspath(data_file)
+    previous = _INDEX_CACHE.peek(key)
+    _INDEX_CACHE.put(key, index)
+    if previous is not None and previous.version != index.version:
+        _RECOMMENDATION_MEMO.discard_version(previous.version)
+    return previous
+
+class RecommendationMemo:
+    """
+    Bộ nhớ đệm LRU cho kết quả get_recommendations, khóa theo
+    (phiên bản dữ liệu, điểm xét thường, môn chuyên, điểm xét chuyên).
+    Kết quả chỉ phụ thuộc vào các giá trị này (đã làm tròn 2 chữ số), nên các học sinh
+    có cùng điểm xét dùng chung một kết quả. Giới hạn theo số mục.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def discard_version(self, version):
+        """Bỏ các kết quả của một phiên bản dữ liệu cũ (sau khi dữ liệu được làm mới)."""
+        with self._lock:
+            for key in [k for k in self._items if k[0] == version]:
+                del self._items[key]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._items),
+                    'max_entries': self.max_entries, 'hit_rate': self.hits / total if total else 0.0}
+
+_RECOMMENDATION_MEMO = RecommendationMemo()
+
+def recommendation_memo_stats():
+    """Số lượt trúng/trượt, tỉ lệ trúng và kích thước của bộ nhớ đệm đề xuất."""
+    return _RECOMMENDATION_MEMO.stats()
+
+# =============================================================================
+# BƯỚC 3, 4, 5: HÀM LOGIC CỐT LÕI (TÍNH ĐIỂM, XU HƯỚNG, ĐỀ XUẤT)
+# =============================================================================
+
+def calculate_admission_scores(diem_van, diem_toan, diem_anh, diem_tb_4nam, diem_uu_tien, mon_chuyen=None, diem_mon_chuyen=None):
+    """
+    Tính điểm xét tuyển cho cả hệ thường và hệ chuyên.
+    """
+    try:
+        diem_thi_3mon = float(diem_van) + float(diem_toan) + float(diem_anh)
+        diem_tb = float(diem_tb_4nam); uu_tien = float(diem_uu_tien)
+        diem_xet_thuong = round((diem_thi_3mon * 0.7) + (diem_tb * 0.3) + uu_tien, 2)
+    except ValueError: 
+        diem_xet_thuong = 0.0
+        
+    diem_xet_chuyen = {}
+    if mon_chuyen and diem_mon_chuyen is not None:
+        try:
+            diem_chuyen_val = float(diem_mon_chuyen)
+            diem_xet_chuyen[mon_chuyen] = round(diem_thi_3mon + (diem_chuyen_val * 2), 2)
+        except ValueError: 
+            pass # Bỏ qua nếu điểm môn chuyên không hợp lệ
+            
+    return diem_xet_thuong, diem_xet_chuyen
+
+def year_ordinal(nam_hoc):
+    """
+    Đổi cột 'Năm học' (ví dụ "2020-2021") thành số năm bắt đầu (2020) để làm trục x.
+    """
+    return pd.to_numeric(pd.Series(nam_hoc).astype(str).str.extract(r'(\d{4})')[0], errors='coerce').to_numpy(dtype=float)
+
+def _least_squares_slope(n, sum_x, sum_y, sum_xx, sum_xy):
+    """
+    Độ dốc bình phương tối thiểu từ các tổng (dạng đóng); nhóm có ít hơn 2 năm khác nhau trả về 0.
+    """
+    n = np.asarray(n, dtype=float)
+    denom = n * sum_xx - sum_x * sum_x
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (n * sum_xy - sum_x * sum_y) / denom
+    return np.where((n >= 2) & (denom > 0), slope, 0.0)
+
+def get_trend_slope(school_history):
+    """
+    Tính toán độ dốc (slope) của xu hướng điểm chuẩn cho lịch sử của một 'Đối tượng'
+    (hồi quy tuyến tính dạng đóng theo năm học).
+    """
+    if len(school_history) < 2: return 0
+    x = year_ordinal(school_history['Năm học'])
+    y = school_history['Điểm chuẩn'].to_numpy(dtype=float)
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    x, y = x[valid] - (x[valid].min() if valid.any() else 0.0), y[valid]
+    return float(_least_squares_slope(len(x), x.sum(), y.sum(), (x * x).sum(), (x * y).sum()))
+
+SAFETY_LEVELS = {
+    1: "An toàn cao (Điểm xét cao hơn, xu hướng giảm)",
+    2: "An toàn (Điểm xét cao hơn, xu hướng tăng/ổn định)",
+    3: "Nguy cơ (Điểm xét thấp hơn, nhưng xu hướng giảm)",
+    4: "Nguy cơ cao (Điểm xét thấp hơn, xu hướng tăng/ổn định)",
+}
+
+def get_safety_level(diem_xet, diem_chuan_last_year, slope):
+    """
+    Quay lại 4 vùng gốc
+    """
+    is_higher = diem_xet >= diem_chuan_last_year
+    is_trending_down = slope < -0.1 
+
+    if is_higher and is_trending_down:
+        code = 1
+    elif is_higher and not is_trending_down:
+        code = 2
+    elif not is_higher and is_trending_down:
+        code = 3
+    else: # not is_higher and not is_trending_down
+        code = 4
+    return (code, SAFETY_LEVELS[code])
+
+def _format_results(df):
+    """
+    Định dạng các cột hiển thị (chênh lệch, đánh giá) cho các dòng đã chọn.
+    """
+    df = df.copy()
+    df['Chênh lệch'] = pd.Series([f"+{c}" if c >= 0 else f"{c}" for c in df['Chênh lệch']], index=df.index, dtype=object)
+    df['Đánh giá'] = pd.Series([SAFETY_LEVELS[code] for code in df['Độ an toàn (Mã)']], index=df.index, dtype=object)
+    return df.rename(columns={'Đối tượng': 'Tên trường'})
+
+@timed('get_recommendations')
+def get_recommendations(data_file, diem_van, diem_toan, diem_anh, diem_tb_4nam, diem_uu_tien, mon_chuyen=None, diem_mon_chuyen=None):
+    """
+    Trả về 3 nhóm, mỗi nhóm 5 trường
+    Kết quả được ghi nhớ theo điểm xét (xem RecommendationMemo); mỗi lần gọi nhận bản sao riêng.
+    """
+    try:
+        index = get_admission_index(data_file)
+    except FileNotFoundError:
+        return {}, f"Lỗi: Không tìm thấy file dữ liệu '{data_file}'."
+        
+    diem_xet_thuong, diem_xet_chuyen = calculate_admission_scores(
+        diem_van, diem_toan, diem_anh, diem_tb_4nam, diem_uu_tien, mon_chuyen, diem_mon_chuyen
+    )
+
+    key = (index.version, diem_xet_thuong, mon_chuyen or None, diem_xet_chuyen.get(mon_chuyen))
+    result = _RECOMMENDATION_MEMO.get(key)
+    record_cache('recommendations', result is not None)
+    if result is None:
+        result = _recommend_from_index(index, diem_xet_thuong, diem_xet_chuyen, mon_chuyen)
+        _RECOMMENDATION_MEMO.put(key, result)
+    recommendations, message = result
+    return {group: df.copy() for group, df in recommendations.items()}, message
+
+def _group_frame(index, positions, diem_xet, code, scored, limit):
+    """
+    Dựng bảng của một nhóm an toàn từ các ứng viên (đã lấy từ nhiều phân vùng): sắp theo
+    điểm chuẩn giảm dần như sort_values ổn định trên toàn bộ đối tượng được xét, lấy `limit` dòng.
+    Index là vị trí của đối tượng trong danh sách các đối tượng được xét.
+    """
+    order = np.argsort(index.rank[positions], kind='stable')[:limit]
+    positions, diem_xet = positions[order], diem_xet[order]
+
+    labels = index.regular_before[positions].copy()
+    for subject, _ in scored[1:]:
+        labels += np.searchsorted(index.subject_positions[subject], positions, side='left')
+    return _results_frame(index, positions, diem_xet, code, pd.Index(labels, dtype='int64'))
+
+def _results_frame(index, positions, diem_xet, code, labels):
+    """Bảng kết quả (chưa định dạng) cho các 'Đối tượng' ở `positions`, theo đúng thứ tự đó."""
+    cutoff = index.last_cutoff[positions]
+    return pd.DataFrame({
+        'Đối tượng': index.entities[positions],
+        'Điểm chuẩn năm ngoái': cutoff,
+        'Điểm xét của bạn': diem_xet,
+        'Chênh lệch': np.round(diem_xet - cutoff, 2),
+        'Xu hướng điểm': index.trend[positions],
+        'Độ an toàn (Mã)': np.full(len(positions), code, dtype=int),
+    }, index=labels)
+
+def _recommend_from_index(index, diem_xet_thuong, diem_xet_chuyen, mon_chuyen):
+    """
+    Tính 3 nhóm đề xuất từ chỉ mục và điểm xét đã tính. Trả về (recommendations, message).
+    """
+    # Điểm xét cho từng phân vùng: hệ thường dùng điểm xét thường,
+    # hệ chuyên chỉ giữ lại môn chuyên mà học sinh đã chọn.
+    scored = [(None, diem_xet_thuong)] + [(s, d) for s, d in diem_xet_chuyen.items() if s in index.subject_positions]
+    if not any(len(index.partitions[(subject, down)]) for subject, _ in scored for down in (True, False)):
+        if mon_chuyen: return {}, f"Không có trường nào phù hợp với môn chuyên '{mon_chuyen}'."
+        return {}, "Không thể tính toán đề xuất."
+
+    # Mã 1: đậu + xu hướng giảm; Mã 2: đậu + không giảm; Mã 3: trượt + xu hướng giảm (bỏ qua Mã 4).
+    # Mỗi nhóm là đoạn đầu/đoạn cuối của các phân vùng đã sắp xếp: lấy tối đa 5 ở mỗi vùng rồi trộn.
+    groups = []
+    for code, down, pick in [(1, True, CutoffPartition.passing), (2, False, CutoffPartition.passing),
+                             (3, True, CutoffPartition.failing)]:
+        positions, diem_xet = [], []
+        for subject, diem in scored:
+            chosen = pick(index.partitions[(subject, down)], diem, 5)
+            positions.append(chosen)
+            diem_xet.append(np.full(len(chosen), diem, dtype=float))
+        groups.append(_group_frame(index, np.concatenate(positions), np.concatenate(diem_xet), code, scored, 5))
+
+    with span('format_results'):
+        df_ma_1, df_ma_2, df_ma_3 = [_format_results(df) for df in groups]
+    
+    recommendations = {
+        'an_toan_cao': df_ma_1,
+        'an_toan': df_ma_2,
+        'nguy_co_giam': df_ma_3
+    }
+    
+    return recommendations, """Cảm ơn bạn đã cung cấp thông tin. Dưới đây là đề xuất các trường phù hợp với mức điểm bạn có theo từng độ an toàn.
+    Lưu ý:
+    1.Nếu không có trường nào trong một mức độ an toàn, mục đó sẽ không được hiển thị.
+    2.Đề xuất dựa trên dữ liệu lịch sử và điểm xét của bạn, không đảm bảo trúng tuyển.
+    3.Bạn nên xem xét các mức độ an toàn khác nhau và xu hướng tăng giảm các trường cũng như độ lệch điểm chuẩn so với năm trước.
+    4.Nếu môn chuyên bạn chọn là lịch sử, hãy tham khảo nhiều nguồn khác vì môn chuyên này mới mở lớp gần đây nên dữ liệu hiện tại không đủ để đưa ra đề xuất chính xác.
+    5.Thông tin về xu hướng điểm sẽ được trình bày dưới dạng (<Xu hướng tổng quát từ 2020 tới nay> + <mức thay đổi điểm chuẩn so với năm trước>). Điều này nghĩa là xu hướng tổng quát có thể là tăng nhưng so với năm trước đó điểm đã có sự sụt giảm."""
+
+# =============================================================================
+# KẾT QUẢ XẾP HẠNG ĐẦY ĐỦ, CÓ PHÂN TRANG
+# =============================================================================
+
+# Như SAFETY_GROUPS của đề xuất hàng loạt, thêm nhóm 4
+RANKED_GROUPS = {1: 'an_toan_cao', 2: 'an_toan', 3: 'nguy_co_giam', 4: 'nguy_co_cao'}
+
+def _rank_threshold(segments, k, n_ranks):
+    """
+    Hạng t nhỏ nhất sao cho có ít nhất k ứng viên (trong các đoạn đã sắp theo hạng) có hạng < t.
+    Tìm nhị phân trên hạng: O(số đoạn x log² n), không phụ thuộc độ sâu của trang.
+    """
+    lo, hi = 0, n_ranks
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if sum(int(np.searchsorted(ranks, mid)) for _, ranks, _ in segments) >= k:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+def _rank_page(segments, offset, limit, n_ranks):
+    """
+    Trang [offset, offset + limit) của các ứng viên gộp từ nhiều đoạn đã sắp theo hạng.
+    segments: [(vị trí, hạng, điểm xét)]. Chỉ trang kết quả (tối đa `limit` phần tử) được sắp xếp.
+    Trả về (vị trí, điểm xét, tổng số ứng viên).
+    """
+    total = sum(len(ranks) for _, ranks, _ in segments)
+    end = min(offset + limit, total)
+    if offset >= end:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=float), total
+    start_rank = _rank_threshold(segments, offset, n_ranks) if offset > 0 else 0
+    end_rank = _rank_threshold(segments, end, n_ranks) if end < total else n_ranks
+    positions, ranks, diem_xet = [], [], []
+    for seg_positions, seg_ranks, diem in segments:
+        a, b = np.searchsorted(seg_ranks, [start_rank, end_rank])
+        positions.append(seg_positions[a:b])
+        ranks.append(seg_ranks[a:b])
+        diem_xet.append(np.full(b - a, diem, dtype=float))
+    order = np.argsort(np.concatenate(ranks))
+    return np.concatenate(positions)[order], np.concatenate(diem_xet)[order], total
+
+@timed('get_ranked_recommendations')
+def get_ranked_recommendations(data_file, diem_van, diem_toan, diem_anh, diem_tb_4nam, diem_uu_tien,
+                               mon_chuyen=None, diem_mon_chuyen=None, offset=0, limit=20, include_group_4=False):
+    """
+    Kết quả xếp hạng đầy đủ của từng nhóm an toàn (cùng thứ tự với get_recommendations),
+    lấy một trang [offset, offset + limit) của mỗi nhóm; nhóm 4 (Nguy cơ cao) chỉ có khi include_group_4.
+    Trả về ({nhóm: {'total': tổng số trường của nhóm, 'results': DataFrame của trang}}, message);
+    index của DataFrame là thứ hạng (từ 0) trong nhóm.
+    """
+    try:
+        index = get_admission_index(data_file)
+    except FileNotFoundError:
+        return {}, f"Lỗi: Không tìm thấy file dữ liệu '{data_file}'."
+    offset, limit = max(int(offset), 0), max(int(limit), 0)
+
+    diem_xet_thuong, diem_xet_chuyen = calculate_admission_scores(
+        diem_van, diem_toan, diem_anh, diem_tb_4nam, diem_uu_tien, mon_chuyen, diem_mon_chuyen
+    )
+    scored = [(None, diem_xet_thuong)] + [(s, d) for s, d in diem_xet_chuyen.items() if s in index.subject_positions]
+    if not any(len(index.partitions[(subject, down)]) for subject, _ in scored for down in (True, False)):
+        if mon_chuyen: return {}, f"Không có trường nào phù hợp với môn chuyên '{mon_chuyen}'."
+        return {}, "Không thể tính toán đề xuất."
+
+    # Mã 1: đậu + giảm; Mã 2: đậu + không giảm; Mã 3: trượt + giảm; Mã 4: trượt + không giảm
+    groups, ranges = {}, []
+    for code, down, passing in [(1, True, True), (2, False, True), (3, True, False), (4, False, False)]:
+        if code == 4 and not include_group_4:
+            continue
+        segments = [(positions, ranks, diem)
+                    for subject, diem in scored
+                    for positions, ranks in index.partitions[(subject, down)].segments(diem, passing)]
+        positions, diem_xet, total = _rank_page(segments, offset, limit, len(index.entities))
+        df = _results_frame(index, positions, diem_xet, code, pd.RangeIndex(offset, offset + len(positions)))
+        groups[RANKED_GROUPS[code]] = {'total': total, 'results': _format_results(df)}
+        # Khoảng vị trí thực sự trả về (trang cuối có thể ngắn hơn limit, hoặc rỗng nếu offset >= total)
+        shown = f"vị trí {offset + 1}-{offset + len(positions)}" if len(positions) else "không còn kết quả"
+        ranges.append(f"{RANKED_GROUPS[code]}: {shown} (tổng {total})")
+    return groups, "Kết quả theo nhóm - " + "; ".join(ranges) + "."
+
+# =============================================================================
+# DỮ LIỆU BIỂU ĐỒ XU HƯỚNG (KHÔNG VẼ, ĐỂ GIAO DIỆN TỰ VẼ BẰNG BIỂU ĐỒ GỐC)
+# =============================================================================
+
+def trend_series(index, entities):
+    """
+    Điểm chuẩn của các 'Đối tượng' trên đủ trục 'Năm học' (giống dữ liệu của biểu đồ PNG),
+    dạng gọn: {'years': [năm học...], 'series': {Đối tượng: [điểm hoặc None theo từng năm]}}.
+    Giữ thứ tự `entities`, bỏ các đối tượng không có dữ liệu; trả về None nếu không còn đối tượng nào.
+    """
+    known, values = index.entity_scores(entities)
+    if not known:
+        return None
+    values = values.tolist()
+    return {
+        'years': list(index.all_years),
+        'series': {e: [v if v == v else None for v in row] for e, row in zip(known, values)},
+    }
+
+@timed('trend_series')
+def get_trend_series(data_file, entities):
+    """
+    Phiên bản chỉ trả dữ liệu của plot_admission_trends (xem trend_series), không cần matplotlib.
+    Ném FileNotFoundError nếu file dữ liệu không tồn tại.
+    """
+    return trend_series(get_admission_index(data_file), entities)
+
+# =============================================================================
+# KIỂM TRA VÀ CHUẨN HÓA ĐẦU VÀO (dùng chung cho chatbot và xử lý hàng loạt)
+# =============================================================================
+
+MON_CHUYEN_LIST = ["Ngữ Văn", "Toán", "Vật Lý", "Hóa học", "Sinh học", "Tiếng Anh", "Tin học", "Lịch sử"]
+
+def normalize_text(s):
+    """
+    Chuẩn hóa văn bản: bỏ dấu, bỏ khoảng trắng, chuyển sang chữ thường.
+    Ví dụ: "Ngữ Văn" -> "nguvan"
+    """
+    s = str(s).lower().replace(" ", "")
+    s = ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
+    s = s.replace('đ', 'd')
+    return s
+
+# Tạo bản đồ chuẩn hóa cho môn chuyên (định nghĩa 1 lần)
+MON_CHUYEN_MAP = {normalize_text(m): m for m in MON_CHUYEN_LIST}
+NORMALIZED_MON_CHUYEN_LIST = MON_CHUYEN_MAP.keys()
+NORMALIZED_KHO_LIST = ["khong", "ko", "0"]
+
+def is_valid_score(score_str, min_val=0.0, max_val=10.0):
+    """Kiểm tra xem điểm nhập vào có hợp lệ không."""
+    try:
+        score = float(score_str)
+        if min_val <= score <= max_val: return True, score
+        else: return False, None
+    except ValueError:
+        return False, None
+
+def validate_minimum_score(score_str, subject_name):
+    """
+    Kiểm tra xem điểm môn có <= 1 không.
+    Trả về: (is_valid, score, error_message)
+    """
+    try:
+        score = float(score_str)
+        if score < 1:
+            return False, None, f"Rất tiếc, điểm môn {subject_name} < 1. Bạn không đủ điều kiện để tư vấn tuyển sinh"
+        return True, score, None
+    except ValueError:
+        return True, None, None
+
+# =============================================================================
+# CẤU HÌNH THEO TỈNH (MỖI TỈNH MỘT BỘ DỮ LIỆU RIÊNG)
+# =============================================================================
+#
+# Mỗi tỉnh có file dữ liệu, Google Sheet nguồn, tên trường chuyên và danh sách môn chuyên riêng.
+# Tây Ninh luôn có sẵn; các tỉnh khác (hoặc cấu hình đè lên Tây Ninh) khai báo trong file JSON
+# TN_PROVINCES_FILE (mặc định provinces.json), ví dụ:
+#   [{"code": "binh_duong", "name": "Bình Dương", "data_file": "admission_binh_duong.tnds",
+#     "chuyen_school": "Trường THPT chuyên Hùng Vương", "subjects": ["Toán", "Ngữ Văn", "Tiếng Anh"],
+#     "gsheet_name": "std_score_BinhDuong_highschools", "gsheet_url": "https://docs.google.com/..."}]
+# Tỉnh mặc định (khi không chỉ định): TN_PROVINCE, mặc định 'tay_ninh'.
+
+class ProvinceConfig:
+    """Cấu hình tuyển sinh của một tỉnh. subject_map: tên môn đã chuẩn hóa -> tên môn chuyên."""
+
+    FIELDS = ('code', 'name', 'data_file', 'chuyen_school', 'subjects', 'gsheet_name', 'gsheet_url')
+
+    def __init__(self, code, name, data_file, chuyen_school, subjects=None, gsheet_name=None, gsheet_url=None):
+        self.code = code
+        self.name = name
+        self.data_file = data_file
+        self.chuyen_school = chuyen_school
+        self.subjects = list(subjects or MON_CHUYEN_LIST)
+        self.subject_map = {normalize_text(m): m for m in self.subjects}
+        self.gsheet_name = gsheet_name
+        self.gsheet_url = gsheet_url
+
+    @classmethod
+    def from_dict(cls, values):
+        missing = [k for k in ('code', 'name', 'data_file', 'chuyen_school') if not values.get(k)]
+        if missing:
+            raise ValueError(f"Cấu hình tỉnh thiếu các trường {missing}.")
+        return cls(**{k: values.get(k) for k in cls.FIELDS})
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.FIELDS}
+
+DEFAULT_PROVINCE = os.environ.get('TN_PROVINCE', 'tay_ninh')
+PROVINCES_FILE = os.environ.get('TN_PROVINCES_FILE', 'provinces.json')
+PROVINCES = {
+    'tay_ninh': ProvinceConfig(
+        'tay_ninh', 'Tây Ninh', 'admission_data_processed.tnds', 'Trường chuyên Hoàng Lê Kha', MON_CHUYEN_LIST,
+        gsheet_name='std_score_TayNinh_highschools',
+        gsheet_url='https://docs.google.com/spreadsheets/d/12cEo7NO3mvH8zrhnharFGghiVgawNRNWrn1rxGCm2SE/edit?usp=sharing',
+    ),
+}
+_PROVINCES_LOADED = False
+
+def load_provinces(path=PROVINCES_FILE):
+    """
+    Đọc thêm cấu hình các tỉnh từ file JSON (danh sách các cấu hình, xem ở trên).
+    Trả về danh sách mã tỉnh đã nạp; file không tồn tại thì không làm gì.
+    """
+    global _PROVINCES_LOADED
+    _PROVINCES_LOADED = True
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        configs = [ProvinceConfig.from_dict(values) for values in json.load(f)]
+    for config in configs:
+        PROVINCES[config.code] = config
+    return [config.code for config in configs]
+
+def list_provinces():
+    if not _PROVINCES_LOADED:
+        load_provinces()
+    return list(PROVINCES.values())
+
+def get_province(code=None):
+    """Cấu hình của tỉnh `code` (None = tỉnh mặc định). Ném ValueError nếu không có tỉnh này."""
+    if not _PROVINCES_LOADED:
+        load_provinces()
+    code = code or DEFAULT_PROVINCE
+    if code not in PROVINCES:
+        raise ValueError(f"Không có cấu hình cho tỉnh '{code}'.")
+    return PROVINCES[code]
+
+def province_for_file(data_file):
+    """Tỉnh có file dữ liệu `data_file`; file không thuộc tỉnh nào dùng cấu hình của tỉnh mặc định."""
+    path = os.path.abspath(data_file)
+    for province in list_provinces():
+        if os.path.abspath(province.data_file) == path:
+            return province
+    return get_province()
+
+# =============================================================================
+# BƯỚC 5B: ĐỀ XUẤT HÀNG LOẠT CHO CẢ DANH SÁCH HỌC SINH
+# =============================================================================
+
+SAFETY_GROUPS = {1: 'an_toan_cao', 2: 'an_toan', 3: 'nguy_co_giam'}
+STUDENT_COLUMNS = ['diem_van', 'diem_toan', 'diem_anh', 'diem_tb_4nam', 'diem_uu_tien']
+
+def calculate_admission_scores_batch(students_df):
+    """
+    Phiên bản vector hóa của calculate_admission_scores cho nhiều học sinh.
+    Trả về (diem_xet_thuong, mon_chuyen, diem_xet_chuyen) dạng mảng; học sinh
+    không thi chuyên (hoặc điểm chuyên không hợp lệ) có diem_xet_chuyen = NaN.
+    """
+    n = len(students_df)
+    cols = {c: pd.to_numeric(students_df[c], errors='coerce').to_numpy(dtype=float) for c in STUDENT_COLUMNS}
+    diem_thi_3mon = cols['diem_van'] + cols['diem_toan'] + cols['diem_anh']
+    diem_xet_thuong = (diem_thi_3mon * 0.7) + (cols['diem_tb_4nam'] * 0.3) + cols['diem_uu_tien']
+    # Làm tròn giống hệt round() của Python ở đường tính từng học sinh
+    diem_xet_thuong = np.array([0.0 if np.isnan(d) else round(d, 2) for d in diem_xet_thuong.tolist()])
+
+    mon_chuyen = np.full(n, None, dtype=object)
+    diem_xet_chuyen = np.full(n, np.nan)
+    if 'mon_chuyen' in students_df.columns and 'diem_mon_chuyen' in students_df.columns:
+        mon_chuyen = students_df['mon_chuyen'].to_numpy(dtype=object)
+        diem_chuyen = pd.to_numeric(students_df['diem_mon_chuyen'], errors='coerce').to_numpy(dtype=float)
+        has_chuyen = np.array([bool(m) and not pd.isna(m) for m in mon_chuyen]) & ~np.isnan(diem_chuyen)
+        diem = diem_thi_3mon + (diem_chuyen * 2)
+        diem_xet_chuyen = np.array([round(d, 2) if ok else np.nan for d, ok in zip(diem.tolist(), has_chuyen)])
+    return diem_xet_thuong, mon_chuyen, diem_xet_chuyen
+
+@timed('get_recommendations_batch')
+def get_recommendations_batch(data_file, students_df, top_n=5):
+    """
+    Đề xuất cho cả danh sách học sinh trong một lần tính trên mảng.
+    students_df cần các cột STUDENT_COLUMNS (và tùy chọn 'mon_chuyen', 'diem_mon_chuyen').
+    Trả về một DataFrame dạng dài: mỗi dòng là một trường được đề xuất cho một học sinh,
+    với cột 'Học sinh' (nhãn index của students_df) và 'Nhóm' (khóa như get_recommendations).
+    """
+    try:
+        index = get_admission_index(data_file)
+    except FileNotFoundError:
+        return pd.DataFrame(), f"Lỗi: Không tìm thấy file dữ liệu '{data_file}'."
+
+    missing = [c for c in STUDENT_COLUMNS if c not in students_df.columns]
+    if missing:
+        return pd.DataFrame(), f"Lỗi: Thiếu các cột điểm {missing} trong danh sách học sinh."
+
+    diem_xet_thuong, mon_chuyen, diem_xet_chuyen = calculate_admission_scores_batch(students_df)
+
+    # Sắp các 'Đối tượng' theo điểm chuẩn giảm dần một lần, dùng chung cho mọi học sinh
+    order = index.rank_order
+    is_chuyen = index.is_chuyen[order]
+    last_cutoff = index.last_cutoff[order]
+    is_trending_down = index.slope[order] < -0.1
+
+    subject_codes, subjects = pd.factorize(index.subject[order])
+    student_subject = pd.Index(subjects).get_indexer(mon_chuyen)
+    student_subject[np.isnan(diem_xet_chuyen)] = -2
+
+    # Ma trận (học sinh x Đối tượng)
+    eligible = ~is_chuyen[None, :] | (subject_codes[None, :] == student_subject[:, None])
+    diem_xet = np.where(is_chuyen[None, :], diem_xet_chuyen[:, None], diem_xet_thuong[:, None])
+    is_higher = diem_xet >= last_cutoff[None, :]
+    safety_code = np.where(is_higher, np.where(is_trending_down, 1, 2), np.where(is_trending_down, 3, 4))
+    safety_code[~eligible] = 0
+
+    # Lấy top_n đầu tiên của mỗi nhóm theo thứ tự điểm chuẩn đã sắp
+    rows, cols, codes = [], [], []
+    for code in SAFETY_GROUPS:
+        in_group = safety_code == code
+        selected = in_group & (np.cumsum(in_group, axis=1) <= top_n)
+        r, c = np.nonzero(selected)
+        rows.append(r); cols.append(c); codes.append(np.full(len(r), code))
+    rows, cols, codes = np.concatenate(rows), np.concatenate(cols), np.concatenate(codes)
+    sort_idx = np.lexsort((cols, codes, rows))
+    rows, cols, codes = rows[sort_idx], cols[sort_idx], codes[sort_idx]
+
+    entity_idx = order[cols]
+    diem = diem_xet[rows, cols]
+    cutoff = last_cutoff[cols]
+    df_results = pd.DataFrame({
+        'Học sinh': students_df.index.to_numpy()[rows],
+        'Nhóm': [SAFETY_GROUPS[c] for c in codes],
+        'Đối tượng': index.entities[entity_idx],
+        'Điểm chuẩn năm ngoái': cutoff,
+        'Điểm xét của bạn': diem,
+        'Chênh lệch': np.round(diem - cutoff, 2),
+        'Xu hướng điểm': index.trend[entity_idx],
+        'Độ an toàn (Mã)': codes,
+    })
+    return _format_results(df_results), f"Đã tính đề xuất cho {len(students_df)} học sinh."
+
+# =============================================================================
+# BƯỚC 6: HÀM TỔNG HỢP CHẠY CHATBOT (Yêu cầu 6)
+# =============================================================================
+
+def main_chatbot_function(diem_van, diem_toan, diem_anh, diem_tb_4nam, diem_uu_tien, mon_chuyen=None, diem_mon_chuyen=None):
+    """
+    Tổng hợp, mô phỏng luồng chạy của chatbot.
+    """
+    DATA_FILE = get_province().data_file
+    
+    print(f"--- Bắt đầu tư vấn cho học sinh ---")
+    print(f"Điểm đầu vào: Văn={diem_van}, Toán={diem_toan}, Anh={diem_anh}, TB 4 năm={diem_tb_4nam}, Ưu tiên={diem_uu_tien}, Chuyên={mon_chuyen}")
+    
+    # 1. Lấy Top 5 đề xuất
+    top_5_schools, message = get_recommendations(
+        data_file=DATA_FILE,
+        diem_van=diem_van, diem_toan=diem_toan, diem_anh=diem_anh,
+        diem_tb_4nam=diem_tb_4nam, diem_uu_tien=diem_uu_tien,
+        mon_chuyen=mon_chuyen, diem_mon_chuyen=diem_mon_chuyen
+    )
+    
+    if top_5_schools.empty:
+        print(message)
+        return
+        
+    print("\n--- TOP 5 TRƯỜNG ĐỀ XUẤT ---")
+    print(message)
+    # in ra dạng bảng cho dễ đọc
+    print(top_5_schools.to_markdown(index=False)) 
+    
+    # 2. Lấy 5 tên trường từ kết quả
+    entities_to_plot = top_5_schools['Đối tượng'].tolist()
+    
+    # 3. Vẽ biểu đồ cho 5 trường này
+    from logic_plot import plot_admission_trends
+    print(f"\nĐang tạo biểu đồ cho 5 trường: {entities_to_plot}...")
+    plot_filename = "recommendation_plot.png"
+    plot_path = plot_admission_trends(
+        data_file=DATA_FILE,
+        entities=entities_to_plot,
+        filename=plot_filename
+    )
+    
+    print(f"--- HOÀN THÀNH ---")
+    print(f"Đã trả về Top 5 trường (ảnh trên) và biểu đồ đã được lưu tại: {plot_path}")
+
+if "__main__" == __name__:
+    # Ví dụ chạy thử
+    main_chatbot_function(
+        diem_van=8.0,
+        diem_toan=7.5,
+        diem_anh=8.5,
+        diem_tb_4nam=8.0,
+        diem_uu_tien=0.5,
+        mon_chuyen="Toán",
+        diem_mon_chuyen=9.0
+    )
@@ -0,0 +1,423 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+import pandas as pd
+import numpy as np
+import logic_core as logic
+import logic_store
+from logic_metrics import span, timed, get_logger
+
+logger = get_logger('ingest')
+
+# =============================================================================
+# BƯỚC 1: HÀM TẢI VÀ XỬ LÝ DỮ LIỆU
+# =============================================================================
+
+def process_data_from_sheets(all_dfs, output_filename="admission_data_processed.tnds"):
+    """
+    Nhận một DANH SÁCH các DataFrame (đã được đọc từ Google Sheets),
+    gộp chúng lại và xử lý.
+    """
+    if not all_dfs:
+        logger.warning("Không có dữ liệu nào được truyền để xử lý.")
+        return False
+    with span('process_data_from_sheets') as s:
+        with span('build_master_frame') as build:
+            master_df = build_master_frame(all_dfs)
+            build.rows = len(master_df)
+        save_master_frame(master_df, output_filename)
+        s.rows = len(master_df)
+    return True
+
+def build_master_frame(all_dfs):
+    """
+    Gộp và làm sạch các DataFrame thô của từng sheet thành bảng dữ liệu đã xử lý.
+    """
+    master_df = pd.concat(all_dfs, ignore_index=True)
+
+    # --- SỬA LỖI QUAN TRỌNG: CHUYỂN ĐỔI CHUỖI RỖNG THÀNH NaN ---
+    # Chuyển đổi tất cả các giá trị là chuỗi rỗng '' trong cột STT thành NaN
+    # (hoặc pd.NA) để logic isna() hoạt động chính xác.
+    master_df['STT'] = master_df['STT'].replace(r'^\s*$', np.nan, regex=True)
+    # --- KẾT THÚC SỬA LỖI ---
+
+    # 1. Tạo cột 'Trường Gốc'
+    master_df['Trường Gốc'] = master_df['Tên trường'].where(master_df['STT'].notna())
+    master_df['Trường Gốc'] = master_df['Trường Gốc'].ffill()
+    
+    # 2. LỌC BỎ "LỚP NGUỒN" NGAY BÂY GIỜ (VÌ LỚP NGUỒN ĐÃ KHÔNG CÒN MỞ)
+    #    Sử dụng cột 'Tên trường' GỐC (nơi 'Lớp nguồn' tồn tại)
+    is_lop_nguon = master_df['Tên trường'] == 'Lớp nguồn'
+    master_df = master_df[~is_lop_nguon].copy()
+
+    # 3. Tạo cột 'Đối tượng' mới
+    is_chuyen_subject = master_df['STT'].isna()
+    
+    # Mặc định 'Đối tượng' là 'Tên trường' (ví dụ: "THPT Tây Ninh")
+    master_df['Đối tượng'] = master_df['Tên trường'] 
+    
+    # Ghi đè 'Đối tượng' cho các môn chuyên (ví dụ: "Trường chuyên Hoàng Lê Kha - Ngữ Văn")
+    master_df.loc[is_chuyen_subject, 'Đối tượng'] = master_df['Trường Gốc'] + ' - ' + master_df['Tên trường']
+    
+    # 4. Chuyển đổi 'Điểm chuẩn' sang dạng số
+    #    Thêm thay thế '' thành NaN cho cột Điểm chuẩn để đề phòng
+    master_df['Điểm chuẩn'] = master_df['Điểm chuẩn'].replace(r'^\s*$', np.nan, regex=True)
+    master_df['Điểm chuẩn'] = pd.to_numeric(master_df['Điểm chuẩn'], errors='coerce')
+    
+    # 5. Xóa các hàng không có điểm (ví dụ: hàng tiêu đề "Trường chuyên Hoàng Lê Kha")
+    master_df.dropna(subset=['Điểm chuẩn'], inplace=True)
+    
+    # 6. Chọn các cột cuối cùng (sử dụng 'Đối tượng', bỏ 'Tên trường' gốc)
+    final_cols = ['Năm học', 'Trường Gốc', 'Đối tượng', 'Điểm chuẩn', 'Chỉ tiêu', 'Ghi chú']
+    existing_cols = [col for col in final_cols if col in master_df.columns]
+    return master_df[existing_cols]
+
+def save_master_frame(master_df, output_filename):
+    """
+    Lưu bảng dữ liệu đã xử lý và dựng lại chỉ mục trong bộ nhớ.
+    """
+    # Lưu file đã xử lý (dùng làm cache): .tnds là định dạng chuẩn,
+    # kèm bản CSV cùng tên để người dùng có thể mở xem
+    with span('save_dataset') as s:
+        if logic_store.is_store_path(output_filename):
+            logic_store.write_dataset(master_df, output_filename)
+            master_df.to_csv(logic_store.csv_export_path(output_filename), index=False)
+        else:
+            master_df.to_csv(output_filename, index=False)
+        s.rows = len(master_df)
+    logger.info("Dữ liệu Google Sheet đã được xử lý và lưu",
+                extra={'output_file': output_filename, 'rows': len(master_df)})
+
+    # Dựng lại chỉ mục trong bộ nhớ cho file vừa ghi
+    logic.set_admission_index(output_filename, master_df)
+
+# =============================================================================
+# GỌI API CÓ THỬ LẠI (BACKOFF) VÀ GIỚI HẠN THỜI GIAN
+# =============================================================================
+
+# Lỗi tạm thời của Google API (vượt hạn mức, lỗi máy chủ) thì thử lại; lỗi khác báo ngay
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class FetchTimeout(Exception):
+    """Quá thời hạn tải dữ liệu từ Google Sheets."""
+
+def _status_code(error):
+    """Mã HTTP của lỗi API (gspread.exceptions.APIError hoặc lỗi giả lập), None nếu không có."""
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return code
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+def _retry_after(error):
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+def call_with_retry(func, *args, deadline=None, max_retries=5, base_delay=0.5, max_delay=16.0):
+    """
+    Gọi func(*args); gặp lỗi 429/5xx thì chờ theo cấp số nhân có jitter rồi thử lại.
+    Ném FetchTimeout nếu lần chờ tiếp theo vượt quá deadline (theo time.monotonic()).
+    """
+    attempt = 0
+    while True:
+        if deadline is not None and time.monotonic() >= deadline:
+            raise FetchTimeout("Hết thời gian chờ Google Sheets.")
+        try:
+            return func(*args)
+        except Exception as e:
+            if _status_code(e) not in RETRYABLE_STATUS or attempt >= max_retries:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            delay = max(delay, _retry_after(e) or 0.0)
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise FetchTimeout(f"Hết thời gian chờ Google Sheets sau lỗi {_status_code(e)}.") from e
+            logger.warning("Google API trả lỗi tạm thời, sẽ thử lại",
+                           extra={'status': _status_code(e), 'delay_seconds': round(delay, 2), 'attempt': attempt + 1})
+            time.sleep(delay)
+            attempt += 1
+
+def fetch_concurrently(tasks, max_workers=4, deadline=None, **retry_options):
+    """
+    Chạy các lệnh tải trên một thread pool có giới hạn, mỗi lệnh có thử lại.
+    tasks: danh sách (key, func, args). Trả về dict key -> kết quả.
+    Ném FetchTimeout nếu chưa xong khi hết deadline; ném lỗi đầu tiên nếu có lệnh thất bại.
+    """
+    if not tasks:
+        return {}
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks))))
+    try:
+        futures = {
+            executor.submit(call_with_retry, func, *args, deadline=deadline, **retry_options): key
+            for key, func, args in tasks
+        }
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        done, not_done = wait(futures, timeout=timeout, return_when=FIRST_EXCEPTION)
+        for future in done:
+            if future.exception() is not None:
+                raise future.exception()
+        if not_done:
+            raise FetchTimeout(f"Hết thời gian chờ Google Sheets ({len(not_done)} lệnh tải chưa xong).")
+        return {futures[future]: future.result() for future in done}
+    finally:
+        # Không chờ các lệnh còn treo; các lệnh chưa bắt đầu bị hủy
+        executor.shutdown(wait=False, cancel_futures=True)
+
+# =============================================================================
+# ĐỌC DỮ LIỆU TỪ GOOGLE SHEETS
+# =============================================================================
+
+YEAR_PATTERN = r'(\d{4}-\d{4})'
+
+def open_spreadsheet(key_json, spreadsheet_url):
+    """
+    Xác thực bằng service account và mở spreadsheet.
+    gspread / google-auth chỉ được import ở đây, khi thật sự cần làm mới dữ liệu.
+    """
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    # Tạo credentials
+    creds = Credentials.from_service_account_info(
+        key_json,
+        scopes=["https://www.googleapis.com/auth/spreadsheets"]
+    )
+
+    # Kết nối Google Sheets
+    gc = gspread.authorize(creds)
+    logger.info("Xác thực thành công.")
+    return gc.open_by_url(spreadsheet_url)
+
+def read_year_worksheets(spreadsheet, max_workers=4, timeout=None):
+    """
+    Đọc tất cả worksheet có tên năm học (YYYY-YYYY) thành danh sách DataFrame.
+    Các sheet được tải song song trên thread pool, có thử lại khi gặp lỗi 429/5xx.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    # Lấy danh sách worksheet object THẬT
+    worksheets = fetch_concurrently([('worksheets', spreadsheet.worksheets, ())], 1, deadline)['worksheets']
+    sheet_names = [sheet.title for sheet in worksheets] # Lấy tên thật từ title
+    logger.debug("Đã tìm thấy các sheet", extra={'sheets': sheet_names})
+
+    year_sheets = []
+    for worksheet in worksheets:
+        # Chỉ xử lý các sheet có tên năm học
+        if not re.search(YEAR_PATTERN, worksheet.title):
+            logger.info("Bỏ qua sheet không chứa năm học dạng YYYY-YYYY", extra={'sheet': worksheet.title})
+            continue
+        year_sheets.append(worksheet)
+
+    # Đọc dữ liệu trực tiếp từ worksheet object bằng gspread
+    logger.info("Đang đọc các sheet năm học", extra={'sheet_count': len(year_sheets)})
+    with span('fetch_sheets') as s:
+        values = fetch_concurrently(
+            [(ws.title, ws.get_all_values, ()) for ws in year_sheets], max_workers, deadline
+        )
+        s.rows = sum(len(rows) for rows in values.values())
+
+    all_dfs = []
+    for worksheet in year_sheets:
+        df = sheet_values_to_frame(worksheet.title, values[worksheet.title])
+        if df is not None:
+            all_dfs.append(df)
+    return all_dfs
+
+def sheet_values_to_frame(sheet_name, all_data):
+    """
+    Chuyển giá trị thô của một sheet năm học thành DataFrame (None nếu không đủ dữ liệu).
+    """
+    if len(all_data) <= 5:
+        logger.warning("Bỏ qua sheet vì không đủ dữ liệu (<= 5 hàng)", extra={'sheet': sheet_name})
+        return None
+        
+    # Hàng thứ 6 (index 5) là header
+    header = all_data[5]
+    # Dữ liệu bắt đầu từ hàng thứ 7 (index 6)
+    data_rows = all_data[6:]
+    
+    # Tạo DataFrame
+    df = pd.DataFrame(data_rows, columns=header)
+    df['Năm học'] = re.search(YEAR_PATTERN, sheet_name).group(1)
+    return df
+
+# =============================================================================
+# NẠP DỮ LIỆU TĂNG DẦN (CHỈ XỬ LÝ LẠI SHEET MỚI HOẶC ĐÃ THAY ĐỔI)
+# =============================================================================
+#
+# Mỗi lần nạp, "dấu vân tay" của từng sheet (id, kích thước, băm nội dung) được lưu vào
+# file manifest cạnh file dữ liệu, rồi chỉ những sheet có nội dung khác đi mới được xử lý lại.
+# Google không cho biết sheet nào vừa bị sửa, chỉ có thời điểm sửa đổi của cả spreadsheet:
+#   - thời điểm đó không đổi: không tải gì;
+#   - thời điểm đó đổi: tải lại mọi sheet năm học (gộp nhiều sheet trong mỗi lệnh gọi
+#     values_batch_get) để bắt cả sửa đổi tại chỗ ở các năm đã qua;
+#   - không đọc được thời điểm sửa đổi (thiếu quyền Drive): chỉ tải sheet mới, sheet đổi kích thước
+#     và sheet của năm gần nhất, và tải lại toàn bộ mỗi FULL_CHECK_INTERVAL giây.
+
+FULL_CHECK_INTERVAL = 24 * 3600
+
+def manifest_path(output_filename):
+    return f"{os.path.splitext(output_filename)[0]}.manifest.json"
+
+def load_manifest(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_manifest(path, manifest):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def _spreadsheet_modified_time(spreadsheet):
+    """Thời điểm sửa đổi cuối của spreadsheet (None nếu không lấy được, ví dụ thiếu quyền Drive)."""
+    try:
+        return getattr(spreadsheet, 'lastUpdateTime', None)
+    except Exception:
+        return None
+
+def _worksheet_meta(worksheet):
+    return {'id': worksheet.id, 'rows': worksheet.row_count, 'cols': worksheet.col_count}
+
+def _content_hash(values):
+    return hashlib.sha1(json.dumps(values, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def batch_get_values(spreadsheet, titles):
+    """
+    Lấy toàn bộ giá trị của nhiều sheet trong một lệnh gọi API.
+    Các dòng được bù '' cho đủ độ rộng như worksheet.get_all_values().
+    """
+    if not titles:
+        return {}
+    ranges = ["'{}'".format(title.replace("'", "''")) for title in titles]
+    response = spreadsheet.values_batch_get(ranges)
+    values = {}
+    for title, value_range in zip(titles, response.get('valueRanges', [])):
+        rows = value_range.get('values', [])
+        width = max((len(row) for row in rows), default=0)
+        values[title] = [list(row) + [''] * (width - len(row)) for row in rows]
+    return values
+
+@timed('refresh_from_spreadsheet')
+def refresh_from_spreadsheet(spreadsheet, output_filename, full_check=False,
+                             max_workers=4, timeout=60.0, sheets_per_request=4):
+    """
+    Nạp tăng dần: chỉ tải và xử lý lại các sheet năm học mới hoặc đã thay đổi,
+    gộp vào dữ liệu đã lưu. full_check=True buộc kiểm tra nội dung mọi sheet
+    (tự bật khi spreadsheet báo đã sửa đổi, hoặc định kỳ nếu không đọc được thời điểm sửa đổi).
+    Các lệnh tải chạy song song (mỗi lệnh gộp tối đa sheets_per_request sheet) và cả
+    quá trình tải bị giới hạn trong `timeout` giây; nếu quá hạn hoặc Google API liên tục
+    báo lỗi tạm thời thì tiếp tục dùng dữ liệu đã lưu lần trước (nếu có).
+    Trả về (success, message).
+    """
+    deadline = time.monotonic() + timeout
+    try:
+        return _refresh_from_spreadsheet(
+            spreadsheet, output_filename, full_check, max_workers, deadline, sheets_per_request
+        )
+    except Exception as e:
+        if not isinstance(e, FetchTimeout) and _status_code(e) not in RETRYABLE_STATUS:
+            raise
+        if os.path.exists(output_filename):
+            logger.warning("Không tải được dữ liệu mới, dùng lại dữ liệu đã lưu",
+                           extra={'error': str(e), 'output_file': output_filename})
+            return True, "Không tải kịp dữ liệu mới từ Google Sheet, đang dùng dữ liệu đã lưu lần trước."
+        return False, f"Lỗi: Không tải được dữ liệu từ Google Sheet trong thời hạn cho phép ({e})."
+
+def _refresh_from_spreadsheet(spreadsheet, output_filename, full_check, max_workers, deadline, sheets_per_request):
+    manifest_file = manifest_path(output_filename)
+    manifest = load_manifest(manifest_file) if os.path.exists(output_filename) else {}
+    old_sheets = manifest.get('sheets', {})
+
+    worksheets = []
+    listed = fetch_concurrently([('worksheets', spreadsheet.worksheets, ())], 1, deadline)['worksheets']
+    for worksheet in listed:
+        if re.search(YEAR_PATTERN, worksheet.title):
+            worksheets.append(worksheet)
+        else:
+            logger.info("Bỏ qua sheet không chứa năm học dạng YYYY-YYYY", extra={'sheet': worksheet.title})
+    if not worksheets:
+        return False, "Không tìm thấy hoặc không đọc được sheet nào có tên chứa năm học hợp lệ (YYYY-YYYY) trong Google Sheet."
+
+    titles = [ws.title for ws in worksheets]
+    metas = {ws.title: _worksheet_meta(ws) for ws in worksheets}
+    modified = _spreadsheet_modified_time(spreadsheet)
+    same_layout = set(titles) == set(old_sheets) and all(
+        {k: old_sheets[t].get(k) for k in metas[t]} == metas[t] for t in titles
+    )
+    if not full_check and same_layout and modified is not None and modified == manifest.get('modified'):
+        logger.info("Google Sheet không thay đổi kể từ lần nạp trước.")
+        return True, "Dữ liệu Google Sheet không thay đổi và sẵn sàng tư vấn."
+
+    now = time.time()
+    if modified is not None:
+        full_check = full_check or modified != manifest.get('modified')
+    else:
+        full_check = full_check or now - manifest.get('full_checked_at', 0) >= FULL_CHECK_INTERVAL
+    year_of = {t: re.search(YEAR_PATTERN, t).group(1) for t in titles}
+    latest_title = max(titles, key=lambda t: year_of[t])
+    candidates = [
+        t for t in titles
+        if full_check or t == latest_title or t not in old_sheets
+        or {k: old_sheets[t].get(k) for k in metas[t]} != metas[t]
+    ]
+    groups = [candidates[i:i + sheets_per_request] for i in range(0, len(candidates), sheets_per_request)]
+    with span('fetch_sheets') as s:
+        batches = fetch_concurrently(
+            [(i, batch_get_values, (spreadsheet, group)) for i, group in enumerate(groups)], max_workers, deadline
+        )
+        s.rows = sum(len(rows) for batch in batches.values() for rows in batch.values())
+    values = {}
+    for batch in batches.values():
+        values.update(batch)
+    missing = [t for t in candidates if t not in values]
+    if missing:
+        # Câu trả lời thiếu sheet: coi như tải thất bại, giữ nguyên dữ liệu và manifest cũ
+        logger.warning("Google Sheet không trả về dữ liệu của một số sheet", extra={'sheets': missing})
+        return False, f"Lỗi: Google Sheet không trả về dữ liệu của các sheet {missing}."
+
+    new_sheets = {t: dict(old_sheets[t]) for t in titles if t in old_sheets}
+    changed = []
+    for title in candidates:
+        content_hash = _content_hash(values[title])
+        if old_sheets.get(title, {}).get('hash') != content_hash:
+            changed.append(title)
+        new_sheets[title] = {**metas[title], 'hash': content_hash}
+    removed = [t for t in old_sheets if t not in metas]
+    logger.info("Kết quả so sánh sheet với lần nạp trước",
+                extra={'changed': changed, 'removed': removed, 'unchanged': len(titles) - len(changed)})
+
+    if changed or removed:
+        frames = [df for df in (sheet_values_to_frame(t, values[t]) for t in changed) if df is not None]
+        replaced_years = {year_of[t] for t in changed} | {re.search(YEAR_PATTERN, t).group(1) for t in removed}
+        parts = []
+        if old_sheets and os.path.exists(output_filename):
+            stored = logic_store.load_frame(output_filename)
+            parts.append(stored[~stored['Năm học'].isin(replaced_years)])
+        if frames:
+            parts.append(build_master_frame(frames))
+        if not parts:
+            return False, "Xử lý dữ liệu từ Google Sheet thất bại."
+        master_df = pd.concat(parts, ignore_index=True)
+
+        # Giữ thứ tự năm học như thứ tự sheet trong spreadsheet
+        sheet_order = {year_of[t]: i for i, t in enumerate(titles)}
+        master_df = master_df.sort_values('Năm học', key=lambda s: s.map(sheet_order), kind='stable')
+        master_df = master_df.reset_index(drop=True)
+        if master_df.empty:
+            return False, "Xử lý dữ liệu từ Google Sheet thất bại."
+        save_master_frame(master_df, output_filename)
+
+    save_manifest(manifest_file, {'modified': modified, 'sheets': new_sheets,
+                                  'full_checked_at': now if full_check else manifest.get('full_checked_at', 0)})
+    if not changed and not removed:
+        return True, "Dữ liệu Google Sheet không thay đổi và sẵn sàng tư vấn."
+    return True, f"Dữ liệu Google Sheet đã được cập nhật ({len(changed)} sheet mới/thay đổi) và sẵn sàng tư vấn."
@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+
+# =============================================================================
+# ĐO THỜI GIAN TỪNG BƯỚC (SPAN) VÀ XUẤT SỐ LIỆU
+# =============================================================================
+#
+# Dùng:
+#     with span('get_recommendations') as s:
+#         ...
+#         s.rows = len(index.entities)
+#     increment('cache_requests', cache='plot', result='hit')
+# Số liệu nằm trong một bộ đăng ký trong tiến trình (thread-safe), xuất ra dạng văn bản
+# Prometheus (write_prometheus) hoặc bản tóm tắt JSON (write_json).
+
+METRIC_PREFIX = 'tn_stdscore'
+# Ngưỡng (giây) của histogram thời gian, đủ rộng từ lượt đề xuất (ms) đến nạp Google Sheets (phút)
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0)
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+class MetricsRegistry:
+    """Thời gian (histogram), số dòng xử lý và bộ đếm theo tên bước + nhãn."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._durations = {}
+        self._rows = {}
+        self._counters = {}
+
+    def observe(self, stage, seconds, rows=None, **labels):
+        key = (stage, _label_key(labels))
+        with self._lock:
+            stats = self._durations.get(key)
+            if stats is None:
+                stats = {'count': 0, 'sum': 0.0, 'min': seconds, 'max': seconds,
+                         'buckets': [0] * len(self.buckets)}
+                self._durations[key] = stats
+            stats['count'] += 1
+            stats['sum'] += seconds
+            stats['min'] = min(stats['min'], seconds)
+            stats['max'] = max(stats['max'], seconds)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    stats['buckets'][i] += 1
+            if rows is not None:
+                self._rows[key] = self._rows.get(key, 0) + int(rows)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._rows.clear()
+            self._counters.clear()
+
+    def summary(self):
+        """Bản tóm tắt dạng dict (dùng cho JSON)."""
+        with self._lock:
+            stages = []
+            for (stage, labels), stats in sorted(self._durations.items()):
+                stages.append({
+                    'stage': stage, 'labels': dict(labels), 'count': stats['count'],
+                    'total_seconds': stats['sum'], 'mean_seconds': stats['sum'] / stats['count'],
+                    'min_seconds': stats['min'], 'max_seconds': stats['max'],
+                    'rows': self._rows.get((stage, labels)),
+                })
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self._counters.items())]
+        return {'generated_at': time.time(), 'stages': stages, 'counters': counters}
+
+    def to_prometheus(self):
+        """Văn bản theo định dạng exposition của Prometheus."""
+        def fmt_labels(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ''
+            escaped = (k + '="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+                       for k, v in items)
+            return '{' + ','.join(escaped) + '}'
+
+        duration_name = f"{METRIC_PREFIX}_stage_duration_seconds"
+        rows_name = f"{METRIC_PREFIX}_stage_rows_total"
+        lines = [f"# HELP {duration_name} Thời gian của từng bước xử lý.",
+                 f"# TYPE {duration_name} histogram"]
+        with self._lock:
+            for (stage, labels), stats in sorted(self._durations.items()):
+                base = (('stage', stage),) + labels
+                for bound, count in zip(self.buckets, stats['buckets']):
+                    lines.append(f"{duration_name}_bucket{fmt_labels(base, [('le', bound)])} {count}")
+                lines.append(f"{duration_name}_bucket{fmt_labels(base, [('le', '+Inf')])} {stats['count']}")
+                lines.append(f"{duration_name}_sum{fmt_labels(base)} {stats['sum']:.6f}")
+                lines.append(f"{duration_name}_count{fmt_labels(base)} {stats['count']}")
+            lines += [f"# HELP {rows_name} Số dòng dữ liệu mà từng bước đã xử lý.",
+                      f"# TYPE {rows_name} counter"]
+            for (stage, labels), rows in sorted(self._rows.items()):
+                lines.append(f"{rows_name}{fmt_labels((('stage', stage),) + labels)} {rows}")
+            declared = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                full_name = f"{METRIC_PREFIX}_{name}_total"
+                if full_name not in declared:
+                    lines.append(f"# TYPE {full_name} counter")
+                    declared.add(full_name)
+                lines.append(f"{full_name}{fmt_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+class Span:
+    """Một bước đang được đo; gán .rows để ghi số dòng đã xử lý."""
+
+    __slots__ = ('stage', 'labels', 'rows', 'start', 'seconds')
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+        self.rows = None
+        self.start = time.perf_counter()
+        self.seconds = None
+
+@contextmanager
+def span(stage, registry=None, **labels):
+    """Đo thời gian khối lệnh bên trong (kể cả khi có lỗi, với nhãn error=<tên lỗi>)."""
+    current = Span(stage, labels)
+    try:
+        yield current
+    except BaseException as e:
+        current.labels = dict(labels, error=type(e).__name__)
+        raise
+    finally:
+        current.seconds = time.perf_counter() - current.start
+        (registry or REGISTRY).observe(stage, current.seconds, current.rows, **current.labels)
+
+def timed(stage):
+    """Decorator: đo mỗi lần gọi hàm như một span."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def increment(name, value=1, **labels):
+    REGISTRY.increment(name, value, **labels)
+
+def record_cache(cache, hit):
+    """Đếm một lượt tra bộ nhớ đệm (cache_requests_total{cache=..., result=hit|miss})."""
+    REGISTRY.increment('cache_requests', cache=cache, result='hit' if hit else 'miss')
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def write_prometheus(path, registry=None):
+    """Ghi file văn bản Prometheus (dùng được với textfile collector của node_exporter)."""
+    _write_atomic(path, (registry or REGISTRY).to_prometheus())
+
+def write_json(path, registry=None):
+    _write_atomic(path, json.dumps((registry or REGISTRY).summary(), ensure_ascii=False, indent=2))
+
+_last_export = 0.0
+
+def export_periodically(directory, min_interval=15.0):
+    """
+    Ghi metrics.prom và metrics.json vào `directory`, tối đa một lần mỗi min_interval giây
+    (gọi ở cuối mỗi lượt chạy app mà không làm chậm lượt đó).
+    """
+    global _last_export
+    now = time.monotonic()
+    if not directory or now - _last_export < min_interval:
+        return False
+    _last_export = now
+    os.makedirs(directory, exist_ok=True)
+    write_prometheus(os.path.join(directory, 'metrics.prom'))
+    write_json(os.path.join(directory, 'metrics.json'))
+    return True
+
+# =============================================================================
+# GHI LOG CÓ CẤU TRÚC (THAY CHO print)
+# =============================================================================
+
+class KeyValueFormatter(logging.Formatter):
+    """Một dòng mỗi sự kiện: thời điểm, mức, logger, thông điệp và các trường thêm dạng khóa=giá trị."""
+
+    _RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        fields = {k: v for k, v in vars(record).items() if k not in self._RESERVED}
+        line = (f"{self.formatTime(record, '%Y-%m-%dT%H:%M:%S')} level={record.levelname} "
+                f"logger={record.name} msg={json.dumps(record.getMessage(), ensure_ascii=False)}")
+        for key, value in fields.items():
+            line += f" {key}={json.dumps(value, ensure_ascii=False, default=str)}"
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+_logging_configured = False
+
+def get_logger(name):
+    """
+    Logger của ứng dụng (tên 'tn_stdscore.<name>'). Mức log lấy từ biến môi trường
+    TN_LOG_LEVEL (mặc định INFO). Thông tin thêm truyền qua extra={...}.
+    """
+    global _logging_configured
+    root = logging.getLogger(METRIC_PREFIX)
+    if not _logging_configured:
+        _logging_configured = True
+        if not root.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(KeyValueFormatter())
+            root.addHandler(handler)
+        root.setLevel(os.environ.get('TN_LOG_LEVEL', 'INFO').upper())
+        root.propagate = False
+    return root.getChild(name)
@@ -0,0 +1,215 @@
+import os
+import io
+import time
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, BrokenExecutor
+# API hướng đối tượng (Figure + canvas Agg): mỗi biểu đồ có Figure riêng, không dùng trạng thái
+# toàn cục của pyplot nên vẽ được trên nhiều luồng cùng lúc
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import matplotlib.ticker as ticker
+import logic_core as logic
+from logic_metrics import REGISTRY, timed, record_cache, get_logger
+
+logger = get_logger('plot')
+
+PLOT_DIR = os.path.join(tempfile.gettempdir(), 'tn_stdscore_plots')
+# Số biểu đồ vẽ song song; 'process' dùng nhiều nhân CPU thật (tốn thêm thời gian khởi động tiến trình),
+# 'thread' (mặc định) nhẹ hơn và đủ để không chặn luồng trả lời
+PLOT_WORKERS = int(os.environ.get('TN_PLOT_WORKERS', '3'))
+PLOT_EXECUTOR = os.environ.get('TN_PLOT_EXECUTOR', 'thread')
+
+# =============================================================================
+# BƯỚC 2: HÀM VẼ BIỂU ĐỒ (Yêu cầu 2)
+# =============================================================================
+
+class PlotCache:
+    """
+    Bộ nhớ đệm LRU cho ảnh PNG biểu đồ, khóa theo (các 'Đối tượng' theo thứ tự vẽ, phiên bản dữ liệu).
+    Giới hạn theo tổng số byte; ảnh ít dùng nhất bị loại trước.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            png = self._items.get(key)
+            if png is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return png
+
+    def put(self, key, png):
+        with self._lock:
+            if key in self._items:
+                self.total_bytes -= len(self._items.pop(key))
+            if len(png) > self.max_bytes:
+                return
+            self._items[key] = png
+            self.total_bytes += len(png)
+            while self.total_bytes > self.max_bytes:
+                _, old = self._items.popitem(last=False)
+                self.total_bytes -= len(old)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.total_bytes = 0
+
+_PLOT_CACHE = PlotCache()
+
+def render_trend_png(years, names, values):
+    """
+    Vẽ biểu đồ đường (mỗi dòng của `values` ứng với một tên trong `names`, theo các năm `years`)
+    và trả về nội dung PNG (bytes). Chỉ nhận dữ liệu thuần nên chạy được ở tiến trình khác.
+    """
+    fig = Figure(figsize=(12, 7))
+    ax = fig.add_subplot()
+    for name, scores in zip(names, values):
+        ax.plot(years, scores, marker='o', label=name)
+
+    ax.set_xlabel('Năm học', fontsize=12)
+    ax.set_ylabel('Điểm chuẩn', fontsize=12)
+    ax.set_title('Xu hướng điểm chuẩn tuyển sinh qua các năm', fontsize=14, fontweight='bold')
+    ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left', title='Tên trường')
+    ax.grid(True, linestyle='--', alpha=0.6)
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.yaxis.set_major_formatter(ticker.FormatStrFormatter('%.2f'))
+    fig.tight_layout(rect=[0, 0, 0.75, 1])
+
+    buffer = io.BytesIO()
+    FigureCanvasAgg(fig).print_png(buffer)
+    return buffer.getvalue()
+
+# =============================================================================
+# VẼ NỀN SONG SONG (bảng được hiển thị trước, ảnh được điền vào khi vẽ xong)
+# =============================================================================
+
+_RENDER_POOL = None
+_PENDING = {}   # khóa biểu đồ -> Future đang vẽ (các yêu cầu trùng nhau dùng chung một lần vẽ)
+_POOL_LOCK = threading.Lock()
+
+def _render_pool():
+    global _RENDER_POOL
+    with _POOL_LOCK:
+        if _RENDER_POOL is None:
+            if PLOT_EXECUTOR == 'process':
+                # 'spawn': tiến trình con không thừa hưởng các luồng đang chạy của tiến trình chính
+                _RENDER_POOL = ProcessPoolExecutor(max_workers=PLOT_WORKERS,
+                                                   mp_context=multiprocessing.get_context('spawn'))
+            else:
+                _RENDER_POOL = ThreadPoolExecutor(max_workers=PLOT_WORKERS, thread_name_prefix='plot-render')
+        return _RENDER_POOL
+
+def _plot_key(index, entities):
+    """
+    Khóa bộ nhớ đệm: (các 'Đối tượng' có dữ liệu theo thứ tự của `entities`, bỏ trùng; phiên bản dữ liệu),
+    hoặc None. Thứ tự quyết định màu và chú thích của từng đường nên là một phần của khóa.
+    """
+    found = tuple(e for e in dict.fromkeys(entities) if e in index.dataset.entity_code)
+    return (found, index.version) if found else None
+
+def _discard_pool(pool):
+    global _RENDER_POOL
+    with _POOL_LOCK:
+        if _RENDER_POOL is pool:
+            _RENDER_POOL = None
+    pool.shutdown(wait=False)
+
+def submit_trend_plot(data_file, entities):
+    """
+    Bắt đầu vẽ biểu đồ xu hướng của các 'Đối tượng' ở nền, trả về ngay một Future (kết quả là bytes PNG).
+    Ảnh đã có trong bộ nhớ đệm trả về Future đã xong; trả về None nếu không có dữ liệu cho các 'Đối tượng' này.
+    Ném FileNotFoundError nếu file dữ liệu không tồn tại.
+    """
+    index = logic.get_admission_index(data_file)
+    key = _plot_key(index, entities)
+    if key is None:
+        return None
+
+    png = _PLOT_CACHE.get(key)
+    record_cache('plot', png is not None)
+    if png is not None:
+        future = Future()
+        future.set_result(png)
+        return future
+
+    found, values = index.entity_scores(key[0])
+    pool = _render_pool()
+    started = time.perf_counter()
+    with _POOL_LOCK:
+        future = _PENDING.get(key)
+        if future is not None:
+            return future
+        future = pool.submit(render_trend_png, list(index.all_years), found, values)
+        _PENDING[key] = future
+
+    def finished(done):
+        with _POOL_LOCK:
+            _PENDING.pop(key, None)
+        seconds = time.perf_counter() - started
+        if isinstance(done.exception(), BrokenExecutor):
+            _discard_pool(pool)   # tiến trình vẽ bị dừng đột ngột: lần sau dựng pool mới
+        if done.cancelled() or done.exception() is not None:
+            REGISTRY.observe('render_plot', seconds, len(found), error='render_failed')
+            logger.warning("Lỗi khi vẽ biểu đồ", extra={'entities': len(found),
+                                                        'error': 'cancelled' if done.cancelled() else repr(done.exception())})
+            return
+        REGISTRY.observe('render_plot', seconds, len(found))
+        _PLOT_CACHE.put(key, done.result())
+
+    future.add_done_callback(finished)
+    return future
+
+def get_trend_plot(data_file, entities, as_path=False):
+    """
+    Trả về biểu đồ xu hướng của các 'Đối tượng' (bytes PNG, hoặc đường dẫn file nếu as_path=True).
+    Ảnh được lưu đệm theo nội dung nên các biểu đồ trùng nhau không phải vẽ lại,
+    và mỗi nội dung có một file riêng nên các phiên chạy song song không ghi đè lên nhau.
+    Trả về None nếu không có dữ liệu cho các 'Đối tượng' này.
+    """
+    future = submit_trend_plot(data_file, entities)
+    if future is None:
+        return None
+    png = future.result()
+    if not as_path:
+        return png
+
+    key = _plot_key(logic.get_admission_index(data_file), entities)
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+    path = os.path.join(PLOT_DIR, f"trend_{digest}.png")
+    if not os.path.exists(path):
+        os.makedirs(PLOT_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(png)
+        os.replace(tmp_path, path)
+    return path
+
+@timed('plot_admission_trends')
+def plot_admission_trends(data_file, entities, filename='trend_plot.png'):
+    """
+    Vẽ biểu đồ đường cho các 'Tên trường' (entities) được chỉ định từ file dữ liệu.
+    """
+    try:
+        png = get_trend_plot(data_file, entities)
+    except FileNotFoundError:
+        return f"Lỗi: Không tìm thấy file dữ liệu {data_file}"
+    if png is None:
+        return f"Không tìm thấy dữ liệu cho các Tên trường: {entities}"
+
+    with open(filename, 'wb') as f:
+        f.write(png)
+    return os.path.abspath(filename)
@@ -0,0 +1,170 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import logic_core as logic
+from logic_metrics import span, timed
+
+# =============================================================================
+# XÁC SUẤT ĐẬU (MÔ PHỎNG MONTE CARLO ĐIỂM CHUẨN NĂM TỚI)
+# =============================================================================
+#
+# Với mỗi 'Đối tượng', điểm chuẩn năm tới được dự báo từ lịch sử của chính nó: đường xu hướng
+# tuyến tính theo năm học (bình phương tối thiểu) cộng độ phân tán của phần dư quanh đường đó
+# (đối tượng có ít hơn 3 năm dùng độ phân tán gộp của cả bộ dữ liệu). Các mẫu điểm chuẩn của mọi
+# đối tượng được rút một lần cho mỗi phiên bản dữ liệu (ma trận số mẫu x Đối tượng, có hạt giống cố định
+# nên kết quả lặp lại được) rồi sắp tăng dần theo từng đối tượng; mỗi lượt tư vấn chỉ còn đếm số mẫu
+# <= điểm xét của mọi đối tượng bằng một lần np.searchsorted.
+
+MC_SAMPLES = int(os.environ.get('TN_MC_SAMPLES', '2000'))
+MC_SEED = 2024
+MIN_SPREAD = 0.1        # Độ lệch dự báo tối thiểu (điểm), tránh xác suất 0/1 tuyệt đối khi lịch sử quá đều
+DEFAULT_SPREAD = 1.0    # Dùng khi không đối tượng nào có đủ 3 năm để ước lượng độ phân tán
+MAX_CACHED_FORECASTS = 4
+
+class CutoffForecast:
+    """
+    Dự báo điểm chuẩn năm học kế tiếp cho các 'Đối tượng' của chỉ mục (cùng thứ tự index.entities):
+    mean (điểm chuẩn dự báo), spread (độ lệch chuẩn của dự báo) và n_samples mẫu điểm chuẩn của mỗi
+    đối tượng. Đối tượng không có điểm chuẩn nào có mean = NaN.
+    """
+
+    def __init__(self, index, n_samples=MC_SAMPLES, seed=MC_SEED):
+        history = index.dataset.scores[index.codes]
+        years = index.dataset.year_starts
+        valid = ~np.isnan(history) & ~np.isnan(years)[None, :]
+        origin = np.nanmin(years) if len(years) and not np.isnan(years).all() else 0.0
+        x = np.where(valid, years[None, :] - origin, 0.0)
+        y = np.where(valid, history, 0.0)
+
+        n = valid.sum(axis=1).astype(float)
+        sum_x, sum_y = x.sum(axis=1), y.sum(axis=1)
+        slope = logic._least_squares_slope(n, sum_x, sum_y, (x * x).sum(axis=1), (x * y).sum(axis=1))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_x, mean_y = sum_x / n, sum_y / n
+        intercept = mean_y - slope * mean_x
+
+        # Độ phân tán của phần dư (bậc tự do n - 2); đối tượng ít năm dùng độ phân tán gộp
+        residuals = np.where(valid, y - (intercept[:, None] + slope[:, None] * x), 0.0)
+        sse = (residuals * residuals).sum(axis=1)
+        dof = n - 2
+        fitted = dof > 0
+        pooled = np.sqrt(sse[fitted].sum() / dof[fitted].sum()) if fitted.any() else DEFAULT_SPREAD
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sigma = np.where(fitted, np.sqrt(sse / dof), pooled)
+        sigma = np.maximum(sigma, MIN_SPREAD)
+
+        # Sai số dự báo tại năm kế tiếp gồm cả sai số của đường xu hướng (xa tâm dữ liệu thì lớn hơn)
+        target = (np.nanmax(years) - origin + 1) if len(years) else 0.0
+        centered_xx = (x * x).sum(axis=1) - n * np.nan_to_num(mean_x) ** 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            leverage = np.where(centered_xx > 0, (target - mean_x) ** 2 / centered_xx, 0.0)
+            self.spread = sigma * np.sqrt(1 + 1 / n + leverage)
+        self.mean = np.where(n > 0, intercept + slope * target, np.nan)
+        self.spread[n == 0] = np.nan
+
+        rng = np.random.default_rng(seed)
+        self.n_samples = n_samples
+        samples = self.mean + self.spread * rng.standard_normal((n_samples, len(self.mean)))
+        samples = np.sort(np.nan_to_num(samples.T, nan=0.0), axis=1)
+
+        # Nối mẫu đã sắp của mọi đối tượng thành một dãy tăng dần: đối tượng k nằm trong
+        # [k x _offset, (k + 1) x _offset) nên một lần searchsorted đếm được cho tất cả
+        self._low = samples.min() if samples.size else 0.0
+        self._offset = (samples.max() - self._low + 2) if samples.size else 1.0
+        self._keys = (samples - self._low + self._offset * np.arange(len(self.mean))[:, None]).ravel()
+        self.nbytes = self._keys.nbytes + self.mean.nbytes + self.spread.nbytes
+
+    def probabilities(self, positions, diem):
+        """Tỉ lệ mẫu điểm chuẩn <= `diem` của các đối tượng ở `positions` (NaN nếu đối tượng không có dự báo)."""
+        positions = np.asarray(positions, dtype=np.int64)
+        shifted = np.clip(np.asarray(diem, dtype=float) - self._low, -1.0, self._offset - 1.0)
+        counts = np.searchsorted(self._keys, shifted + self._offset * positions, side='right') - positions * self.n_samples
+        probability = counts / self.n_samples
+        probability[np.isnan(self.mean[positions])] = np.nan
+        return probability
+
+_FORECASTS = OrderedDict()
+_FORECAST_LOCK = threading.Lock()
+
+def get_forecast(index, n_samples=MC_SAMPLES, seed=MC_SEED):
+    """Dự báo của chỉ mục (dựng một lần cho mỗi phiên bản dữ liệu, giữ tối đa MAX_CACHED_FORECASTS bản)."""
+    key = (index.version, n_samples, seed)
+    with _FORECAST_LOCK:
+        forecast = _FORECASTS.get(key)
+        if forecast is not None:
+            _FORECASTS.move_to_end(key)
+            return forecast
+    with span('build_forecast') as s:
+        forecast = CutoffForecast(index, n_samples, seed)
+        s.rows = len(forecast.mean)
+    with _FORECAST_LOCK:
+        _FORECASTS[key] = forecast
+        while len(_FORECASTS) > MAX_CACHED_FORECASTS:
+            _FORECASTS.popitem(last=False)
+    return forecast
+
+def admission_probabilities(index, diem_xet_thuong, diem_xet_chuyen=None, mon_chuyen=None,
+                            n_samples=MC_SAMPLES, seed=MC_SEED):
+    """
+    Xác suất điểm chuẩn năm tới <= điểm xét cho các 'Đối tượng' được xét (hệ thường, và các lớp
+    của môn chuyên `mon_chuyen` nếu có điểm xét chuyên). Trả về (vị trí trong chỉ mục, xác suất, dự báo).
+    """
+    forecast = get_forecast(index, n_samples, seed)
+    has_chuyen = bool(mon_chuyen) and diem_xet_chuyen is not None
+    eligible = ~index.is_chuyen | ((index.subject == mon_chuyen) if has_chuyen else False)
+    diem = np.where(index.is_chuyen, diem_xet_chuyen if has_chuyen else np.nan, diem_xet_thuong)
+
+    positions = np.flatnonzero(eligible)
+    return positions, forecast.probabilities(positions, diem[positions]), forecast
+
+@timed('admission_probabilities')
+def get_admission_probabilities(data_file, diem_van, diem_toan, diem_anh, diem_tb_4nam, diem_uu_tien,
+                                mon_chuyen=None, diem_mon_chuyen=None, n_samples=MC_SAMPLES, seed=MC_SEED):
+    """
+    Xác suất đậu ước tính cho mọi trường được xét, cao nhất trước (bằng nhau thì theo điểm chuẩn).
+    Trả về (DataFrame, message); DataFrame rỗng nếu lỗi.
+    """
+    try:
+        index = logic.get_admission_index(data_file)
+    except FileNotFoundError:
+        return pd.DataFrame(), f"Lỗi: Không tìm thấy file dữ liệu '{data_file}'."
+
+    diem_xet_thuong, diem_xet_chuyen = logic.calculate_admission_scores(
+        diem_van, diem_toan, diem_anh, diem_tb_4nam, diem_uu_tien, mon_chuyen, diem_mon_chuyen
+    )
+    diem_chuyen = diem_xet_chuyen.get(mon_chuyen)
+    positions, probability, forecast = admission_probabilities(index, diem_xet_thuong, diem_chuyen, mon_chuyen,
+                                                               n_samples, seed)
+    order = np.lexsort((index.rank[positions], -np.nan_to_num(probability, nan=-1.0)))
+    positions, probability = positions[order], probability[order]
+    diem = np.where(index.is_chuyen[positions], diem_chuyen if diem_chuyen is not None else np.nan, diem_xet_thuong)
+    is_higher = diem >= index.last_cutoff[positions]
+    is_down = index.slope[positions] < -0.1
+    df = pd.DataFrame({
+        'Tên trường': index.entities[positions],
+        'Điểm xét của bạn': diem,
+        'Điểm chuẩn năm ngoái': index.last_cutoff[positions],
+        'Điểm chuẩn dự báo': np.round(forecast.mean[positions], 2),
+        'Độ lệch dự báo': np.round(forecast.spread[positions], 2),
+        'Xác suất đậu': np.round(probability, 3),
+        'Độ an toàn (Mã)': np.where(is_higher, np.where(is_down, 1, 2), np.where(is_down, 3, 4)),
+    })
+    return df, f"Xác suất ước tính từ {forecast.n_samples} mẫu mô phỏng điểm chuẩn năm tới của mỗi trường."
+
+def add_probabilities(data_file, recommendations, diem_van, diem_toan, diem_anh, diem_tb_4nam, diem_uu_tien,
+                      mon_chuyen=None, diem_mon_chuyen=None):
+    """
+    Thêm cột 'Xác suất đậu' vào các bảng đề xuất (kết quả của get_recommendations, sửa tại chỗ).
+    Trả về lại `recommendations`.
+    """
+    probabilities, _ = get_admission_probabilities(data_file, diem_van, diem_toan, diem_anh, diem_tb_4nam,
+                                                   diem_uu_tien, mon_chuyen, diem_mon_chuyen)
+    if probabilities.empty:
+        return recommendations
+    by_name = pd.Series(probabilities['Xác suất đậu'].to_numpy(), index=probabilities['Tên trường'].to_numpy())
+    for df in recommendations.values():
+        if not df.empty:
+            df['Xác suất đậu'] = df['Tên trường'].map(by_name).to_numpy()
+    return recommendations
@@ -0,0 +1,202 @@
+import os
+import shutil
+import threading
+import time
+import logic_core as logic
+import logic_store
+from logic_metrics import span, get_logger
+
+logger = get_logger('refresh')
+
+# =============================================================================
+# LÀM MỚI DỮ LIỆU NỀN (STALE-WHILE-REVALIDATE)
+# =============================================================================
+#
+# Một luồng nền dựng lại dữ liệu theo lịch vào bộ file "staging" bên cạnh file thật
+# (x.staging.tnds, x.staging.csv, x.staging.manifest.json). Chỉ khi bộ dữ liệu mới
+# kiểm tra hợp lệ thì mới đổi tên đè lên file thật và thay chỉ mục trong bộ nhớ.
+# Trong lúc đó (và khi làm mới thất bại) người dùng vẫn được phục vụ bằng dữ liệu
+# tốt gần nhất, nên thời gian tải trang không bao giờ gồm thời gian nạp Google Sheets.
+
+def staging_path(data_file):
+    base, ext = os.path.splitext(data_file)
+    return f"{base}.staging{ext}"
+
+def _companion_files(data_file):
+    """Các file đi kèm một bộ dữ liệu (manifest nạp tăng dần, bản CSV xuất kèm)."""
+    import logic_ingest
+    files = [logic_ingest.manifest_path(data_file)]
+    if logic_store.is_store_path(data_file):
+        files.append(logic_store.csv_export_path(data_file))
+    return files
+
+def validate_index(index, previous=None, min_entity_ratio=0.5):
+    """
+    Kiểm tra bộ dữ liệu mới trước khi đưa vào phục vụ.
+    Trả về None nếu hợp lệ, ngược lại là thông báo lỗi.
+    """
+    if len(index.entities) == 0:
+        return "Dữ liệu mới không có trường nào ở năm học gần nhất."
+    if not (index.last_cutoff >= 0).all():
+        return "Dữ liệu mới có điểm chuẩn năm gần nhất bị thiếu hoặc âm."
+    if previous is not None and len(previous.entities):
+        if index.all_years[-1] < previous.all_years[-1]:
+            return f"Năm học gần nhất bị lùi từ {previous.all_years[-1]} về {index.all_years[-1]}."
+        if len(index.entities) < min_entity_ratio * len(previous.entities):
+            return (f"Số trường ở năm gần nhất giảm bất thường "
+                    f"({len(previous.entities)} -> {len(index.entities)}).")
+    return None
+
+class DataRefresher:
+    """
+    Làm mới dữ liệu theo lịch trong luồng nền.
+    refresh_func(output_filename) -> (success, message) ghi bộ dữ liệu mới ra output_filename
+    (ví dụ logic_ingest.refresh_from_spreadsheet hoặc run_data_processing của app).
+    status() trả về thời điểm, thời lượng, kết quả và lỗi của lần làm mới gần nhất.
+    """
+
+    def __init__(self, data_file, refresh_func, interval=3600.0, validate=validate_index):
+        self.data_file = data_file
+        self.refresh_func = refresh_func
+        self.interval = interval
+        self.validate = validate
+        self._lock = threading.Lock()       # chỉ một lần làm mới chạy tại một thời điểm
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self._thread = None
+        self.last_refresh = None            # thời điểm kết thúc lần làm mới gần nhất (epoch)
+        self.last_success = None            # thời điểm lần làm mới thành công gần nhất
+        self.last_duration = None           # giây
+        self.last_error = None
+        self.last_message = None
+        self.refresh_count = 0
+        if os.path.exists(data_file):
+            self._ready.set()
+
+    # --- Luồng nền ---
+    def start(self):
+        """Chạy luồng nền (lần làm mới đầu tiên bắt đầu ngay). Gọi nhiều lần không sao."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='data-refresher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def trigger(self):
+        """Yêu cầu làm mới ngay ở luồng nền (không chờ)."""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh_now()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    # --- Làm mới ---
+    def refresh_now(self):
+        """
+        Dựng bộ dữ liệu mới vào file staging, kiểm tra, rồi thay thế bộ dữ liệu đang phục vụ.
+        Trả về (success, message); dữ liệu cũ được giữ nguyên nếu thất bại.
+        """
+        with self._lock:
+            with span('data_refresh') as s:
+                try:
+                    success, message = self._refresh()
+                except Exception as e:
+                    logger.exception("Lỗi không xác định khi làm mới dữ liệu")
+                    success, message = False, f"Lỗi không xác định khi làm mới dữ liệu: {e}"
+            self.last_duration = s.seconds
+            self.last_refresh = time.time()
+            self.last_message = message
+            self.refresh_count += 1
+            if success:
+                self.last_success = self.last_refresh
+                self.last_error = None
+            else:
+                self.last_error = message
+                logger.warning("Làm mới dữ liệu thất bại, tiếp tục dùng dữ liệu cũ", extra={'error': message})
+            self._ready.set()
+            return success, message
+
+    def _refresh(self):
+        staging = staging_path(self.data_file)
+        # Bắt đầu từ bản đang phục vụ để nạp tăng dần vẫn chỉ tải các sheet thay đổi
+        for live, staged in zip([self.data_file] + _companion_files(self.data_file),
+                                [staging] + _companion_files(staging)):
+            if os.path.exists(live):
+                shutil.copyfile(live, staged)
+            elif os.path.exists(staged):
+                os.remove(staged)
+
+        try:
+            return self._build_and_swap(staging)
+        finally:
+            for path in [staging] + _companion_files(staging):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _build_and_swap(self, staging):
+        success, message = self.refresh_func(staging)
+        staged_index = logic._INDEX_CACHE.pop(os.path.abspath(staging), None)
+        if not success:
+            return False, message
+        if not os.path.exists(staging):
+            return False, "Làm mới dữ liệu không tạo ra file dữ liệu."
+
+        try:
+            previous = logic.get_admission_index(self.data_file)
+        except FileNotFoundError:
+            previous = None
+        # Bản staging không phải file của tỉnh nào: dựng lại theo cấu hình tỉnh của file thật
+        province = logic.province_for_file(self.data_file)
+        if staged_index is None or staged_index.province is not province:
+            staged_index = logic.AdmissionIndex.from_file(staging, province)
+        if previous is not None and staged_index.version == previous.version:
+            # Dữ liệu không đổi: chỉ cập nhật manifest (thời điểm sửa đổi mới nhất)
+            self._promote(staging, include_data=False)
+            return True, message
+
+        error = self.validate(staged_index, previous)
+        if error is not None:
+            return False, f"Dữ liệu mới không hợp lệ, giữ nguyên dữ liệu cũ. {error}"
+        self._promote(staging)
+        logic.replace_admission_index(self.data_file, staged_index)
+        return True, message
+
+    def _promote(self, staging, include_data=True):
+        """Đổi tên các file staging đè lên file thật (os.replace là thao tác nguyên tử)."""
+        pairs = list(zip([staging] + _companion_files(staging),
+                         [self.data_file] + _companion_files(self.data_file)))
+        for staged, live in (pairs if include_data else pairs[1:]):
+            if os.path.exists(staged):
+                os.replace(staged, live)
+
+    # --- Trạng thái ---
+    def wait_until_ready(self, timeout=None):
+        """
+        Chờ đến khi có dữ liệu để phục vụ. Trả về ngay nếu đã có file dữ liệu từ trước;
+        chỉ lần chạy đầu tiên (chưa có file) mới phải chờ lần làm mới đầu tiên.
+        """
+        self._ready.wait(timeout)
+        return os.path.exists(self.data_file)
+
+    def status(self):
+        return {
+            'data_file': self.data_file,
+            'has_data': os.path.exists(self.data_file),
+            'refreshing': self._lock.locked(),
+            'last_refresh': self.last_refresh,
+            'last_success': self.last_success,
+            'last_duration': self.last_duration,
+            'last_error': self.last_error,
+            'last_message': self.last_message,
+            'refresh_count': self.refresh_count,
+            'interval': self.interval,
+        }
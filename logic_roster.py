@@ -0,0 +1,264 @@
+import os
+import zipfile
+import pandas as pd
+import openpyxl
+from openpyxl.utils.exceptions import InvalidFileException
+import logic_core as logic
+from logic_core import normalize_text, is_valid_score, validate_minimum_score, MON_CHUYEN_MAP, NORMALIZED_KHO_LIST
+
+# =============================================================================
+# XỬ LÝ HÀNG LOẠT DANH SÁCH HỌC SINH (ĐỌC / GHI THEO TỪNG KHỐI)
+# =============================================================================
+
+# Tên cột trong file danh sách (đã chuẩn hóa bằng normalize_text) -> tên tham số của logic_core
+ROSTER_COLUMNS = {
+    'van': 'diem_van',
+    'toan': 'diem_toan',
+    'anh': 'diem_anh',
+    'tb4nam': 'diem_tb_4nam',
+    'uutien': 'diem_uu_tien',
+    'monchuyen': 'mon_chuyen',
+    'diemchuyen': 'diem_mon_chuyen',
+}
+REQUIRED_COLUMNS = ['diem_van', 'diem_toan', 'diem_anh', 'diem_tb_4nam']
+SUBJECT_NAMES = {'diem_van': 'Văn', 'diem_toan': 'Toán', 'diem_anh': 'Tiếng Anh', 'diem_tb_4nam': 'TB 4 năm'}
+
+RESULT_COLUMNS = ['Tên trường', 'Điểm chuẩn năm ngoái', 'Điểm xét của bạn', 'Chênh lệch',
+                  'Xu hướng điểm', 'Độ an toàn (Mã)', 'Đánh giá']
+GROUP_NAMES = {'an_toan_cao': 'An toàn cao', 'an_toan': 'An toàn', 'nguy_co_giam': 'Nguy cơ'}
+# Cột khác của file danh sách trùng tên với cột kết quả (ví dụ 'Tên trường' của học sinh) được thêm tiền tố này
+IDENTITY_PREFIX = 'Học sinh - '
+OUTPUT_COLUMNS = {'Dòng', 'Nhóm', 'Lỗi', *RESULT_COLUMNS}
+
+def _is_blank(value):
+    return value is None or (isinstance(value, float) and pd.isna(value)) or str(value).strip() == ''
+
+def _rename_roster_columns(columns):
+    """
+    Đổi tên cột của file danh sách sang tên tham số logic_core; cột khác (họ tên, lớp...) giữ nguyên.
+    """
+    return [ROSTER_COLUMNS.get(normalize_text(c), c) for c in columns]
+
+def read_roster_chunks(source, chunk_size=5000, file_name=None):
+    """
+    Đọc file danh sách (.csv hoặc .xlsx) theo từng khối chunk_size dòng.
+    source có thể là đường dẫn hoặc file đã mở (ví dụ file tải lên từ Streamlit).
+    Index của mỗi khối là số dòng trong file gốc (dòng tiêu đề là dòng 1).
+    """
+    name = file_name or (source if isinstance(source, str) else getattr(source, 'name', ''))
+    if str(name).lower().endswith('.csv'):
+        for chunk in pd.read_csv(source, chunksize=chunk_size, dtype=str, keep_default_na=False):
+            chunk.columns = _rename_roster_columns(chunk.columns)
+            chunk.index = chunk.index + 2
+            yield chunk
+        return
+
+    # Excel: chế độ read-only của openpyxl đọc từng dòng, không nạp cả workbook vào bộ nhớ
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _rename_roster_columns(['' if h is None else str(h) for h in header])
+        buffer, row_numbers = [], []
+        for row_number, row in enumerate(rows, start=2):
+            if all(_is_blank(v) for v in row):
+                continue
+            buffer.append((tuple(row) + (None,) * len(columns))[:len(columns)])
+            row_numbers.append(row_number)
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=columns, index=row_numbers)
+                buffer, row_numbers = [], []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=columns, index=row_numbers)
+    finally:
+        workbook.close()
+
+def _identity_columns(columns):
+    """{cột khác của file danh sách: tên trong file kết quả}, giữ nguyên tên trừ khi trùng cột kết quả."""
+    return {c: f"{IDENTITY_PREFIX}{c}" if c in OUTPUT_COLUMNS else c
+            for c in columns if c not in ROSTER_COLUMNS.values()}
+
+def validate_roster_row(row, subject_map=MON_CHUYEN_MAP):
+    """
+    Kiểm tra một dòng theo đúng quy tắc của chatbot (is_valid_score, validate_minimum_score).
+    subject_map: các môn chuyên được nhận (ProvinceConfig.subject_map của tỉnh), mặc định của Tây Ninh.
+    Trả về (scores, error_message); scores là None nếu dòng không hợp lệ.
+    """
+    scores = {}
+    for col in REQUIRED_COLUMNS:
+        value = row.get(col)
+        is_valid, score = is_valid_score(value) if not _is_blank(value) else (False, None)
+        if not is_valid:
+            return None, f"Điểm {SUBJECT_NAMES[col]} không hợp lệ (phải từ 0 đến 10)."
+        if col != 'diem_tb_4nam':
+            passes_min, _, error_msg = validate_minimum_score(value, SUBJECT_NAMES[col])
+            if not passes_min:
+                return None, error_msg
+        scores[col] = score
+
+    uu_tien = row.get('diem_uu_tien')
+    is_valid, score = is_valid_score(uu_tien, 0.0, 5.0) if not _is_blank(uu_tien) else (True, 0.0)
+    if not is_valid:
+        return None, "Điểm ưu tiên không hợp lệ (phải từ 0 đến 5)."
+    scores['diem_uu_tien'] = score
+
+    mon_chuyen = row.get('mon_chuyen')
+    if _is_blank(mon_chuyen) or normalize_text(mon_chuyen) in NORMALIZED_KHO_LIST:
+        scores['mon_chuyen'] = None
+        scores['diem_mon_chuyen'] = 0.0
+        return scores, None
+    if normalize_text(mon_chuyen) not in subject_map:
+        return None, f"Không nhận diện được môn chuyên '{mon_chuyen}'."
+    scores['mon_chuyen'] = subject_map[normalize_text(mon_chuyen)]
+
+    diem_chuyen = row.get('diem_mon_chuyen')
+    is_valid, score = is_valid_score(diem_chuyen) if not _is_blank(diem_chuyen) else (False, None)
+    if not is_valid:
+        return None, "Điểm môn chuyên không hợp lệ (phải từ 0 đến 10)."
+    scores['diem_mon_chuyen'] = score
+    return scores, None
+
+def score_roster_chunk(data_file, chunk):
+    """
+    Kiểm tra và tính đề xuất cho một khối học sinh.
+    Trả về (recommendations_df, errors_df), cả hai đều có cột 'Dòng' trỏ về file gốc
+    và các cột khác của file danh sách (đổi tên nếu trùng cột kết quả, xem IDENTITY_PREFIX).
+    """
+    identity_names = _identity_columns(chunk.columns)
+    extra_cols = list(identity_names.values())
+    chunk = chunk.rename(columns=identity_names)
+    subject_map = logic.province_for_file(data_file).subject_map
+    valid, errors = {}, []
+    for row_number, row in zip(chunk.index, chunk.to_dict('records')):
+        scores, error_msg = validate_roster_row(row, subject_map)
+        if scores is None:
+            errors.append({'Dòng': row_number, **{c: row[c] for c in extra_cols}, 'Lỗi': error_msg})
+        else:
+            valid[row_number] = scores
+
+    recommendations = pd.DataFrame()
+    if valid:
+        students = pd.DataFrame.from_dict(valid, orient='index')
+        results, _ = logic.get_recommendations_batch(data_file, students)
+        if not results.empty:
+            identity = chunk.loc[list(valid), extra_cols]
+            results = results.rename(columns={'Học sinh': 'Dòng'})
+            results['Nhóm'] = results['Nhóm'].map(GROUP_NAMES)
+            results = results.join(identity, on='Dòng')
+            recommendations = results[['Dòng'] + extra_cols + ['Nhóm'] + RESULT_COLUMNS]
+    return recommendations, pd.DataFrame(errors)
+
+def _to_cell(value):
+    """Đổi giá trị numpy/pandas sang kiểu Python mà openpyxl ghi được."""
+    if _is_blank(value):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+class _ExcelRosterWriter:
+    """Ghi kết quả ra workbook openpyxl write-only (mỗi loại kết quả một sheet)."""
+
+    def __init__(self, output):
+        self.output = output
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.sheets = {}
+
+    def write(self, sheet_name, df):
+        if sheet_name not in self.sheets:
+            self.sheets[sheet_name] = self.workbook.create_sheet(sheet_name)
+            self.sheets[sheet_name].append(list(df.columns))
+        sheet = self.sheets[sheet_name]
+        for row in df.itertuples(index=False):
+            sheet.append([_to_cell(v) for v in row])
+
+    def close(self):
+        if not self.sheets:
+            self.workbook.create_sheet(RECOMMENDATION_SHEET)
+        self.workbook.save(self.output)
+
+    def discard(self):
+        """Bỏ kết quả dở dang: đóng các sheet đang ghi, không ghi gì ra output."""
+        for sheet in self.sheets.values():
+            sheet.close()
+
+class _CsvRosterWriter:
+    """Ghi kết quả ra CSV (nhanh hơn Excel nhiều); lỗi được ghi vào file '<tên>_loi.csv'."""
+
+    def __init__(self, output):
+        base, ext = os.path.splitext(output)
+        self.paths = {RECOMMENDATION_SHEET: output, ERROR_SHEET: f"{base}_loi{ext}"}
+        self.started = set()
+        for path in self.paths.values():
+            if os.path.exists(path):
+                os.remove(path)
+
+    def write(self, sheet_name, df):
+        header = sheet_name not in self.started
+        df.to_csv(self.paths[sheet_name], mode='a', header=header, index=False, encoding='utf-8-sig' if header else 'utf-8')
+        self.started.add(sheet_name)
+
+    def close(self):
+        pass
+
+    def discard(self):
+        """Xóa các file CSV đã ghi dở."""
+        for path in self.paths.values():
+            if os.path.exists(path):
+                os.remove(path)
+
+RECOMMENDATION_SHEET = 'Đề xuất'
+ERROR_SHEET = 'Lỗi'
+
+def process_roster(data_file, source, output, chunk_size=5000, file_name=None, on_progress=None):
+    """
+    Đọc danh sách học sinh theo khối, tính đề xuất và ghi dần ra file kết quả nên bộ nhớ
+    không tăng theo số dòng. Mặc định ghi workbook (openpyxl write-only) gồm 2 sheet
+    'Đề xuất' và 'Lỗi'; nếu output là đường dẫn .csv thì ghi CSV.
+    on_progress(so_dong_da_xu_ly, so_dong_loi) được gọi sau mỗi khối.
+    Trả về (success, message); khi thất bại không để lại file kết quả ghi dở.
+    """
+    try:
+        logic.get_admission_index(data_file)
+    except FileNotFoundError:
+        return False, f"Lỗi: Không tìm thấy file dữ liệu '{data_file}'."
+
+    is_csv = isinstance(output, str) and output.lower().endswith('.csv')
+    writer = _CsvRosterWriter(output) if is_csv else _ExcelRosterWriter(output)
+    processed = failed = 0
+    completed = False
+
+    chunks = read_roster_chunks(source, chunk_size, file_name)
+    try:
+        while True:
+            # Chỉ lỗi đọc file mới được báo là lỗi đọc; lỗi khi tính đề xuất được ném ra nguyên vẹn
+            try:
+                chunk = next(chunks, None)
+            except (ValueError, KeyError, OSError, zipfile.BadZipFile, InvalidFileException) as e:
+                return False, f"Lỗi khi đọc file danh sách: {e}"
+            if chunk is None:
+                break
+
+            missing = [c for c in REQUIRED_COLUMNS if c not in chunk.columns]
+            if missing:
+                names = ', '.join(SUBJECT_NAMES[c] for c in missing)
+                return False, f"Lỗi: File danh sách thiếu cột điểm: {names}."
+
+            recommendations, errors = score_roster_chunk(data_file, chunk)
+            if not recommendations.empty:
+                writer.write(RECOMMENDATION_SHEET, recommendations)
+            if not errors.empty:
+                writer.write(ERROR_SHEET, errors)
+
+            processed += len(chunk)
+            failed += len(errors)
+            if on_progress is not None:
+                on_progress(processed, failed)
+        completed = True
+    finally:
+        chunks.close()   # Đóng file danh sách (workbook) nếu dừng giữa chừng
+        if completed:
+            writer.close()
+        else:
+            writer.discard()
+    return True, f"Đã xử lý {processed} học sinh ({failed} dòng lỗi)."
@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import numpy as np
+import pandas as pd
+
+# =============================================================================
+# ĐỊNH DẠNG LƯU TRỮ DỮ LIỆU ĐÃ XỬ LÝ (NHỊ PHÂN, THEO CỘT, CÓ KIỂU RÕ RÀNG)
+# =============================================================================
+#
+# Bố cục file .tnds:
+#   [8 byte MAGIC][4 byte độ dài header (uint32, little-endian)][header JSON UTF-8]
+#   [các khối dữ liệu của từng cột, mỗi khối căn lề 64 byte]
+# Header ghi phiên bản định dạng, số dòng, băm nội dung và mô tả từng cột:
+#   - 'category': mã int32 (-1 = trống) + bảng giá trị trong header ('Đối tượng', 'Trường Gốc', ...)
+#   - 'year':     mã int32 (-1 = trống) + bảng nhãn năm học đã sắp tăng dần ("2020-2021", ...)
+#   - 'float':    float64, giữ nguyên giá trị ('Điểm chuẩn')
+# Mỗi khối đã ở đúng kiểu dùng lúc chạy (CompactDataset) nên được dùng thẳng dưới dạng np.memmap chỉ đọc,
+# không chuyển đổi hay sao chép: nhiều tiến trình cùng đọc một file chỉ dùng chung một bản trang nhớ
+# (page cache) của hệ điều hành. Băm nội dung được kiểm tra khi mở file.
+# File định dạng 1 (năm int16, điểm float32 làm tròn khi đọc) vẫn đọc được nhưng phải chuyển đổi (sao chép).
+
+MAGIC = b'TNADMDS\x00'
+FORMAT_VERSION = 2
+SUPPORTED_FORMAT_VERSIONS = (1, 2)
+STORE_EXTENSION = '.tnds'
+ALIGNMENT = 64
+
+FLOAT_COLUMNS = ['Điểm chuẩn']
+YEAR_COLUMNS = ['Năm học']
+
+class DatasetFormatError(ValueError):
+    """File không đúng định dạng hoặc phiên bản định dạng không được hỗ trợ."""
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def _encode_column(name, series):
+    """Trả về (mô tả cột, mảng numpy) theo kiểu lưu trữ của cột."""
+    if name in FLOAT_COLUMNS:
+        return {'kind': 'float'}, pd.to_numeric(series, errors='coerce').to_numpy(dtype='<f8')
+
+    labels = series.astype(object).where(series.notna(), None)
+    codes, categories = pd.factorize(labels.map(lambda v: None if v is None else str(v)))
+    if name in YEAR_COLUMNS:
+        # Mã năm = vị trí trong bảng nhãn đã sắp, như CompactDataset dùng lúc chạy
+        order = np.argsort(np.array(categories, dtype=object), kind='stable')
+        remap = np.empty(len(order) + 1, dtype='<i4')
+        remap[order] = np.arange(len(order))
+        remap[-1] = -1
+        return {'kind': 'year', 'labels': [categories[i] for i in order]}, remap[codes]
+    return {'kind': 'category', 'categories': list(categories)}, codes.astype('<i4')
+
+def write_dataset(df, path):
+    """
+    Ghi DataFrame đã xử lý ra file .tnds (ghi vào file tạm rồi đổi tên nên
+    tiến trình khác đang đọc bản cũ không bị ảnh hưởng).
+    """
+    columns, blocks = [], []
+    for name in df.columns:
+        meta, values = _encode_column(name, df[name])
+        meta.update({'name': name, 'dtype': values.dtype.str})
+        columns.append(meta)
+        blocks.append(np.ascontiguousarray(values))
+
+    header = {
+        'format_version': FORMAT_VERSION,
+        'n_rows': int(len(df)),
+        'content_hash': hashlib.sha1(b''.join(b.tobytes() for b in blocks)).hexdigest()[:16],
+        'columns': columns,
+    }
+    # Tính offset: header có độ dài thay đổi theo offset, nên lặp đến khi ổn định
+    offsets = [0] * len(blocks)
+    while True:
+        header['columns'] = [dict(c, offset=o) for c, o in zip(columns, offsets)]
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        position = _align(len(MAGIC) + 4 + len(header_bytes))
+        new_offsets = []
+        for block in blocks:
+            new_offsets.append(position)
+            position = _align(position + block.nbytes)
+        if new_offsets == offsets:
+            break
+        offsets = new_offsets
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(4, 'little'))
+        f.write(header_bytes)
+        for offset, block in zip(offsets, blocks):
+            f.write(b'\x00' * (offset - f.tell()))
+            f.write(block.tobytes())
+    os.replace(tmp_path, path)
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise DatasetFormatError(f"'{path}' không phải file dữ liệu {STORE_EXTENSION}.")
+        header_len = int.from_bytes(f.read(4), 'little')
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    if header.get('format_version') not in SUPPORTED_FORMAT_VERSIONS:
+        raise DatasetFormatError(
+            f"Phiên bản định dạng {header.get('format_version')} của '{path}' không được hỗ trợ "
+            f"(cần {FORMAT_VERSION})."
+        )
+    return header
+
+def read_columns(path, mmap=True):
+    """
+    Đọc các cột dạng mảng numpy thô (đúng kiểu đã ghi) cùng header, sau khi kiểm tra băm nội dung.
+    mmap=True: các mảng là np.memmap chỉ đọc, không sao chép dữ liệu vào bộ nhớ tiến trình.
+    """
+    header = read_header(path)
+    n_rows = header['n_rows']
+    arrays = {}
+    if n_rows == 0:
+        arrays = {col['name']: np.empty(0, dtype=col['dtype']) for col in header['columns']}
+    elif mmap:
+        for col in header['columns']:
+            arrays[col['name']] = np.memmap(path, dtype=col['dtype'], mode='r', offset=col['offset'], shape=(n_rows,))
+    else:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        for col in header['columns']:
+            arrays[col['name']] = np.frombuffer(raw, dtype=col['dtype'], count=n_rows, offset=col['offset'])
+
+    digest = hashlib.sha1()
+    for col in header['columns']:
+        digest.update(arrays[col['name']])
+    if digest.hexdigest()[:16] != header.get('content_hash'):
+        raise DatasetFormatError(f"'{path}' bị hỏng: băm nội dung không khớp với header.")
+    return header, arrays
+
+def _runtime_column(meta, values):
+    """
+    Cột ở kiểu dùng lúc chạy: 'float' -> float64, 'year'/'category' -> (mã int32, bảng giá trị).
+    File định dạng hiện tại trả về nguyên mảng đọc được (memmap); định dạng 1 phải chuyển đổi.
+    """
+    if meta['kind'] == 'float':
+        if 'decimals' in meta:  # định dạng 1: float32
+            return np.round(values.astype(np.float64), meta['decimals'])
+        return values
+    if meta['kind'] == 'year':
+        if isinstance(meta['labels'], dict):  # định dạng 1: số năm bắt đầu int16
+            years, codes = np.unique(values, return_inverse=True)
+            return codes.reshape(-1).astype(np.int32), [meta['labels'][str(y)] for y in years.tolist()]
+        return values, list(meta['labels'])
+    return values, list(meta['categories'])
+
+def _decode_column(meta, values):
+    values = _runtime_column(meta, values)
+    if meta['kind'] == 'float':
+        return values
+    codes, categories = values
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+def read_dataset(path, mmap=True):
+    """
+    Đọc file .tnds thành DataFrame: cột chuỗi là category, 'Điểm chuẩn' là float64
+    (đã làm tròn về đúng số chữ số thập phân gốc).
+    """
+    header, arrays = read_columns(path, mmap=mmap)
+    return pd.DataFrame({
+        col['name']: _decode_column(col, arrays[col['name']]) for col in header['columns']
+    }, copy=False)
+
+def read_coded_columns(path, mmap=True):
+    """
+    Đọc file .tnds nhưng giữ nguyên dạng mã: mỗi cột chuỗi/năm trả về (mã int32, bảng giá trị)
+    với mã -1 là trống (bảng nhãn năm đã sắp tăng dần), cột 'float' trả về mảng float64.
+    Không dựng chuỗi cho từng dòng; với mmap=True các mảng là memmap chỉ đọc của chính file.
+    """
+    header, arrays = read_columns(path, mmap=mmap)
+    return {col['name']: _runtime_column(col, arrays[col['name']]) for col in header['columns']}
+
+def is_store_path(path):
+    return str(path).lower().endswith(STORE_EXTENSION)
+
+def load_frame(path):
+    """Đọc dữ liệu đã xử lý từ .tnds hoặc (định dạng cũ) .csv."""
+    if is_store_path(path):
+        return read_dataset(path)
+    return pd.read_csv(path)
+
+def csv_export_path(path):
+    return f"{os.path.splitext(path)[0]}.csv"
+
+def export_csv(path, csv_path=None):
+    """Xuất file .tnds ra CSV để người dùng mở bằng Excel/Sheets."""
+    csv_path = csv_path or csv_export_path(path)
+    read_dataset(path).to_csv(csv_path, index=False)
+    return csv_path
+
+def compare_load_times(store_path, csv_path=None, repeat=20):
+    """Đo thời gian đọc (giây, trung vị) của .tnds (memmap / đọc hết) so với CSV."""
+    csv_path = csv_path or csv_export_path(store_path)
+
+    def median_time(func):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+        return float(np.median(samples))
+
+    return {
+        'csv': median_time(lambda: pd.read_csv(csv_path)),
+        'store_mmap': median_time(lambda: read_dataset(store_path, mmap=True)),
+        'store_read': median_time(lambda: read_dataset(store_path, mmap=False)),
+        'store_columns_mmap': median_time(lambda: read_columns(store_path, mmap=True)),
+    }
+
+if __name__ == '__main__':
+    # python logic_store.py admission_data_processed.tnds
+    for name, seconds in compare_load_times(sys.argv[1]).items():
+        print(f"{name:<22}{seconds * 1000:>10.2f} ms")
@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+import logic_core as logic
+from logic_metrics import timed
+
+# =============================================================================
+# PHÂN TÍCH "NẾU... THÌ" (WHAT-IF): THAY ĐỔI ĐIỂM TỪNG MÔN, XEM ĐỘ AN TOÀN THAY ĐỔI RA SAO
+# =============================================================================
+#
+# Học sinh cho bộ điểm gốc và các mức thay đổi cho từng môn, ví dụ {'diem_toan': [0.25, 0.5, 1.0]}.
+# Mọi tổ hợp (lưới) được tính điểm xét bằng đúng công thức của calculate_admission_scores
+# (0.7 x 3 môn + 0.3 x TB 4 năm + ưu tiên; hệ chuyên: 3 môn + 2 x điểm chuyên) và so với
+# điểm chuẩn của mọi 'Đối tượng' trong một phép so sánh ma trận (điểm lưới x Đối tượng).
+# Điểm xét tuyến tính theo điểm từng môn nên mức thay đổi làm độ an toàn đổi được tính đúng bằng
+# (điểm chuẩn - điểm xét) / hệ số của môn trong điểm xét của Đối tượng đó, không phụ thuộc bước lưới.
+
+SWEEP_SUBJECTS = {
+    'diem_van': 'Văn',
+    'diem_toan': 'Toán',
+    'diem_anh': 'Anh',
+    'diem_tb_4nam': 'TB 4 năm',
+    'diem_mon_chuyen': 'Điểm chuyên',
+}
+MAX_SWEEP_POINTS = 10000
+# Hệ số của từng môn trong điểm xét (hệ thường, hệ chuyên), như calculate_admission_scores
+SUBJECT_WEIGHTS = {
+    'diem_van': (0.7, 1.0),
+    'diem_toan': (0.7, 1.0),
+    'diem_anh': (0.7, 1.0),
+    'diem_tb_4nam': (0.3, 0.0),
+    'diem_mon_chuyen': (0.0, 2.0),
+}
+
+def sweep_grid(deltas):
+    """
+    Lưới các mức thay đổi: (các môn được thay đổi, mảng [số điểm lưới x số môn]).
+    Mỗi môn luôn có mức 0 nên bộ điểm gốc có trong lưới; các mức được sắp tăng dần.
+    """
+    subjects = [s for s in SWEEP_SUBJECTS if s in deltas]
+    axes = [np.unique(np.append(np.asarray(deltas[s], dtype=float), 0.0)) for s in subjects]
+    if not subjects:
+        return subjects, np.zeros((1, 0))
+    mesh = np.meshgrid(*axes, indexing='ij')
+    return subjects, np.stack([m.ravel() for m in mesh], axis=1)
+
+def _validate_deltas(deltas, has_chuyen):
+    """Trả về thông báo lỗi, hoặc None nếu các mức thay đổi hợp lệ."""
+    if not isinstance(deltas, dict) or not deltas:
+        return "Cần ít nhất một môn với các mức thay đổi điểm."
+    unknown = [s for s in deltas if s not in SWEEP_SUBJECTS]
+    if unknown:
+        return f"Không thay đổi được các môn {unknown}; chỉ nhận {list(SWEEP_SUBJECTS)}."
+    if 'diem_mon_chuyen' in deltas and not has_chuyen:
+        return "Chỉ thay đổi được điểm chuyên khi có môn chuyên và điểm môn chuyên."
+    n_points = 1
+    for subject, values in deltas.items():
+        try:
+            values = np.asarray(values, dtype=float).reshape(-1)
+        except (TypeError, ValueError):
+            return f"Các mức thay đổi của '{subject}' phải là số."
+        if not np.isfinite(values).all():
+            return f"Các mức thay đổi của '{subject}' phải là số."
+        n_points *= len(np.unique(np.append(values, 0.0)))
+    if n_points > MAX_SWEEP_POINTS:
+        return f"Lưới có {n_points} phương án, tối đa {MAX_SWEEP_POINTS}."
+    return None
+
+def _is_higher_matrix(index, diem_xet_thuong, diem_xet_chuyen, mon_chuyen):
+    """
+    So điểm xét của mọi điểm lưới với điểm chuẩn năm gần nhất của các 'Đối tượng' được xét.
+    Trả về (vị trí các Đối tượng trong chỉ mục, ma trận bool [điểm lưới x Đối tượng]: điểm xét >= điểm chuẩn).
+    Điểm chuẩn thiếu (NaN) luôn là "thấp hơn", giống get_safety_level.
+    """
+    regular = np.flatnonzero(~index.is_chuyen)
+    chuyen = index.subject_positions.get(mon_chuyen, np.empty(0, dtype=np.int64)) if mon_chuyen else np.empty(0, dtype=np.int64)
+    positions = np.concatenate([regular, chuyen])
+    is_higher = np.concatenate([
+        diem_xet_thuong[:, None] >= index.last_cutoff[regular][None, :],
+        diem_xet_chuyen[:, None] >= index.last_cutoff[chuyen][None, :],
+    ], axis=1)
+    return positions, is_higher
+
+def exact_change(subject_score, diem_xet, cutoff, weight, low, high):
+    """
+    Mức thay đổi điểm một môn làm điểm xét bằng đúng điểm chuẩn: (điểm chuẩn - điểm xét) / hệ số.
+    Đang thấp hơn: cộng đủ mức này thì thành "cao hơn"; đang cao hơn: trừ quá mức này thì thành "thấp hơn".
+    NaN nếu môn không có trong điểm xét (hệ số 0), điểm môn sau khi đổi ra ngoài 0-10,
+    hoặc mức đổi nằm ngoài khoảng đã quét [low, high].
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Làm tròn để bỏ sai số dấu phẩy động (16.05 - 15.35) / 0.7 = 1.0000000000000009
+        change = np.round((cutoff - diem_xet) / weight, 6)
+    new_score = subject_score + change
+    in_range = np.where(change > 0, change <= high, (low < 0) & (change >= low))
+    ok = (weight > 0) & (new_score >= 0) & (new_score <= 10) & in_range
+    return np.where(ok, change, np.nan)
+
+@timed('what_if_sweep')
+def what_if_sweep(data_file, diem_van, diem_toan, diem_anh, diem_tb_4nam, diem_uu_tien,
+                  mon_chuyen=None, diem_mon_chuyen=None, deltas=None):
+    """
+    Tính lại độ an toàn của mọi 'Đối tượng' cho cả lưới thay đổi điểm `deltas`
+    ({môn: [các mức cộng/trừ]}, môn trong SWEEP_SUBJECTS; điểm sau khi cộng được giới hạn trong 0-10).
+    Trả về ({'grid': ..., 'thresholds': ...}, message) hoặc ({}, thông báo lỗi):
+      - grid: mỗi điểm lưới một dòng: các mức thay đổi, điểm xét, số trường ở mỗi nhóm an toàn.
+      - thresholds: các trường có độ an toàn thay đổi khi chỉ đổi một môn trong khoảng đã quét; cột
+        'Thay đổi <môn>' là mức thay đổi chính xác (xem exact_change) làm điểm xét bằng 'Điểm chuẩn năm ngoái'.
+    """
+    try:
+        index = logic.get_admission_index(data_file)
+    except FileNotFoundError:
+        return {}, f"Lỗi: Không tìm thấy file dữ liệu '{data_file}'."
+
+    has_chuyen = bool(mon_chuyen) and diem_mon_chuyen is not None
+    error = _validate_deltas(deltas, has_chuyen)
+    if error is not None:
+        return {}, error
+
+    subjects, grid = sweep_grid(deltas)
+    base = {'diem_van': diem_van, 'diem_toan': diem_toan, 'diem_anh': diem_anh, 'diem_tb_4nam': diem_tb_4nam,
+            'diem_uu_tien': diem_uu_tien, 'diem_mon_chuyen': diem_mon_chuyen if has_chuyen else np.nan}
+    points = pd.DataFrame({col: np.full(len(grid), float(value)) for col, value in base.items()})
+    for k, subject in enumerate(subjects):
+        points[subject] = np.clip(points[subject].to_numpy() + grid[:, k], 0.0, 10.0)
+    points['mon_chuyen'] = mon_chuyen if has_chuyen else None
+    diem_xet_thuong, _, diem_xet_chuyen = logic.calculate_admission_scores_batch(points)
+
+    positions, is_higher = _is_higher_matrix(index, diem_xet_thuong, diem_xet_chuyen,
+                                             mon_chuyen if has_chuyen else None)
+    is_down = index.slope[positions] < -0.1
+    n_higher_down = (is_higher & is_down).sum(axis=1)
+    n_higher_up = is_higher.sum(axis=1) - n_higher_down
+    df_grid = pd.DataFrame({f"Thay đổi {SWEEP_SUBJECTS[s]}": grid[:, k] for k, s in enumerate(subjects)})
+    df_grid['Điểm xét thường'] = diem_xet_thuong
+    if has_chuyen:
+        df_grid['Điểm xét chuyên'] = diem_xet_chuyen
+    for code, group in logic.RANKED_GROUPS.items():
+        df_grid[group] = {1: n_higher_down, 2: n_higher_up,
+                          3: is_down.sum() - n_higher_down, 4: (~is_down).sum() - n_higher_up}[code]
+
+    # Ngưỡng theo từng môn (các môn khác giữ điểm gốc), tính đúng từ điểm xét gốc của từng Đối tượng
+    is_base = (grid == 0).all(axis=1)
+    base_higher = is_higher[np.flatnonzero(is_base)[0]]
+    entity_chuyen = index.is_chuyen[positions]
+    diem = np.where(entity_chuyen, diem_xet_chuyen[is_base][0], diem_xet_thuong[is_base][0])
+    thresholds = {}
+    for k, subject in enumerate(subjects):
+        weight = np.where(entity_chuyen, SUBJECT_WEIGHTS[subject][1], SUBJECT_WEIGHTS[subject][0])
+        thresholds[subject] = exact_change(float(base[subject]), diem, index.last_cutoff[positions], weight,
+                                           grid[:, k].min(), grid[:, k].max())
+
+    changes = np.column_stack(list(thresholds.values()))
+    selected = np.flatnonzero(~np.isnan(changes).all(axis=1))
+    selected = selected[np.argsort(index.rank[positions[selected]], kind='stable')]
+    entity_idx = positions[selected]
+    base_code = np.where(base_higher[selected], np.where(is_down[selected], 1, 2), np.where(is_down[selected], 3, 4))
+    df_thresholds = pd.DataFrame({
+        'Tên trường': index.entities[entity_idx],
+        'Điểm chuẩn năm ngoái': index.last_cutoff[entity_idx],
+        'Điểm xét của bạn': diem[selected],
+        'Xu hướng điểm': index.trend[entity_idx],
+        'Độ an toàn hiện tại': base_code,
+        # Vượt qua điểm chuẩn: 1 <-> 3, 2 <-> 4 (xu hướng không đổi)
+        'Độ an toàn mới': np.where(base_code <= 2, base_code + 2, base_code - 2),
+    })
+    for subject, values in thresholds.items():
+        df_thresholds[f"Thay đổi {SWEEP_SUBJECTS[subject]}"] = values[selected]
+
+    return ({'grid': df_grid, 'thresholds': df_thresholds.reset_index(drop=True)},
+            f"Đã tính {len(grid)} phương án điểm cho {len(positions)} trường; "
+            f"{len(selected)} trường thay đổi độ an toàn khi đổi điểm một môn.")
@@ -0,0 +1,125 @@
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# =============================================================================
+# BÁO CÁO THỜI GIAN KHỞI ĐỘNG (CHI PHÍ IMPORT CỦA TỪNG PHẦN)
+# =============================================================================
+#
+# Mỗi phần được đo trong một tiến trình Python mới (khởi động lạnh), sau khi đã
+# import sẵn các phần nó phụ thuộc, để thấy chi phí riêng của phần đó.
+# Chạy: python startup_report.py [--repeat 5] [--json startup_report.json] [--budget logic_core=0.8]
+
+# (tên phần, các module import trước, module cần đo)
+PARTS = [
+    ('logic_metrics', [], 'logic_metrics'),
+    ('logic_store', [], 'logic_store'),
+    ('logic_core', ['logic_store', 'logic_metrics'], 'logic_core'),
+    ('logic_plot', ['logic_core'], 'logic_plot'),
+    ('logic_ingest', ['logic_core'], 'logic_ingest'),
+    ('logic_roster', ['logic_core'], 'logic_roster'),
+    ('logic_refresh', ['logic_core'], 'logic_refresh'),
+    ('logic_conversation', ['logic_core'], 'logic_conversation'),
+    ('logic_probability', ['logic_core'], 'logic_probability'),
+    ('logic_whatif', ['logic_core'], 'logic_whatif'),
+    ('gspread', [], 'gspread'),
+    ('streamlit', [], 'streamlit'),
+]
+
+# Những gì app.py cần trước khi hiện câu hỏi đầu tiên (mọi import ở cấp module của app.py,
+# trừ thư viện chuẩn; kiểm tra bằng app_imports())
+FIRST_MESSAGE_MODULES = [
+    'streamlit', 'pandas', 'logic_metrics', 'logic_core', 'logic_refresh',
+    'logic_conversation', 'logic_probability',
+]
+
+_TIMER = """
+import sys, time
+for name in {preload!r}:
+    __import__(name)
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+print(time.perf_counter() - start)
+"""
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+def app_imports(path=APP_FILE):
+    """Các module (ngoài thư viện chuẩn) mà app.py import ở cấp module, theo thứ tự xuất hiện."""
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            name = name.split('.')[0]
+            if name not in sys.stdlib_module_names and name not in modules:
+                modules.append(name)
+    return modules
+
+def measure_import(modules, preload=(), repeat=3):
+    """
+    Đo thời gian import (giây, trung vị của `repeat` lần) trong tiến trình mới.
+    Trả về None nếu module không import được (ví dụ chưa cài đặt).
+    """
+    samples = []
+    for _ in range(repeat):
+        code = _TIMER.format(preload=list(preload), modules=list(modules))
+        proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+        if proc.returncode != 0:
+            return None
+        samples.append(float(proc.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+def build_report(repeat=3):
+    report = {}
+    for name, preload, module in PARTS:
+        report[name] = measure_import([module], preload, repeat)
+    report['time_to_first_message'] = measure_import(FIRST_MESSAGE_MODULES, (), repeat)
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo chi phí import của từng phần khi khởi động.")
+    parser.add_argument('--repeat', type=int, default=3, help="Số lần đo cho mỗi phần (lấy trung vị).")
+    parser.add_argument('--json', dest='json_path', help="Ghi kết quả ra file JSON.")
+    parser.add_argument('--budget', action='append', default=[],
+                        help="Ngưỡng tối đa dạng phần=giây; vượt ngưỡng thì thoát với mã lỗi 1.")
+    args = parser.parse_args(argv)
+
+    missing = [m for m in app_imports() if m not in FIRST_MESSAGE_MODULES]
+    if missing:
+        print(f"Cảnh báo: FIRST_MESSAGE_MODULES thiếu các module app.py import khi khởi động: {missing}")
+
+    report = build_report(args.repeat)
+    print(f"{'Phần':<24}{'Thời gian import':>18}")
+    for name, seconds in report.items():
+        value = "không import được" if seconds is None else f"{seconds * 1000:.1f} ms"
+        print(f"{name:<24}{value:>18}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    over_budget = []
+    for item in args.budget:
+        name, _, limit = item.partition('=')
+        seconds = report.get(name)
+        if seconds is not None and seconds > float(limit):
+            over_budget.append(f"{name}: {seconds:.3f}s > {float(limit):.3f}s")
+    if over_budget:
+        print("Vượt ngưỡng thời gian khởi động:\n" + "\n".join(over_budget))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
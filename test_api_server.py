@@ -0,0 +1,213 @@
+import http.client
+import json
+import os
+import threading
+import time
+from urllib.parse import urlencode
+import pytest
+import logic_core as logic
+import logic_store
+from api_server import APIServer, etag_matches
+
+# =============================================================================
+# ETAG VÀ IF-NONE-MATCH
+# =============================================================================
+
+ETAG = '"v1-0123456789abcdef"'
+
+@pytest.mark.parametrize('header, expected', [
+    (None, False),
+    ('', False),
+    (ETAG, True),
+    (f'W/{ETAG}', True),
+    (f'"other", {ETAG}', True),
+    (f'"a",W/{ETAG} , "b"', True),
+    ('*', True),
+    ('"v1-0123456789abcdef0"', False),   # thẻ dài hơn chứa ETag: không khớp
+    ('"v1-0123456789abc"', False),
+    ('v1-0123456789abcdef', False),      # thiếu dấu ngoặc kép
+    (f'"x{ETAG[1:]}', False),
+])
+def test_etag_matches_whole_tags(header, expected):
+    assert etag_matches(header, ETAG) is expected
+
+# =============================================================================
+# MÁY CHỦ THẬT (CỔNG 0) TRÊN BỘ DỮ LIỆU TỔNG HỢP
+# =============================================================================
+
+STUDENT = dict(diem_van=7.5, diem_toan=8.0, diem_anh=7.0, diem_tb_4nam=8.1, diem_uu_tien=0.5)
+CHUYEN_STUDENT = dict(STUDENT, mon_chuyen='Toán', diem_mon_chuyen=8.0)
+
+def start_server(data_file, reload_interval=None):
+    server = APIServer(('127.0.0.1', 0), data_file, workers=4)
+    threading.Thread(target=server.serve_forever, name='api-test', daemon=True).start()
+    if reload_interval is not None:
+        server.watch_data_file(reload_interval)
+    return server
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(scope='module')
+def server(data_file):
+    server = start_server(data_file)
+    yield server
+    stop_server(server)
+
+def call(server, method, path, params=None, body=None, headers=None):
+    """Gửi một yêu cầu; trả về (status, headers, nội dung: dict nếu là JSON, bytes nếu không)."""
+    if params:
+        path += '?' + urlencode(params, doseq=True)
+    if body is not None and not isinstance(body, bytes):
+        body = json.dumps(body).encode('utf-8')
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        content = response.read()
+    finally:
+        connection.close()
+    if response.headers.get('Content-Type', '').startswith('application/json'):
+        content = json.loads(content)
+    return response.status, response.headers, content
+
+def names(records):
+    return [r['Tên trường'] for r in records]
+
+def test_health_and_metadata(server, data_file, master_frame):
+    index = logic.get_admission_index(data_file)
+    status, _, body = call(server, 'GET', '/health')
+    assert (status, body) == (200, {'status': 'ok', 'dataset_version': index.version})
+
+    status, headers, body = call(server, 'GET', '/v1/metadata')
+    assert status == 200 and headers['ETag']
+    years = sorted(master_frame['Năm học'].unique())
+    assert body['years'] == years and body['latest_year'] == years[-1]
+    assert body['entities'] == len(index.entities)
+    chuyen = master_frame['Đối tượng'].str.extract(r' - (.+)$')[0].dropna()
+    assert body['subjects'] == sorted(set(chuyen))
+
+@pytest.mark.parametrize('student', [STUDENT, CHUYEN_STUDENT])
+def test_recommendations_get_and_post(student, server, data_file):
+    expected, _ = logic.get_recommendations(data_file, **student)
+    status, _, got = call(server, 'GET', '/v1/recommendations', params=student)
+    assert status == 200
+    assert {group: names(records) for group, records in got['groups'].items()} == \
+        {group: df['Tên trường'].tolist() for group, df in expected.items()}
+
+    status, headers, posted = call(server, 'POST', '/v1/recommendations', body=student)
+    assert status == 200 and 'ETag' not in headers
+    assert posted == got
+
+def test_ranked_recommendations(server, data_file):
+    params = dict(STUDENT, offset=2, limit=3, group4=1)
+    status, _, body = call(server, 'GET', '/v1/recommendations/ranked', params=params)
+    assert status == 200 and (body['offset'], body['limit']) == (2, 3)
+    groups, _ = logic.get_ranked_recommendations(data_file, **STUDENT, offset=2, limit=3, include_group_4=True)
+    assert list(body['groups']) == list(groups)
+    for group, page in groups.items():
+        assert body['groups'][group]['total'] == page['total']
+        assert names(body['groups'][group]['results']) == page['results']['Tên trường'].tolist()
+
+def test_recommendations_batch(server):
+    students = [dict(STUDENT, id='HS01'), dict(CHUYEN_STUDENT, id='HS02'), dict(STUDENT, diem_van=11, id='HS03')]
+    status, _, body = call(server, 'POST', '/v1/recommendations/batch', body={'students': students})
+    assert status == 200
+    assert {r['id'] for r in body['results']} == {'HS01', 'HS02'}
+    assert [e['id'] for e in body['errors']] == ['HS03']
+
+def test_what_if(server):
+    body = dict(STUDENT, deltas={'diem_toan': [0.5, 1.0]})
+    status, _, got = call(server, 'POST', '/v1/whatif', body=body)
+    assert status == 200 and got['grid'] and 'thresholds' in got
+
+def test_probabilities(server):
+    status, _, body = call(server, 'GET', '/v1/probabilities', params=dict(STUDENT, limit=5))
+    assert status == 200 and len(body['results']) == 5 and body['total'] >= 5
+
+def test_trends(server):
+    entities = ['THPT Trường 0', 'Không có trường này']
+    status, _, body = call(server, 'GET', '/v1/trends', params={'entity': entities})
+    assert status == 200
+    assert body['years'] and list(body['series']) == ['THPT Trường 0']
+    assert body['missing'] == ['Không có trường này']
+
+def test_provinces_and_metrics(server):
+    status, _, body = call(server, 'GET', '/v1/provinces')
+    assert status == 200 and body['provinces'] and 'index_cache' in body
+    status, headers, text = call(server, 'GET', '/metrics')
+    assert status == 200 and headers['Content-Type'].startswith('text/plain')
+    assert b'api_request' in text
+
+@pytest.mark.parametrize('method, path, params, body', [
+    ('GET', '/v1/recommendations', dict(STUDENT, diem_van=11), None),
+    ('GET', '/v1/recommendations', dict(STUDENT, diem_toan='abc'), None),
+    ('GET', '/v1/recommendations', {'diem_van': 8}, None),
+    ('GET', '/v1/recommendations', dict(STUDENT, mon_chuyen='Toán'), None),
+    ('POST', '/v1/recommendations', None, dict(STUDENT, diem_uu_tien=6)),
+    ('POST', '/v1/recommendations', None, b'{"diem_van": 8,'),
+    ('POST', '/v1/recommendations', None, b'[1, 2]'),
+    ('POST', '/v1/recommendations/batch', None, {'students': 'HS01'}),
+    ('POST', '/v1/whatif', None, b'not json'),
+    ('GET', '/v1/recommendations/ranked', dict(STUDENT, offset=-1), None),
+    ('GET', '/v1/recommendations/ranked', dict(STUDENT, offset='x'), None),
+    ('GET', '/v1/recommendations/ranked', dict(STUDENT, limit=0), None),
+    ('GET', '/v1/recommendations/ranked', dict(STUDENT, limit=101), None),
+    ('GET', '/v1/probabilities', dict(STUDENT, limit=1000), None),
+    ('GET', '/v1/trends', None, None),
+])
+def test_bad_requests_are_400(method, path, params, body, server):
+    status, headers, got = call(server, method, path, params=params, body=body)
+    assert status == 400, got
+    assert got['error'] and 'ETag' not in headers
+
+def test_unknown_path_and_method(server):
+    assert call(server, 'GET', '/v2/nothing')[0] == 404
+    assert call(server, 'GET', '/v1/whatif')[0] == 405
+
+# =============================================================================
+# ETAG VÀ NẠP LẠI DỮ LIỆU
+# =============================================================================
+
+def test_etag_then_304(server):
+    status, headers, body = call(server, 'GET', '/v1/recommendations', params=STUDENT)
+    etag = headers['ETag']
+    for header in (etag, f'W/{etag}', f'"khac", {etag}', '*'):
+        status, headers, content = call(server, 'GET', '/v1/recommendations', params=STUDENT,
+                                        headers={'If-None-Match': header})
+        assert (status, content, headers['ETag']) == (304, b'', etag)
+
+    status, _, again = call(server, 'GET', '/v1/recommendations', params=STUDENT,
+                            headers={'If-None-Match': etag[:-2] + '"'})
+    assert (status, again) == (200, body)
+    # Truy vấn khác thì ETag khác
+    assert call(server, 'GET', '/v1/recommendations', params=CHUYEN_STUDENT)[1]['ETag'] != etag
+
+def test_etag_changes_after_reload(master_frame, tmp_path):
+    # Dữ liệu xử lý từ sheet không có điểm trống (validate_index từ chối điểm năm gần nhất bị thiếu)
+    master_frame = master_frame.dropna(subset=['Điểm chuẩn'])
+    data_file = str(tmp_path / 'admission.tnds')
+    logic_store.write_dataset(master_frame, data_file)
+    server = start_server(data_file, reload_interval=0.05)
+    try:
+        status, headers, before = call(server, 'GET', '/v1/metadata')
+        etag = headers['ETag']
+
+        changed = master_frame.copy()
+        changed.loc[changed['Năm học'] == changed['Năm học'].max(), 'Điểm chuẩn'] += 0.25
+        logic_store.write_dataset(changed, data_file)
+        mtime = os.path.getmtime(data_file) + 5
+        os.utime(data_file, (mtime, mtime))
+
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            status, headers, after = call(server, 'GET', '/v1/metadata', headers={'If-None-Match': etag})
+            if status != 304:
+                break
+            time.sleep(0.05)
+        assert status == 200 and headers['ETag'] != etag
+        assert after['dataset_version'] != before['dataset_version']
+        assert after['dataset_version'] == logic.get_admission_index(data_file).version
+    finally:
+        stop_server(server)
@@ -0,0 +1,45 @@
+import numpy as np
+import logic_core as logic
+import logic_store
+from logic_backtest import run_backtest
+
+# =============================================================================
+# KIỂM TRA NGƯỢC SO VỚI VÒNG LẶP TƯỜNG MINH
+# =============================================================================
+#
+# Bộ dữ liệu tổng hợp của conftest.py có độ dốc nằm đúng ngưỡng (lịch sử 2 năm chênh 0.3 hoặc 0.05),
+# nên các ngưỡng -0.3 và 0.05 kiểm tra cả việc xếp nhóm trùng từng bit với chỉ mục của năm đó.
+
+def test_backtest_matches_explicit_loop(master_frame, data_file):
+    scores = np.arange(10.0, 42.0, 0.5)
+    thresholds = [-0.3, -0.1, 0.05]
+    result, _ = run_backtest(data_file, scores=scores, slope_thresholds=thresholds)
+
+    # Mỗi năm kiểm tra: chỉ mục dựng lại từ dữ liệu các năm trước đó, như lúc tư vấn năm ấy
+    # (độ dốc đúng bằng ngưỡng, ví dụ lịch sử 2 năm chênh 0.3, phải được xếp giống hệt chỉ mục)
+    years = sorted(master_frame['Năm học'].unique())
+    expected = {}
+    for k in range(1, len(years)):
+        index = logic.AdmissionIndex(master_frame[master_frame['Năm học'] <= years[k - 1]])
+        actual = master_frame[master_frame['Năm học'] == years[k]].set_index('Đối tượng')['Điểm chuẩn']
+        for entity, last_cutoff, slope in zip(index.entities, index.last_cutoff, index.slope):
+            if entity not in actual or np.isnan(actual[entity]):
+                continue
+            for threshold in thresholds:
+                for score in scores:
+                    is_higher, is_down = score >= last_cutoff, slope < threshold
+                    code = (1 if is_down else 2) if is_higher else (3 if is_down else 4)
+                    n_cases, n_pass = expected.get((threshold, code), (0, 0))
+                    expected[(threshold, code)] = (n_cases + 1, n_pass + int(score >= actual[entity]))
+
+    summary = result['summary']
+    for (threshold, code), (n_cases, n_pass) in expected.items():
+        row = summary[(summary['Ngưỡng xu hướng'] == threshold) & (summary['Độ an toàn (Mã)'] == code)]
+        assert (row['Số lượt'].item(), row['Số lượt đậu'].item()) == (n_cases, n_pass), (threshold, code)
+    assert summary['Số lượt'].sum() == sum(n for n, _ in expected.values())
+
+def test_backtest_needs_two_years(master_frame, tmp_path):
+    path = str(tmp_path / 'one_year.tnds')
+    logic_store.write_dataset(master_frame[master_frame['Năm học'] == master_frame['Năm học'].max()], path)
+    assert run_backtest(path) == ({}, "Cần dữ liệu ít nhất 2 năm học để kiểm tra ngược.")
+    assert run_backtest(str(tmp_path / 'missing.tnds'))[1].startswith("Lỗi: Không tìm thấy file dữ liệu")
@@ -0,0 +1,114 @@
+import pandas as pd
+import pytest
+import logic_core as logic
+from logic_conversation import (ConversationEngine, END_MESSAGE, RESTART_HINT, get_next_question, new_state,
+                                recommendation_calculator, text_message)
+
+# =============================================================================
+# LUỒNG HỘI THOẠI TƯ VẤN
+# =============================================================================
+
+@pytest.fixture
+def engine(data_file):
+    return ConversationEngine(recommendation_calculator(data_file))
+
+def talk(engine, answers, state=None):
+    """Gửi lần lượt các câu trả lời; trả về (trạng thái cuối, tin nhắn của từng lượt, kết quả lượt cuối)."""
+    if state is None:
+        state, _ = engine.start()
+    turns, results = [], None
+    for answer in answers:
+        state, messages, results = engine.handle(state, answer)
+        turns.append(messages)
+    return state, turns, results
+
+def texts(messages):
+    return [m['content'] for m in messages if m['type'] == 'text']
+
+def assert_same_recommendations(got, expected):
+    assert list(got) == list(expected)
+    for group in expected:
+        pd.testing.assert_frame_equal(got[group], expected[group])
+
+def test_full_conversation(engine, data_file):
+    state, messages = engine.start()
+    assert state == {'step': 'ask_van', 'scores': {}}
+    assert texts(messages) == [get_next_question({})[1]]
+
+    answers = ['7.5', '8', '7', '8.1', '0.5', 'Không']
+    steps = ['ask_toan', 'ask_anh', 'ask_tb_4nam', 'ask_uu_tien', 'ask_chuyen_subject']
+    for answer, step in zip(answers, steps):
+        state, messages, results = engine.handle(state, answer)
+        assert state['step'] == step and results is None
+        assert texts(messages) == [get_next_question(state['scores'])[1]]
+    assert state['scores'] == {'van': 7.5, 'toan': 8.0, 'anh': 7.0, 'tb_4nam': 8.1, 'uu_tien': 0.5}
+
+    state, messages, results = engine.handle(state, answers[-1])
+    expected, message = logic.get_recommendations(data_file, 7.5, 8.0, 7.0, 8.1, 0.5, None, 0.0)
+    assert state == new_state()
+    assert [m['type'] for m in messages] == ['text', 'results', 'text']
+    assert messages[0] == text_message(message) and messages[2] == text_message(END_MESSAGE)
+    assert messages[1]['content'] is results and results['plots'] == {}
+    assert_same_recommendations(results['recommendations'], expected)
+
+def test_invalid_answers_repeat_the_question(engine):
+    state, turns, _ = talk(engine, ['11', 'abc', '8', '-1', '9', '6', '7', '6', '1', 'Địa lý'])
+    assert texts(turns[0]) == texts(turns[1]) == ["Điểm không hợp lệ. Vui lòng nhập một số từ 0 đến 10."]
+    assert texts(turns[3]) == ["Điểm không hợp lệ. Vui lòng nhập một số từ 0 đến 10."]
+    assert texts(turns[7]) == ["Điểm không hợp lệ. Vui lòng nhập một số (nếu không có, nhập 0)."]
+    assert texts(turns[9]) == ["Không nhận diện được môn chuyên. Vui lòng gõ lại tên môn hoặc gõ 'Không'."]
+    assert state == {'step': 'ask_chuyen_subject',
+                     'scores': {'van': 8.0, 'toan': 9.0, 'anh': 6.0, 'tb_4nam': 7.0, 'uu_tien': 1.0}}
+
+@pytest.mark.parametrize('answers, subject', [
+    (['0.5'], 'Văn'),
+    (['8', '0.75'], 'Toán'),
+    (['8', '9', '0'], 'Tiếng Anh'),
+])
+def test_score_below_minimum_ends_and_restarts(answers, subject, engine):
+    state, turns, results = talk(engine, answers)
+    messages = turns[-1]
+    assert results is None and state == new_state()
+    assert len(messages) == 2 and subject in messages[0]['content'] and messages[1] == text_message(RESTART_HINT)
+
+    # Sau khi dừng, chỉ lệnh 'Bắt đầu lại' mở lại cuộc tư vấn với điểm trống
+    state, messages, _ = engine.handle(state, 'Bắt đầu lại')
+    assert state == {'step': 'ask_van', 'scores': {}}
+    assert texts(messages) == [get_next_question({})[1]]
+
+def test_restart_mid_conversation(engine):
+    state, _, _ = talk(engine, ['8', '7'])
+    assert state['step'] == 'ask_anh'
+    restarted, messages, results = engine.handle(state, 'BẮT ĐẦU LẠI')
+    assert restarted == {'step': 'ask_van', 'scores': {}} and results is None
+    # Trạng thái đầu vào không bị sửa
+    assert state == {'step': 'ask_anh', 'scores': {'van': 8.0, 'toan': 7.0}}
+
+@pytest.mark.parametrize('typed', ['Toán', 'toan', 'TOÁN'])
+def test_chuyen_branch(typed, engine, data_file):
+    state, turns, _ = talk(engine, ['8', '8.5', '7.75', '8.8', '0', typed])
+    assert state['step'] == 'ask_chuyen_score' and state['scores']['mon_chuyen'] == 'Toán'
+    assert texts(turns[-1]) == ["OK. Điểm thi môn chuyên **Toán** của bạn là bao nhiêu?"]
+
+    state, messages, _ = engine.handle(state, '10.5')
+    assert state['step'] == 'ask_chuyen_score'
+    assert texts(messages) == ["Điểm không hợp lệ. Vui lòng nhập điểm môn chuyên (từ 0 đến 10)."]
+
+    state, messages, results = engine.handle(state, '8')
+    expected, _ = logic.get_recommendations(data_file, 8.0, 8.5, 7.75, 8.8, 0.0, 'Toán', 8.0)
+    assert state == new_state()
+    assert_same_recommendations(results['recommendations'], expected)
+    names = pd.concat(results['recommendations'].values())['Tên trường']
+    assert names.str.endswith(' - Toán').any()
+
+def test_subject_map_limits_chuyen_subjects(data_file):
+    engine = ConversationEngine(recommendation_calculator(data_file), {'toan': 'Toán'})
+    state, turns, _ = talk(engine, ['8', '8', '8', '8', '0', 'Tin học'])
+    assert state['step'] == 'ask_chuyen_subject'
+    assert texts(turns[-1]) == ["Không nhận diện được môn chuyên. Vui lòng gõ lại tên môn hoặc gõ 'Không'."]
+
+def test_failed_calculation_keeps_no_results():
+    engine = ConversationEngine(lambda scores: (None, "Lỗi: Không tìm thấy file dữ liệu."))
+    state, turns, results = talk(engine, ['8', '8', '8', '8', '0', 'ko'])
+    assert results is None and state == new_state()
+    assert turns[-1] == [text_message("Lỗi: Không tìm thấy file dữ liệu.")]
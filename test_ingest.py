@@ -0,0 +1,194 @@
+import time
+import numpy as np
+import pandas as pd
+import pytest
+import logic_store
+from fake_gsheets import FakeAPIError, FakeSpreadsheet, sheet_values_from_frame
+from logic_ingest import (FetchTimeout, call_with_retry, process_data_from_sheets, read_year_worksheets,
+                          refresh_from_spreadsheet)
+
+# =============================================================================
+# SHEET NĂM HỌC GIẢ LẬP
+# =============================================================================
+#
+# Bố cục giống sheet thật: dòng trường (có STT), dòng 'Lớp nguồn' ngay sau một số trường,
+# dòng tên trường chuyên (có STT, không có điểm) rồi các dòng môn chuyên (STT trống).
+
+SHEET_YEARS = [f"{y}-{y + 1}" for y in range(2019, 2024)]
+SUBJECTS = ['Ngữ Văn', 'Toán', 'Tiếng Anh', 'Tin học']
+
+def year_sheet(seed, n_schools=30):
+    """Giá trị thô của một sheet năm học."""
+    rng = np.random.default_rng(seed)
+    rows, stt = [], 1
+    for i in range(n_schools):
+        if rng.random() < 0.1:
+            continue
+        rows.append([str(stt), f"THPT Trường {i}", f"{rng.uniform(10, 30):.2f}", '400', ''])
+        stt += 1
+        if i % 7 == 0:
+            rows.append(['', 'Lớp nguồn', f"{rng.uniform(10, 30):.2f}", '35', ''])
+    rows.append([str(stt), 'Trường chuyên Hoàng Lê Kha', '', '', ''])
+    rows += [['', s, f"{rng.uniform(25, 40):.2f}", '35', ''] for s in SUBJECTS]
+    frame = pd.DataFrame(rows, columns=['STT', 'Tên trường', 'Điểm chuẩn', 'Chỉ tiêu', 'Ghi chú'])
+    return sheet_values_from_frame(frame)
+
+def make_spreadsheet(**options):
+    sheets = {f"Năm {year}": year_sheet(seed) for seed, year in enumerate(SHEET_YEARS)}
+    spreadsheet = FakeSpreadsheet(sheets, **options)
+    spreadsheet.add_worksheet('Ghi chú', [['Sheet không chứa năm học']])
+    return spreadsheet
+
+def record_fetches(spreadsheet):
+    """Danh sách (được cập nhật dần) các sheet đã tải bằng values_batch_get."""
+    fetched = []
+    def latency(name, title):
+        if name == 'values_batch_get':
+            fetched.extend(title.split(','))
+        return 0
+    spreadsheet.latency = latency
+    return fetched
+
+def full_rebuild(spreadsheet, path):
+    """Dữ liệu xử lý lại từ đầu (tải mọi sheet) để so sánh với kết quả nạp tăng dần."""
+    process_data_from_sheets(read_year_worksheets(spreadsheet), str(path))
+    return logic_store.load_frame(str(path))
+
+def refresh(spreadsheet, path, **options):
+    spreadsheet.calls.clear()
+    return refresh_from_spreadsheet(spreadsheet, str(path), **options)
+
+# =============================================================================
+# NẠP TĂNG DẦN
+# =============================================================================
+
+def test_first_refresh_loads_every_year_sheet(tmp_path):
+    spreadsheet = make_spreadsheet()
+    fetched = record_fetches(spreadsheet)
+    ok, message = refresh(spreadsheet, tmp_path / 'inc.tnds', sheets_per_request=2)
+    assert ok and f"({len(SHEET_YEARS)} sheet mới/thay đổi)" in message
+
+    assert sorted(fetched) == sorted(f"Năm {year}" for year in SHEET_YEARS)
+    assert spreadsheet.calls == {'worksheets': 1, 'values_batch_get': 3}
+    stored = logic_store.load_frame(str(tmp_path / 'inc.tnds'))
+    assert stored['Năm học'].unique().tolist() == SHEET_YEARS
+    pd.testing.assert_frame_equal(stored, full_rebuild(spreadsheet, tmp_path / 'full.tnds'))
+
+def test_unchanged_spreadsheet_only_lists_worksheets(tmp_path):
+    spreadsheet = make_spreadsheet()
+    assert refresh(spreadsheet, tmp_path / 'inc.tnds')[0]
+    ok, message = refresh(spreadsheet, tmp_path / 'inc.tnds')
+    assert (ok, message) == (True, "Dữ liệu Google Sheet không thay đổi và sẵn sàng tư vấn.")
+    assert spreadsheet.calls == {'worksheets': 1}
+
+def test_edited_old_sheet_is_fetched_with_latest_only(tmp_path):
+    # Không đọc được thời điểm sửa đổi: chỉ sheet đổi kích thước và sheet năm gần nhất được tải lại
+    spreadsheet = make_spreadsheet(track_modified_time=False)
+    fetched = record_fetches(spreadsheet)
+    assert refresh(spreadsheet, tmp_path / 'inc.tnds')[0]
+
+    edited = year_sheet(seed=99, n_schools=40)
+    assert len(edited) != len(spreadsheet.worksheet('Năm 2020-2021').values)
+    spreadsheet.set_values('Năm 2020-2021', edited)
+    fetched.clear()
+    ok, message = refresh(spreadsheet, tmp_path / 'inc.tnds')
+    assert ok and "(1 sheet mới/thay đổi)" in message
+    assert sorted(fetched) == ['Năm 2020-2021', 'Năm 2023-2024']
+
+    stored = logic_store.load_frame(str(tmp_path / 'inc.tnds'))
+    pd.testing.assert_frame_equal(stored, full_rebuild(spreadsheet, tmp_path / 'full.tnds'))
+
+def test_in_place_edit_reprocesses_only_the_edited_sheet(tmp_path):
+    # Sửa giá trị mà không đổi kích thước: thời điểm sửa đổi thay đổi nên mọi sheet được kiểm tra
+    # nội dung, nhưng chỉ sheet có nội dung khác được xử lý lại
+    spreadsheet = make_spreadsheet()
+    assert refresh(spreadsheet, tmp_path / 'inc.tnds')[0]
+
+    values = [list(row) for row in spreadsheet.worksheet('Năm 2020-2021').values]
+    values[6][2] = '29.99'
+    spreadsheet.set_values('Năm 2020-2021', values)
+    ok, message = refresh(spreadsheet, tmp_path / 'inc.tnds')
+    assert ok and "(1 sheet mới/thay đổi)" in message
+
+    stored = logic_store.load_frame(str(tmp_path / 'inc.tnds'))
+    assert 29.99 in stored.loc[stored['Năm học'] == '2020-2021', 'Điểm chuẩn'].tolist()
+    pd.testing.assert_frame_equal(stored, full_rebuild(spreadsheet, tmp_path / 'full.tnds'))
+
+@pytest.mark.parametrize('title', ['Năm 2020-2021', 'Năm 2023-2024'])
+def test_deleted_sheet_drops_its_year(title, tmp_path):
+    spreadsheet = make_spreadsheet()
+    assert refresh(spreadsheet, tmp_path / 'inc.tnds')[0]
+
+    spreadsheet.del_worksheet(title)
+    ok, message = refresh(spreadsheet, tmp_path / 'inc.tnds')
+    assert ok, message
+
+    stored = logic_store.load_frame(str(tmp_path / 'inc.tnds'))
+    assert stored['Năm học'].unique().tolist() == [y for y in SHEET_YEARS if y not in title]
+    pd.testing.assert_frame_equal(stored, full_rebuild(spreadsheet, tmp_path / 'full.tnds'))
+
+# =============================================================================
+# THỬ LẠI, THỜI HẠN VÀ TẢI SONG SONG
+# =============================================================================
+
+def slow_fetches(seconds):
+    """Độ trễ giả lập chỉ cho lệnh tải giá trị sheet."""
+    return lambda name, title: seconds if name == 'values_batch_get' else 0
+
+def test_retry_after_header_is_honoured():
+    spreadsheet = make_spreadsheet(error_plan=[(429, {'Retry-After': '0.3'})])
+    start = time.monotonic()
+    assert len(call_with_retry(spreadsheet.worksheets, base_delay=0.001)) == len(SHEET_YEARS) + 1
+    assert time.monotonic() - start >= 0.3
+    assert spreadsheet.calls == {'worksheets': 2} and spreadsheet.errors == {429: 1}
+
+def test_retry_after_past_deadline_times_out_without_waiting():
+    spreadsheet = make_spreadsheet(error_plan=[(503, {'Retry-After': '30'})])
+    start = time.monotonic()
+    with pytest.raises(FetchTimeout):
+        call_with_retry(spreadsheet.worksheets, deadline=start + 1.0)
+    assert time.monotonic() - start < 0.5
+    assert spreadsheet.calls == {'worksheets': 1}
+
+@pytest.mark.parametrize('status', [400, 403, 404])
+def test_non_retryable_error_is_raised_immediately(status, tmp_path):
+    spreadsheet = make_spreadsheet(error_plan=[None, status])
+    with pytest.raises(FakeAPIError) as error:
+        refresh(spreadsheet, tmp_path / 'inc.tnds', sheets_per_request=len(SHEET_YEARS))
+    assert error.value.code == status
+    assert spreadsheet.calls == {'worksheets': 1, 'values_batch_get': 1}
+    assert not (tmp_path / 'inc.tnds').exists()
+
+@pytest.mark.parametrize('options', [dict(latency=slow_fetches(1.0)), dict(error_rate=1.0, error_status=503)])
+def test_deadline_falls_back_to_stored_file(options, tmp_path):
+    spreadsheet = make_spreadsheet()
+    output = tmp_path / 'inc.tnds'
+    assert refresh(spreadsheet, output)[0]
+    stored = output.read_bytes()
+
+    spreadsheet.set_values('Năm 2023-2024', year_sheet(seed=99))
+    for name, value in options.items():
+        setattr(spreadsheet, name, value)
+    start = time.monotonic()
+    ok, message = refresh(spreadsheet, output, timeout=0.3)
+    assert time.monotonic() - start < 0.9
+    assert (ok, message) == (True, "Không tải kịp dữ liệu mới từ Google Sheet, đang dùng dữ liệu đã lưu lần trước.")
+    assert output.read_bytes() == stored
+
+def test_deadline_without_stored_file_fails(tmp_path):
+    spreadsheet = make_spreadsheet(latency=slow_fetches(1.0))
+    ok, message = refresh(spreadsheet, tmp_path / 'inc.tnds', timeout=0.3)
+    assert not ok and message.startswith("Lỗi: Không tải được dữ liệu từ Google Sheet trong thời hạn cho phép")
+    assert not (tmp_path / 'inc.tnds').exists()
+
+def test_concurrent_fetch_beats_serial_fetch(tmp_path):
+    elapsed = {}
+    for max_workers in (1, len(SHEET_YEARS)):
+        spreadsheet = make_spreadsheet(latency=slow_fetches(0.1))
+        start = time.monotonic()
+        assert refresh(spreadsheet, tmp_path / f"inc_{max_workers}.tnds", max_workers=max_workers, sheets_per_request=1)[0]
+        elapsed[max_workers] = time.monotonic() - start
+        assert spreadsheet.calls['values_batch_get'] == len(SHEET_YEARS)
+    assert elapsed[len(SHEET_YEARS)] < elapsed[1] / 2
+    pd.testing.assert_frame_equal(logic_store.load_frame(str(tmp_path / 'inc_1.tnds')),
+                                  logic_store.load_frame(str(tmp_path / f"inc_{len(SHEET_YEARS)}.tnds")))
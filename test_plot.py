@@ -0,0 +1,31 @@
+import logic_core as logic
+import logic_plot
+from logic_plot import get_trend_plot, render_trend_png
+
+# =============================================================================
+# BIỂU ĐỒ XU HƯỚNG
+# =============================================================================
+
+ENTITIES = ['THPT Trường 5', 'Trường chuyên Hoàng Lê Kha - Toán', 'THPT Trường 1']
+
+def test_plot_key_keeps_caller_order(data_file):
+    index = logic.get_admission_index(data_file)
+    key = logic_plot._plot_key(index, ENTITIES + ['Không có trường này', ENTITIES[0]])
+    assert key == (tuple(ENTITIES), index.version)
+    assert logic_plot._plot_key(index, ['Không có trường này']) is None
+
+def test_legend_follows_caller_order(data_file):
+    index = logic.get_admission_index(data_file)
+    reordered = ENTITIES[::-1]
+    for entities in (ENTITIES, reordered):
+        found, values = index.entity_scores(entities)
+        assert found == entities
+        # Ảnh (kể cả thứ tự chú thích) giống hệt vẽ trực tiếp theo đúng thứ tự yêu cầu
+        assert get_trend_plot(data_file, entities) == render_trend_png(list(index.all_years), found, values)
+    assert get_trend_plot(data_file, ENTITIES) != get_trend_plot(data_file, reordered)
+
+def test_same_order_is_served_from_cache(data_file):
+    get_trend_plot(data_file, ENTITIES)
+    hits = logic_plot._PLOT_CACHE.hits
+    get_trend_plot(data_file, ENTITIES + [ENTITIES[1]])
+    assert logic_plot._PLOT_CACHE.hits == hits + 1
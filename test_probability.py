@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+import logic_core as logic
+from logic_probability import CutoffForecast, admission_probabilities, get_admission_probabilities
+
+# =============================================================================
+# XÁC SUẤT ĐẬU (MÔ PHỎNG MONTE CARLO)
+# =============================================================================
+#
+# So sánh với cách tính trực tiếp cho từng 'Đối tượng': rút lại đúng các mẫu (cùng hạt giống) rồi
+# lấy tỉ lệ (mẫu <= điểm xét) của cột của đối tượng đó.
+
+SEED = 11
+N_SAMPLES = 500
+
+@pytest.fixture(scope='module')
+def index(data_file):
+    return logic.AdmissionIndex.from_file(data_file)
+
+@pytest.fixture(scope='module')
+def forecast(index):
+    return CutoffForecast(index, n_samples=N_SAMPLES, seed=SEED)
+
+@pytest.fixture(scope='module')
+def samples(forecast):
+    """Mẫu điểm chuẩn (số mẫu x Đối tượng) rút trực tiếp như CutoffForecast."""
+    rng = np.random.default_rng(SEED)
+    drawn = forecast.mean + forecast.spread * rng.standard_normal((N_SAMPLES, len(forecast.mean)))
+    return np.nan_to_num(drawn, nan=0.0)
+
+def direct_probability(forecast, samples, position, diem):
+    if np.isnan(forecast.mean[position]):
+        return np.nan
+    return (samples[:, position] <= diem).mean()
+
+def test_forecast_mean_is_per_entity_linear_trend(index, forecast):
+    years = index.dataset.year_starts
+    target = np.nanmax(years) + 1
+    for position, code in enumerate(index.codes):
+        history = index.dataset.scores[code]
+        valid = ~np.isnan(history)
+        if valid.sum() >= 2:
+            expected = np.polyval(np.polyfit(years[valid], history[valid], 1), target)
+        else:
+            expected = history[valid][0]
+        assert forecast.mean[position] == pytest.approx(expected, abs=1e-9)
+        assert forecast.spread[position] > 0
+
+@pytest.mark.parametrize('diem', [0.0, 12.5, 17.25, 20.0, 24.75, 33.3, 38.0, 60.0])
+def test_probabilities_match_direct_count(diem, forecast, samples):
+    positions = np.arange(len(forecast.mean))
+    got = forecast.probabilities(positions, np.full(len(positions), diem))
+    expected = [direct_probability(forecast, samples, p, diem) for p in positions]
+    np.testing.assert_array_equal(got, expected)
+
+def test_probabilities_count_ties_and_mixed_scores(forecast, samples):
+    # Điểm xét đúng bằng một mẫu được tính là đậu (<=); mỗi đối tượng một điểm xét khác nhau
+    rng = np.random.default_rng(0)
+    positions = rng.permutation(len(forecast.mean))[:40]
+    diem = samples[rng.integers(0, N_SAMPLES, len(positions)), positions]
+    got = forecast.probabilities(positions, diem)
+    expected = [direct_probability(forecast, samples, p, d) for p, d in zip(positions, diem)]
+    np.testing.assert_array_equal(got, expected)
+    assert (got >= 1 / N_SAMPLES).all()
+
+@pytest.mark.parametrize('mon_chuyen, diem_chuyen', [(None, None), ('Toán', 34.0), ('Tin học', 29.5)])
+def test_student_probabilities_match_direct_count(mon_chuyen, diem_chuyen, index, forecast, samples, monkeypatch):
+    monkeypatch.setattr('logic_probability.get_forecast', lambda index, n_samples, seed: forecast)
+    positions, probability, _ = admission_probabilities(index, 21.5, diem_chuyen, mon_chuyen)
+    expected_positions = [p for p in range(len(index.entities))
+                          if not index.is_chuyen[p] or index.subject[p] == mon_chuyen]
+    assert positions.tolist() == expected_positions
+    for position, value in zip(positions, probability):
+        diem = diem_chuyen if index.is_chuyen[position] else 21.5
+        assert value == direct_probability(forecast, samples, position, diem)
+
+def test_ranked_probabilities_table(data_file):
+    df, message = get_admission_probabilities(data_file, 7.5, 8.0, 7.0, 8.1, 0.5)
+    assert not df.empty and message.startswith("Xác suất ước tính từ")
+    assert df['Xác suất đậu'].is_monotonic_decreasing
+    assert df['Xác suất đậu'].between(0, 1).all()
+    again, _ = get_admission_probabilities(data_file, 7.5, 8.0, 7.0, 8.1, 0.5)
+    assert df.equals(again)
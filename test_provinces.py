@@ -0,0 +1,92 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+import logic_core as logic
+import logic_store
+from api_server import APIError, APIServer
+from logic_roster import validate_roster_row
+
+# =============================================================================
+# CẤU HÌNH THEO TỈNH
+# =============================================================================
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+@pytest.fixture
+def provinces(monkeypatch):
+    """Bảng tỉnh riêng cho từng bài kiểm tra (chỉ có Tây Ninh, chưa đọc file cấu hình)."""
+    monkeypatch.setattr(logic, 'PROVINCES', {'tay_ninh': logic.PROVINCES['tay_ninh']})
+    monkeypatch.setattr(logic, '_PROVINCES_LOADED', False)
+    return logic.PROVINCES
+
+@pytest.fixture
+def provinces_file(master_frame, tmp_path):
+    data_file = str(tmp_path / 'admission_binh_duong.tnds')
+    logic_store.write_dataset(master_frame, data_file)
+    path = tmp_path / 'provinces.json'
+    path.write_text(json.dumps([{
+        'code': 'binh_duong', 'name': 'Bình Dương', 'data_file': data_file,
+        'chuyen_school': 'Trường chuyên Hoàng Lê Kha', 'subjects': ['Toán', 'Tiếng Anh'],
+        'gsheet_name': 'std_score_BinhDuong_highschools',
+    }], ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+def test_provinces_from_env_file(provinces_file):
+    # TN_PROVINCES_FILE và TN_PROVINCE được đọc khi import logic_core: chạy trong tiến trình mới
+    code = ("import json, logic_core as l; "
+            "print(json.dumps({'codes': [p.code for p in l.list_provinces()], 'default': l.get_province().to_dict()}))")
+    env = dict(os.environ, TN_PROVINCES_FILE=provinces_file, TN_PROVINCE='binh_duong')
+    proc = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, env=env, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    assert result['codes'] == ['tay_ninh', 'binh_duong']
+    assert result['default']['name'] == 'Bình Dương'
+    assert result['default']['subjects'] == ['Toán', 'Tiếng Anh']
+
+    env['TN_PROVINCE'] = 'khong_co'
+    code = "import logic_core as l; l.get_province()"
+    proc = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, env=env, capture_output=True, text=True)
+    assert proc.returncode != 0 and "Không có cấu hình cho tỉnh 'khong_co'" in proc.stderr
+
+def test_loaded_province_serves_its_own_data(provinces, provinces_file):
+    assert logic.load_provinces(provinces_file) == ['binh_duong']
+    province = logic.get_province('binh_duong')
+    assert [p.code for p in logic.list_provinces()] == ['tay_ninh', 'binh_duong']
+    assert logic.province_for_file(province.data_file) is province
+
+    index = logic.get_admission_index(province.data_file)
+    assert index.province is province
+    # Chỉ các môn chuyên của tỉnh được nhận
+    row = dict(diem_van=8, diem_toan=8, diem_anh=8, diem_tb_4nam=8)
+    assert validate_roster_row(dict(row, mon_chuyen='Toán', diem_mon_chuyen=9), province.subject_map)[0]
+    scores, message = validate_roster_row(dict(row, mon_chuyen='Tin học', diem_mon_chuyen=9), province.subject_map)
+    assert scores is None and message == "Không nhận diện được môn chuyên 'Tin học'."
+
+def test_unknown_province_codes(provinces, provinces_file, data_file):
+    logic.load_provinces(provinces_file)
+    with pytest.raises(ValueError, match="Không có cấu hình cho tỉnh 'khong_co'"):
+        logic.get_province('khong_co')
+    # File không thuộc tỉnh nào dùng cấu hình của tỉnh mặc định
+    assert logic.province_for_file(data_file) is logic.get_province()
+
+    server = APIServer(('127.0.0.1', 0), data_file, workers=1)
+    try:
+        assert server.data_file_for('binh_duong') == logic.get_province('binh_duong').data_file
+        assert server.data_file_for(None) == data_file
+        with pytest.raises(APIError) as error:
+            server.data_file_for('khong_co')
+        assert error.value.status == 404
+    finally:
+        server.server_close()
+
+def test_missing_or_invalid_provinces_file(provinces, tmp_path):
+    assert logic.load_provinces(str(tmp_path / 'khong_co.json')) == []
+    assert list(provinces) == ['tay_ninh']
+
+    invalid = tmp_path / 'invalid.json'
+    invalid.write_text(json.dumps([{'code': 'x', 'name': 'X'}]), encoding='utf-8')
+    with pytest.raises(ValueError, match="thiếu các trường"):
+        logic.load_provinces(str(invalid))
+    assert list(provinces) == ['tay_ninh']
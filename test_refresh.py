@@ -0,0 +1,97 @@
+import pytest
+import logic_core as logic
+import logic_store
+from logic_refresh import DataRefresher, validate_index
+
+# =============================================================================
+# LÀM MỚI DỮ LIỆU NỀN
+# =============================================================================
+#
+# Dữ liệu xử lý từ sheet không có điểm trống (validate_index từ chối điểm năm gần nhất bị thiếu).
+
+@pytest.fixture
+def clean_frame(master_frame):
+    return master_frame.dropna(subset=['Điểm chuẩn']).reset_index(drop=True)
+
+@pytest.fixture
+def live_file(clean_frame, tmp_path):
+    path = str(tmp_path / 'admission.tnds')
+    logic_store.write_dataset(clean_frame, path)
+    return path
+
+def writer(frame, result=(True, "Đã làm mới dữ liệu.")):
+    """refresh_func ghi `frame` ra file staging rồi trả về `result`."""
+    def refresh(output_filename):
+        logic_store.write_dataset(frame, output_filename)
+        return result
+    return refresh
+
+def leftover_staging(tmp_path):
+    return sorted(p.name for p in tmp_path.iterdir() if '.staging' in p.name)
+
+def test_refresh_swaps_file_and_index(live_file, clean_frame, tmp_path):
+    before = logic.get_admission_index(live_file)
+    changed = clean_frame.copy()
+    changed['Điểm chuẩn'] += 0.5
+    refresher = DataRefresher(live_file, writer(changed))
+    assert refresher.refresh_now() == (True, "Đã làm mới dữ liệu.")
+
+    after = logic.get_admission_index(live_file)
+    assert after is not before and after.version != before.version
+    assert after.version == logic.AdmissionIndex.from_file(live_file).version
+    assert leftover_staging(tmp_path) == []
+    assert refresher.status()['last_error'] is None
+
+def few_schools(frame):
+    return frame[frame['Đối tượng'].isin(frame['Đối tượng'].unique()[:10])]
+
+def without_latest_year(frame):
+    return frame[frame['Năm học'] != frame['Năm học'].max()]
+
+def missing_latest_cutoff(frame):
+    frame = frame.copy()
+    frame.loc[frame.index[-1], 'Điểm chuẩn'] = float('nan')
+    return frame
+
+@pytest.mark.parametrize('transform, reason', [
+    (few_schools, "Số trường ở năm gần nhất giảm bất thường"),
+    (without_latest_year, "Năm học gần nhất bị lùi"),
+    (missing_latest_cutoff, "điểm chuẩn năm gần nhất bị thiếu hoặc âm"),
+])
+def test_invalid_data_keeps_live_file_and_index(transform, reason, live_file, clean_frame, tmp_path):
+    index = logic.get_admission_index(live_file)
+    stored = open(live_file, 'rb').read()
+    new_frame = transform(clean_frame)
+    assert reason in validate_index(logic.AdmissionIndex(new_frame), index)
+
+    refresher = DataRefresher(live_file, writer(new_frame))
+    ok, message = refresher.refresh_now()
+    assert not ok and message.startswith("Dữ liệu mới không hợp lệ, giữ nguyên dữ liệu cũ.") and reason in message
+    assert open(live_file, 'rb').read() == stored
+    assert logic.get_admission_index(live_file) is index
+    assert leftover_staging(tmp_path) == []
+    assert refresher.status()['last_error'] == message
+
+def test_failed_or_crashed_refresh_keeps_live_data(live_file, clean_frame, tmp_path):
+    index = logic.get_admission_index(live_file)
+    stored = open(live_file, 'rb').read()
+
+    failed = DataRefresher(live_file, writer(clean_frame.head(3), result=(False, "Lỗi: Google Sheet không phản hồi.")))
+    assert failed.refresh_now() == (False, "Lỗi: Google Sheet không phản hồi.")
+
+    def crash(output_filename):
+        raise RuntimeError("mất kết nối")
+    ok, message = DataRefresher(live_file, crash).refresh_now()
+    assert not ok and message == "Lỗi không xác định khi làm mới dữ liệu: mất kết nối"
+
+    assert open(live_file, 'rb').read() == stored
+    assert logic.get_admission_index(live_file) is index
+    assert leftover_staging(tmp_path) == []
+
+def test_custom_validator_can_reject(live_file, clean_frame):
+    index = logic.get_admission_index(live_file)
+    changed = clean_frame.copy()
+    changed['Điểm chuẩn'] += 1.0
+    refresher = DataRefresher(live_file, writer(changed), validate=lambda new, old: "Điểm tăng quá nhiều.")
+    assert refresher.refresh_now() == (False, "Dữ liệu mới không hợp lệ, giữ nguyên dữ liệu cũ. Điểm tăng quá nhiều.")
+    assert logic.get_admission_index(live_file) is index
@@ -0,0 +1,79 @@
+import openpyxl
+import pandas as pd
+import pytest
+import logic_roster
+from logic_roster import process_roster
+
+# =============================================================================
+# XỬ LÝ HÀNG LOẠT DANH SÁCH HỌC SINH
+# =============================================================================
+
+ROSTER_CSV = (
+    "Họ tên,Tên trường,Văn,Toán,Anh,TB 4 năm\n"
+    "Nguyễn Văn A,THCS Thị trấn,7.5,8,7,8.1\n"
+    "Trần Thị B,THCS Long Hoa,0.5,8,7,8.1\n"
+    "Lê Văn C,THCS Hòa Thành,9,9.5,9.25,9.4\n"
+)
+
+def write_roster(tmp_path, text=ROSTER_CSV, name='roster.csv'):
+    path = tmp_path / name
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+def test_roster_columns_named_like_results_are_kept(data_file, tmp_path):
+    output = str(tmp_path / 'ket_qua.csv')
+    ok, message = process_roster(data_file, write_roster(tmp_path), output)
+    assert ok, message
+
+    results = pd.read_csv(output, encoding='utf-8-sig')
+    assert list(results.columns[:4]) == ['Dòng', 'Họ tên', 'Học sinh - Tên trường', 'Nhóm']
+    assert set(results['Học sinh - Tên trường']) == {'THCS Thị trấn', 'THCS Hòa Thành'}
+    assert results['Tên trường'].str.startswith('THPT').all()
+
+    errors = pd.read_csv(str(tmp_path / 'ket_qua_loi.csv'), encoding='utf-8-sig')
+    assert errors[['Dòng', 'Họ tên', 'Học sinh - Tên trường']].values.tolist() == [[3, 'Trần Thị B', 'THCS Long Hoa']]
+
+def test_roster_excel_output(data_file, tmp_path):
+    output = str(tmp_path / 'ket_qua.xlsx')
+    ok, message = process_roster(data_file, write_roster(tmp_path), output)
+    assert ok, message
+    workbook = openpyxl.load_workbook(output, read_only=True)
+    assert workbook.sheetnames == [logic_roster.RECOMMENDATION_SHEET, logic_roster.ERROR_SHEET]
+    header = next(workbook[logic_roster.RECOMMENDATION_SHEET].iter_rows(values_only=True))
+    assert 'Học sinh - Tên trường' in header and 'Tên trường' in header
+    workbook.close()
+
+def test_roster_missing_column_leaves_no_output(data_file, tmp_path):
+    output = str(tmp_path / 'ket_qua.csv')
+    roster = write_roster(tmp_path, "Họ tên,Văn,Toán,Anh\nA,7,8,9\n")
+    assert process_roster(data_file, roster, output) == (False, "Lỗi: File danh sách thiếu cột điểm: TB 4 năm.")
+    assert not any(tmp_path.glob('ket_qua*'))
+
+def test_roster_read_error_discards_partial_output(data_file, tmp_path):
+    # Các khối đầu (vài trăm KB) đã được ghi trước khi gặp dòng không giải mã được ở cuối file
+    good = ROSTER_CSV.encode('utf-8') + "Phạm D,THCS X,8,8,8,8\n".encode('utf-8') * 15000
+    roster = tmp_path / 'roster.csv'
+    roster.write_bytes(good + b"\xff\xfe,\xff,8,8,8,8\n")
+    output = str(tmp_path / 'ket_qua.csv')
+    written = []
+    ok, message = process_roster(data_file, str(roster), output, chunk_size=5000,
+                                 on_progress=lambda processed, failed: written.append(processed))
+    assert written, "lỗi phải xảy ra sau khi đã ghi ít nhất một khối"
+    assert not ok and message.startswith("Lỗi khi đọc file danh sách")
+    assert not any(tmp_path.glob('ket_qua*'))
+
+def test_roster_corrupt_excel_is_a_read_error(data_file, tmp_path):
+    roster = tmp_path / 'roster.xlsx'
+    roster.write_bytes(b"not a workbook")
+    ok, message = process_roster(data_file, str(roster), str(tmp_path / 'ket_qua.xlsx'))
+    assert not ok and message.startswith("Lỗi khi đọc file danh sách")
+    assert not (tmp_path / 'ket_qua.xlsx').exists()
+
+def test_roster_scoring_errors_are_not_read_errors(data_file, tmp_path, monkeypatch):
+    def broken(data_file, chunk):
+        raise ValueError("lỗi tính đề xuất")
+    monkeypatch.setattr(logic_roster, 'score_roster_chunk', broken)
+    output = str(tmp_path / 'ket_qua.csv')
+    with pytest.raises(ValueError, match="lỗi tính đề xuất"):
+        process_roster(data_file, write_roster(tmp_path), output)
+    assert not any(tmp_path.glob('ket_qua*'))
@@ -0,0 +1,17 @@
+import startup_report
+
+# =============================================================================
+# BÁO CÁO THỜI GIAN KHỞI ĐỘNG
+# =============================================================================
+
+def test_first_message_covers_app_imports():
+    # Mọi module app.py import khi khởi động phải được tính vào thời gian tới câu hỏi đầu tiên
+    imports = startup_report.app_imports()
+    assert {'streamlit', 'logic_core', 'logic_probability', 'logic_metrics'} <= set(imports)
+    assert set(imports) <= set(startup_report.FIRST_MESSAGE_MODULES)
+
+def test_every_local_module_is_a_part():
+    parts = {module for _, _, module in startup_report.PARTS}
+    preloaded = {name for _, preload, _ in startup_report.PARTS for name in preload}
+    local = {m for m in startup_report.FIRST_MESSAGE_MODULES if m.startswith('logic_')}
+    assert local | preloaded | {'logic_whatif', 'logic_store'} <= parts
@@ -0,0 +1,94 @@
+import re
+import numpy as np
+import pandas as pd
+import pytest
+import logic_core as logic
+import logic_store
+from logic_store import DatasetFormatError, read_columns, read_dataset, write_dataset
+
+# =============================================================================
+# ĐỊNH DẠNG LƯU TRỮ .TNDS
+# =============================================================================
+
+def as_plain(df):
+    """Cột category -> object để so sánh với DataFrame gốc."""
+    return df.astype({c: object for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)})
+
+def _encode_column_v1(name, series):
+    """Cách mã hóa cột của định dạng 1: năm int16 + bảng nhãn, điểm float32 + số chữ số thập phân."""
+    if name in logic_store.FLOAT_COLUMNS:
+        values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64)
+        return {'kind': 'float', 'decimals': 2}, values.astype('<f4')
+    labels = series.astype(object).where(series.notna(), None)
+    if name in logic_store.YEAR_COLUMNS:
+        years = np.array([int(re.match(r'\d{4}', v).group()) for v in labels], dtype='<i2')
+        return {'kind': 'year', 'labels': {str(y): v for y, v in zip(years.tolist(), labels)}}, years
+    codes, categories = pd.factorize(labels)
+    return {'kind': 'category', 'categories': list(categories)}, codes.astype('<i4')
+
+@pytest.fixture
+def v1_file(master_frame, tmp_path, monkeypatch):
+    path = str(tmp_path / 'admission_v1.tnds')
+    with monkeypatch.context() as m:
+        m.setattr(logic_store, 'FORMAT_VERSION', 1)
+        m.setattr(logic_store, '_encode_column', _encode_column_v1)
+        write_dataset(master_frame, path)
+    return path
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_round_trip(mmap, master_frame, data_file):
+    df = read_dataset(data_file, mmap=mmap)
+    assert isinstance(df['Đối tượng'].dtype, pd.CategoricalDtype)
+    assert df['Điểm chuẩn'].dtype == np.float64
+    pd.testing.assert_frame_equal(as_plain(df), master_frame)
+
+    header, arrays = read_columns(data_file, mmap=mmap)
+    assert header['format_version'] == logic_store.FORMAT_VERSION == 2
+    assert isinstance(arrays['Điểm chuẩn'], np.memmap) is mmap
+    # Bảng nhãn năm đã sắp: mã năm là vị trí trong bảng như CompactDataset dùng lúc chạy
+    labels = next(c['labels'] for c in header['columns'] if c['name'] == 'Năm học')
+    assert labels == sorted(master_frame['Năm học'].unique())
+
+def test_round_trip_empty(master_frame, tmp_path):
+    path = str(tmp_path / 'empty.tnds')
+    write_dataset(master_frame.iloc[:0], path)
+    df = read_dataset(path)
+    assert len(df) == 0 and list(df.columns) == list(master_frame.columns)
+
+def test_content_hash_mismatch_is_rejected(data_file, tmp_path):
+    header, _ = read_columns(data_file)
+    offset = next(c['offset'] for c in header['columns'] if c['name'] == 'Điểm chuẩn')
+    raw = bytearray(open(data_file, 'rb').read())
+    raw[offset] ^= 0x01
+    corrupt = tmp_path / 'corrupt.tnds'
+    corrupt.write_bytes(bytes(raw))
+    for mmap in (True, False):
+        with pytest.raises(DatasetFormatError, match="băm nội dung không khớp"):
+            read_dataset(str(corrupt), mmap=mmap)
+    with pytest.raises(DatasetFormatError):
+        logic.AdmissionIndex.from_file(str(corrupt))
+
+def test_unknown_file_or_version_is_rejected(data_file, tmp_path):
+    not_store = tmp_path / 'not_store.tnds'
+    not_store.write_text('Năm học,Điểm chuẩn\n', encoding='utf-8')
+    with pytest.raises(DatasetFormatError, match="không phải file dữ liệu"):
+        read_dataset(str(not_store))
+
+    raw = open(data_file, 'rb').read().replace(b'"format_version": 2', b'"format_version": 9', 1)
+    future = tmp_path / 'future.tnds'
+    future.write_bytes(raw)
+    with pytest.raises(DatasetFormatError, match="Phiên bản định dạng 9"):
+        read_dataset(str(future))
+
+def test_reads_format_1(v1_file, master_frame, data_file):
+    header, arrays = read_columns(v1_file)
+    assert header['format_version'] == 1 and arrays['Điểm chuẩn'].dtype == np.float32
+    # Điểm float32 được làm tròn lại về đúng giá trị gốc
+    pd.testing.assert_frame_equal(as_plain(read_dataset(v1_file)), master_frame)
+
+    old, new = logic.AdmissionIndex.from_file(v1_file), logic.AdmissionIndex.from_file(data_file)
+    assert old.all_years == new.all_years
+    assert list(old.entities) == list(new.entities)
+    np.testing.assert_array_equal(old.last_cutoff, new.last_cutoff)
+    np.testing.assert_array_equal(old.slope, new.slope)
+    np.testing.assert_array_equal(old.dataset.scores, new.dataset.scores)
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+import logic_core as logic
+
+# =============================================================================
+# KIỂM TRA CÁC ĐƯỜNG TÍNH VECTOR HÓA SO VỚI CÁCH TÍNH TỪNG DÒNG BAN ĐẦU
+# =============================================================================
+#
+# Dùng bộ dữ liệu tổng hợp và cách tính từng 'Đối tượng' của conftest.py.
+
+def scalar_top(levels, code, n=5):
+    """n trường đầu của nhóm `code` theo điểm chuẩn giảm dần (sắp ổn định)."""
+    group = levels[levels['Độ an toàn (Mã)'] == code]
+    return group.sort_values('Điểm chuẩn năm ngoái', ascending=False, kind='stable').head(n)
+
+STUDENTS = [
+    dict(diem_van=7.5, diem_toan=8.0, diem_anh=7.0, diem_tb_4nam=8.1, diem_uu_tien=0.5),
+    dict(diem_van=5.0, diem_toan=4.25, diem_anh=6.0, diem_tb_4nam=6.5, diem_uu_tien=0),
+    dict(diem_van=9.0, diem_toan=9.5, diem_anh=9.25, diem_tb_4nam=9.4, diem_uu_tien=1.0),
+    dict(diem_van=8.0, diem_toan=8.5, diem_anh=7.75, diem_tb_4nam=8.8, diem_uu_tien=0, mon_chuyen='Toán', diem_mon_chuyen=8.0),
+    dict(diem_van=7.0, diem_toan=6.5, diem_anh=8.5, diem_tb_4nam=7.9, diem_uu_tien=0, mon_chuyen='Tiếng Anh', diem_mon_chuyen=6.0),
+    dict(diem_van=6.0, diem_toan=7.0, diem_anh=6.5, diem_tb_4nam=7.0, diem_uu_tien=0.5, mon_chuyen='Lịch sử', diem_mon_chuyen=9.0),
+]
+
+# =============================================================================
+# CHỈ MỤC VÀ ĐỀ XUẤT
+# =============================================================================
+
+@pytest.mark.parametrize('source', ['frame', 'tnds', 'csv'])
+def test_index_matches_scalar_path(source, master_frame, data_file, reference, tmp_path):
+    if source == 'frame':
+        index = logic.AdmissionIndex(master_frame)
+    elif source == 'tnds':
+        index = logic.AdmissionIndex.from_file(data_file)
+    else:
+        csv_file = str(tmp_path / 'admission.csv')
+        master_frame.to_csv(csv_file, index=False)
+        index = logic.AdmissionIndex.from_file(csv_file)
+
+    assert index.all_years == sorted(master_frame['Năm học'].unique())
+    assert list(index.entities) == list(reference)
+    cutoff, slope, subject = (np.array(values) for values in zip(*reference.values()))
+    np.testing.assert_array_equal(index.last_cutoff, cutoff.astype(float))
+    np.testing.assert_allclose(index.slope, slope.astype(float), rtol=0, atol=1e-9)
+    assert list(index.subject) == list(subject)
+
+    # Ma trận điểm (Đối tượng x Năm học) của bộ dữ liệu gọn khớp bảng xoay của DataFrame
+    pivot = master_frame.pivot(index='Đối tượng', columns='Năm học', values='Điểm chuẩn')
+    pivot = pivot.reindex(index=index.dataset.entity_names, columns=index.all_years)
+    np.testing.assert_array_equal(index.dataset.scores, pivot.to_numpy(dtype=float))
+
+@pytest.mark.parametrize('student', STUDENTS)
+def test_recommendations_match_scalar_path(student, data_file, scalar_levels):
+    recommendations, _ = logic.get_recommendations(data_file, **student)
+    diem_xet_thuong, diem_xet_chuyen = logic.calculate_admission_scores(**student)
+    levels = scalar_levels(diem_xet_thuong, diem_xet_chuyen)
+    for code, group in [(1, 'an_toan_cao'), (2, 'an_toan'), (3, 'nguy_co_giam')]:
+        expected = scalar_top(levels, code)
+        got = recommendations[group]
+        assert got['Tên trường'].tolist() == expected['Tên trường'].tolist()
+        np.testing.assert_array_equal(got['Điểm xét của bạn'], expected['Điểm xét của bạn'])
+        assert (got['Độ an toàn (Mã)'] == code).all()
+
+def test_batch_matches_per_student(data_file):
+    students = pd.DataFrame(STUDENTS * 3, index=[f"HS{i:02d}" for i in range(len(STUDENTS) * 3)])
+    students.loc['HS07', 'diem_toan'] = 10.0
+    students.loc['HS14', 'diem_uu_tien'] = 2.0
+    batch, _ = logic.get_recommendations_batch(data_file, students)
+    for label, student in students.iterrows():
+        student = {k: v for k, v in student.items() if not pd.isna(v)}
+        recommendations, _ = logic.get_recommendations(data_file, **student)
+        rows = batch[batch['Học sinh'] == label]
+        for group, expected in recommendations.items():
+            got = rows[rows['Nhóm'] == group]
+            assert got['Tên trường'].tolist() == expected['Tên trường'].tolist(), (label, group)
+            np.testing.assert_array_equal(got['Điểm xét của bạn'], expected['Điểm xét của bạn'])
+            assert got['Chênh lệch'].tolist() == expected['Chênh lệch'].tolist()
+
+@pytest.mark.parametrize('student', [STUDENTS[0], STUDENTS[3]])
+@pytest.mark.parametrize('offset, limit', [(0, 5), (3, 7), (10, 100), (0, 1000), (200, 5), (0, 0)])
+@pytest.mark.parametrize('include_group_4', [False, True])
+def test_ranked_pages_match_full_sort(student, offset, limit, include_group_4, data_file, scalar_levels):
+    groups, message = logic.get_ranked_recommendations(data_file, **student, offset=offset, limit=limit,
+                                                       include_group_4=include_group_4)
+    levels = scalar_levels(*logic.calculate_admission_scores(**student))
+    codes = [1, 2, 3, 4] if include_group_4 else [1, 2, 3]
+    assert list(groups) == [logic.RANKED_GROUPS[code] for code in codes]
+    for code in codes:
+        ranked = scalar_top(levels, code, n=len(levels))
+        page = groups[logic.RANKED_GROUPS[code]]
+        expected = ranked.iloc[offset:offset + limit]
+        assert page['total'] == len(ranked)
+        assert page['results']['Tên trường'].tolist() == expected['Tên trường'].tolist()
+        assert page['results'].index.tolist() == list(range(offset, offset + len(expected)))
+        assert (page['results']['Độ an toàn (Mã)'] == code).all()
+        # Thông báo nêu đúng khoảng vị trí trả về (trang cuối ngắn hơn, hoặc rỗng khi offset >= total)
+        shown = f"vị trí {offset + 1}-{offset + len(expected)}" if len(expected) else "không còn kết quả"
+        assert f"{logic.RANKED_GROUPS[code]}: {shown} (tổng {len(ranked)})" in message
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+import logic_core as logic
+from logic_whatif import SWEEP_SUBJECTS, what_if_sweep
+
+# =============================================================================
+# PHÂN TÍCH "NẾU... THÌ" SO VỚI CÁCH TÍNH TỪNG ĐIỂM LƯỚI
+# =============================================================================
+
+REGULAR = dict(diem_van=7.5, diem_toan=8.0, diem_anh=7.0, diem_tb_4nam=8.1, diem_uu_tien=0.5)
+CHUYEN = dict(diem_van=8.0, diem_toan=8.5, diem_anh=7.75, diem_tb_4nam=8.8, diem_uu_tien=0,
+              mon_chuyen='Toán', diem_mon_chuyen=8.0)
+SWEEPS = [
+    (REGULAR, {'diem_toan': [-1, -0.5, 0.5, 1.0, 2.5], 'diem_van': [-0.25, 0.75]}),
+    (CHUYEN, {'diem_toan': [-0.5, 0.25, 1.0], 'diem_mon_chuyen': [-1, 0.5, 1.5, 3.0], 'diem_tb_4nam': [0.5]}),
+]
+
+def adjusted_scores(student, changes):
+    """Điểm xét sau khi cộng `changes` ({môn: mức}) vào bộ điểm gốc, giới hạn trong 0-10 như what_if_sweep."""
+    scores = dict(student)
+    for subject, delta in changes.items():
+        scores[subject] = min(10.0, max(0.0, scores[subject] + delta))
+    return logic.calculate_admission_scores(**scores)
+
+@pytest.mark.parametrize('student, deltas', SWEEPS)
+def test_what_if_counts_match_scalar_path(student, deltas, data_file, scalar_levels):
+    result, _ = what_if_sweep(data_file, **student, deltas=deltas)
+    for _, point in result['grid'].iterrows():
+        changes = {s: point[f"Thay đổi {label}"] for s, label in SWEEP_SUBJECTS.items() if s in deltas}
+        diem_xet_thuong, diem_xet_chuyen = adjusted_scores(student, changes)
+        counts = scalar_levels(diem_xet_thuong, diem_xet_chuyen)['Độ an toàn (Mã)'].value_counts()
+        assert point['Điểm xét thường'] == diem_xet_thuong
+        for code, group in logic.RANKED_GROUPS.items():
+            assert point[group] == counts.get(code, 0), (dict(point), code)
+
+@pytest.mark.parametrize('student, deltas', SWEEPS)
+def test_what_if_thresholds_are_exact(student, deltas, data_file, scalar_levels):
+    result, _ = what_if_sweep(data_file, **student, deltas=deltas)
+    base = scalar_levels(*adjusted_scores(student, {})).set_index('Tên trường')['Độ an toàn (Mã)']
+    thresholds = result['thresholds'].set_index('Tên trường')
+    assert (thresholds['Độ an toàn hiện tại'] == base[thresholds.index]).all()
+    for subject in deltas:
+        column = thresholds[f"Thay đổi {SWEEP_SUBJECTS[subject]}"].dropna()
+        for entity, change in column.items():
+            # Vượt qua mức báo cáo một chút thì độ an toàn đổi, chưa tới thì chưa đổi
+            # (điểm xét gốc và điểm xét mới đều làm tròn 2 chữ số: lệch tối đa 0.01 / hệ số, 0.033 với TB 4 năm)
+            step = np.sign(change) * 0.04
+            after = scalar_levels(*adjusted_scores(student, {subject: change + step})).set_index('Tên trường')
+            assert after.loc[entity, 'Độ an toàn (Mã)'] == thresholds.loc[entity, 'Độ an toàn mới'], (subject, entity)
+            if abs(change) > 0.04:
+                before = scalar_levels(*adjusted_scores(student, {subject: change - step})).set_index('Tên trường')
+                assert before.loc[entity, 'Độ an toàn (Mã)'] == base[entity], (subject, entity)
+
+def test_what_if_rejects_invalid_deltas(data_file):
+    assert what_if_sweep(data_file, **REGULAR, deltas={'diem_hoa': [1]}) == ({}, "Không thay đổi được các môn "
+        "['diem_hoa']; chỉ nhận ['diem_van', 'diem_toan', 'diem_anh', 'diem_tb_4nam', 'diem_mon_chuyen'].")
+    assert what_if_sweep(data_file, **REGULAR, deltas={'diem_mon_chuyen': [1]})[0] == {}
+    assert what_if_sweep(data_file, **REGULAR, deltas={'diem_toan': ['x']})[0] == {}
+    assert what_if_sweep(data_file, **REGULAR, deltas={'diem_toan': list(range(200)), 'diem_van': list(range(200))})[0] == {}